@@ -8,11 +8,17 @@ class TriggerMode:
     HARDWARE = 'Hardware Trigger'
     CONTINUOUS = 'Continuous Acqusition'
 
+class QueuePolicy:
+    DROP_OLDEST = 'Drop Oldest'
+    DROP_NEWEST = 'Drop Newest'
+    BLOCK = 'Block'
+
 class Acquisition:
     CROP_WIDTH = 3000
     CROP_HEIGHT = 3000
     NUMBER_OF_FOVS_PER_AF = 3
     IMAGE_FORMAT = 'bmp'
+    RECORDING_FORMAT = 'bmp' # continuous recording (ImageSaver): an image format supported by cv2, or RECORDING.FORMAT_CHUNKED
     IMAGE_DISPLAY_SCALING_FACTOR = 0.25
     DX = 0
     DY = 0
@@ -25,6 +31,11 @@ class MicrocontrollerDef:
     MSG_LENGTH = 24
     CMD_LENGTH = 8
     N_BYTES_POS = 4
+    MSG_FORMAT = '>BBiiiiB4xB' # command id, execution status, x, y, z, theta, buttons and switches, reserved, CRC
+    READ_TIMEOUT_S = 0.1 # the reader thread wakes up at least this often to check whether it should stop
+    PACKET_INTERVAL_S = 0.01
+    BATCH_DECODE_MIN_PACKETS = 16 # smaller backlogs of status packets are decoded with struct, which is faster than numpy for a few packets
+    COMMAND_TIMEOUT_S = 30 # a command that has not completed by then fails with a TimeoutError - the movements and homing have no timeout
 
 class CMD_SET:
     MOVE_X = 0
@@ -76,6 +87,74 @@ class CAMERA:
 class VOLUMETRIC_IMAGING:
     NUM_PLANES_PER_VOLUME = 20
 
+class FRAME_POOL:
+    NUM_SLOTS = 8 # max number of frames in flight between the camera callback and the consumers
+
+class DISPLAY:
+    LOD_ENABLED = True # resample frames to the on-screen resolution before they reach the GUI thread
+    DEFAULT_VIEWPORT_SIZE_PX = 1000 # used until the display window has reported its size
+    REFRESH_RATE_HZ = None # live view frames are rendered at most at this rate, None: refresh rate of the screen
+    AUTO_CONTRAST = True # 16 bit frames (MONO12/14/16) are windowed to the 0.1 - 99.9 percentiles for display, otherwise to the full 16 bit range
+    AUTO_CONTRAST_PERCENTILES = (0.1,99.9)
+    GAMMA = 1
+    COMPOSITE_MODE = 'tiled' # multi-channel display: 'tiled' or 'overlay'
+    COMPOSITE_SIZE_PX = 1000 # size of the multi-channel composite
+    CHANNEL_COLORS = {11:(64,64,255),12:(0,255,0),13:(255,0,0),14:(255,200,0)} # RGB per illumination source, others are shown in white
+    TRACK_TRAIL_LENGTH = 500 # number of past centroids drawn as the track
+
+class IMAGE_SAVER:
+    NUM_WRITER_THREADS = 4 # cv2.imwrite releases the GIL, so several writers keep a fast disk busy
+    MAX_QUEUE_BYTES = 512*1024*1024 # frames waiting to be written, beyond this frames are dropped
+    SPILL_BUFFER_BYTES = 2*1024*1024*1024 # RAM that recordings may use to ride out disk stalls, see control/write_governor.py
+    MAX_POOLED_FRAMES_QUEUED = 2 # beyond this, queued frames are copied out of the camera's frame pool so that the camera does not run out of slots
+    GOVERNOR_ENABLED = True
+    GOVERNOR_UPDATE_INTERVAL_S = 1
+    GOVERNOR_SMOOTHING = 0.3 # weight of the newest write bandwidth measurement
+    GOVERNOR_HIGH_WATERMARK = 0.5 # act when the spill buffer is fuller than this ...
+    GOVERNOR_HORIZON_S = 30 # ... or when it is predicted to overflow within this time
+    GOVERNOR_SETTLE_TIME_S = 5 # wait between two adaptations
+    GOVERNOR_TARGET_UTILIZATION = 0.8 # lowered save fps uses this fraction of the measured write bandwidth
+    GOVERNOR_CODECS = ['lz4','none'] # chunked recordings step through these codecs before the save fps is lowered
+
+class MULTIPOINT:
+    SAVE_AS_TIFF_STACK = True # needs tifffile, falls back to one file per image in Acquisition.IMAGE_FORMAT
+    STACK_PER_TIME_POINT = False # False: one stack per FOV (z planes x configurations), True: one stack per time point
+
+class RECORDING:
+    FORMAT_CHUNKED = 'chunked' # frames appended to memory-mapped chunk files with a binary index, see control/frame_container.py
+    CHUNK_SIZE_BYTES = 1024*1024*1024
+    ALIGNMENT_BYTES = 4096
+    INDEX_FLUSH_INTERVAL = 100 # frames
+    CODEC = 'none' # 'none', 'zlib', 'lz4' or 'zstd' (lz4 and zstandard need to be installed), see control/image_codecs.py
+    CODEC_LEVEL = 1
+    BYTE_SHUFFLE = True # compress the high and low bytes of 16 bit frames separately, better ratio at little cost
+
+class IMAGE_CODECS:
+    PNG_COMPRESSION_LEVEL = 1 # 0-9, cv2 defaults to 3 which is too slow for live recording
+    PNG_STRATEGY = 0 # 0: default, 1: filtered, 2: huffman only, 3: RLE
+    TIFF_COMPRESSION = 5 # 1: none, 5: LZW, 32946: deflate
+
+class SOFTWARE_TRIGGER:
+    SPIN_S = 0.0005 # the trigger thread sleeps until this long before a deadline and busy-waits for the rest
+
+class STAGE_TELEMETRY:
+    BUFFER_LENGTH = 6000 # status packets, i.e. the last minute at one packet every 10 ms
+    GUI_UPDATE_RATE_HZ = 20 # maximum rate of the position updates sent to the GUI
+
+class SIMULATION:
+    TIME_SCALE = 1 # simulated seconds per second, > 1 for accelerated tests
+    PACKET_INTERVAL_S = 0.01 # simulated mcu status packet interval
+    COMMAND_LATENCY_S = 0.001 # from sending a command until the mcu executes it
+    ILLUMINATION_LATENCY_S = 0.0002 # switching time of the illumination
+    MAX_VELOCITY_THETA_REV = 1 # rev/s
+    MAX_ACCELERATION_THETA_REV = 10 # rev/s/s
+
+class OFFLOAD:
+    ENABLED = False # run tracking and PDAF phase correlation in worker processes
+    NUM_WORKERS = 2
+    NUM_SLOTS = 8 # shared memory frame slots, i.e. max number of frames being analyzed at a time
+    RESULT_TIMEOUT_S = 5
+
 class CMD_EXECUTION_STATUS:
     COMPLETED_WITHOUT_ERRORS = 0
     IN_PROGRESS = 1
@@ -135,6 +214,17 @@ MICROSTEPPING_DEFAULT_Y = 8
 MICROSTEPPING_DEFAULT_Z = 8
 MICROSTEPPING_DEFAULT_THETA = 8
 
+# stage dynamics as configured in the firmware, used by the simulation
+MAX_VELOCITY_X_MM = 20
+MAX_VELOCITY_Y_MM = 20
+MAX_VELOCITY_Z_MM = 2
+MAX_ACCELERATION_X_MM = 200
+MAX_ACCELERATION_Y_MM = 200
+MAX_ACCELERATION_Z_MM = 20
+HOMING_VELOCITY_X = 0.5 # fraction of the max velocity
+HOMING_VELOCITY_Y = 0.5
+HOMING_VELOCITY_Z = 0.5
+
 SCAN_STABILIZATION_TIME_MS_X = 160
 SCAN_STABILIZATION_TIME_MS_Y = 160
 SCAN_STABILIZATION_TIME_MS_Z = 20
@@ -151,6 +241,14 @@ LED_MATRIX_B_FACTOR = 1
 
 DEFAULT_SAVING_PATH = str(Path.home()) + "/Downloads"
 
+class METRICS:
+    DUMP_ENABLED = False # periodically write all metrics to DUMP_PATH
+    DUMP_PATH = DEFAULT_SAVING_PATH + "/octopi_metrics.json"
+    DUMP_FORMAT = 'json' # 'json', 'csv' or 'prometheus'
+    DUMP_INTERVAL_S = 10
+    PREFIX = 'octopi_' # prefix of metric names in the prometheus text file
+    LATENCY_BUCKETS_S = [0.0001,0.0005,0.001,0.002,0.005,0.01,0.02,0.05,0.1,0.2,0.5,1,2,5]
+
 class PLATE_READER:
     NUMBER_OF_ROWS = 8
     NUMBER_OF_COLUMNS = 12
@@ -184,6 +282,7 @@ class AF:
     STOP_THRESHOLD = 0.85
     CROP_WIDTH = 800
     CROP_HEIGHT = 800
+    WAIT_TIMEOUT_S = 300 # wait_till_autofocus_has_completed() raises a TimeoutError after this
 
 class Tracking:
     SEARCH_AREA_RATIO = 10 #@@@ check
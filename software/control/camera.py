@@ -8,6 +8,9 @@ except:
     print('gxipy import error')
 
 from control._def import *
+from control.frame_pool import FramePool
+from control.device_state import DeviceStateCache
+import control.metrics as metrics
 
 class Camera(object):
 
@@ -33,6 +36,12 @@ class Camera(object):
 
         self.image_locked = False
         self.current_frame = None
+        self.frame_pool = FramePool()
+        self.metric_frames_received = metrics.counter('camera_frames_received',camera=str(sn))
+        self.metric_frames_dropped = metrics.counter('frames_dropped',reason='no_free_frame_slot',camera=str(sn))
+        self.metric_callback_duration = metrics.histogram('camera_callback_duration_s',camera=str(sn))
+        # settings the camera already has are not written again
+        self.state_cache = DeviceStateCache('camera_' + str(sn))
 
         self.callback_is_enabled = False
         self.callback_was_enabled_before_autofocus = False
@@ -59,6 +68,7 @@ class Camera(object):
             self.camera = self.device_manager.open_device_by_index(index + 1)
         else:
             self.camera = self.device_manager.open_device_by_sn(self.sn)
+        self.state_cache.invalidate()
         self.is_color = self.camera.PixelColorFilter.is_implemented()
         # self._update_image_improvement_params()
         # self.camera.register_capture_callback(self,self._on_frame_callback)
@@ -89,6 +99,7 @@ class Camera(object):
         if device_num == 0:
             raise RuntimeError('Could not find any USB camera devices!')
         self.camera = self.device_manager.open_device_by_sn(sn)
+        self.state_cache.invalidate()
         self.is_color = self.camera.PixelColorFilter.is_implemented()
         self._update_image_improvement_params()
 
@@ -101,6 +112,7 @@ class Camera(object):
 
     def close(self):
         self.camera.close_device()
+        self.state_cache.invalidate()
         self.device_info_list = None
         self.camera = None
         self.is_color = None
@@ -112,12 +124,18 @@ class Camera(object):
         self.last_numpy_image = None
 
     def set_exposure_time(self,exposure_time):
+        if self.state_cache.is_current('exposure_time',exposure_time):
+            return
         self.exposure_time = exposure_time
         self.camera.ExposureTime.set(exposure_time * 1000)
+        self.state_cache.set('exposure_time',exposure_time)
 
     def set_analog_gain(self,analog_gain):
+        if self.state_cache.is_current('analog_gain',analog_gain):
+            return
         self.analog_gain = analog_gain
         self.camera.Gain.set(analog_gain)
+        self.state_cache.set('analog_gain',analog_gain)
 
     def get_awb_ratios(self):
         self.camera.BalanceWhiteAuto.set(2)
@@ -150,6 +168,9 @@ class Camera(object):
         self.is_streaming = False
 
     def set_pixel_format(self,format):
+        # changing the pixel format needs a stream restart
+        if self.state_cache.is_current('pixel_format',format):
+            return
         if self.is_streaming == True:
             was_streaming = True
             self.stop_streaming()
@@ -169,6 +190,7 @@ class Camera(object):
                 self.camera.PixelFormat.set(gx.GxPixelFormatEntry.BAYER_RG8)
             if format == 'BAYER_RG12':
                 self.camera.PixelFormat.set(gx.GxPixelFormatEntry.BAYER_RG12)
+            self.state_cache.set('pixel_format',format)
         else:
             print("pixel format is not implemented or not writable")
 
@@ -211,9 +233,6 @@ class Camera(object):
         if raw_image.get_status() != 0:
             print("Got an incomplete frame")
             return
-        if self.image_locked:
-            print('last image is still being processed, a frame is dropped')
-            return
         if self.is_color:
             rgb_image = raw_image.convert("RGB")
             numpy_image = rgb_image.get_numpy_array()
@@ -221,17 +240,32 @@ class Camera(object):
             numpy_image = raw_image.get_numpy_array()
         if numpy_image is None:
             return
-        self.current_frame = numpy_image
+        # put the frame in a pool slot - the converted RGB frame is already a private buffer and is handed over without a copy
+        if self.is_color:
+            lease = self.frame_pool.adopt(numpy_image)
+        else:
+            lease = self.frame_pool.acquire(numpy_image.shape,numpy_image.dtype)
+            if lease is not None:
+                np.copyto(lease.image,numpy_image)
+        self.metric_frames_received.inc()
+        if lease is None:
+            self.metric_frames_dropped.inc()
+            return
+        self.current_frame = lease.image
         self.frame_ID_software = self.frame_ID_software + 1
         self.frame_ID = raw_image.get_frame_id()
         self.timestamp = time.time()
+        t0 = time.perf_counter()
         self.new_image_callback_external(self)
+        self.metric_callback_duration.observe(time.perf_counter()-t0)
+        # consumers that keep the frame have retained the lease
+        lease.release()
 
         # self.frameID = self.frameID + 1
         # print(self.frameID)
     
     def set_ROI(self,offset_x=None,offset_y=None,width=None,height=None):
-        if offset_x is not None:
+        if offset_x is not None and not self.state_cache.is_current('ROI_offset_x',offset_x):
             self.ROI_offset_x = offset_x
             # stop streaming if streaming is on
             if self.is_streaming == True:
@@ -242,13 +276,14 @@ class Camera(object):
             # update the camera setting
             if self.camera.OffsetX.is_implemented() and self.camera.OffsetX.is_writable():
                 self.camera.OffsetX.set(self.ROI_offset_x)
+                self.state_cache.set('ROI_offset_x',self.ROI_offset_x)
             else:
                 print("OffsetX is not implemented or not writable")
             # restart streaming if it was previously on
             if was_streaming == True:
                 self.start_streaming()
 
-        if offset_y is not None:
+        if offset_y is not None and not self.state_cache.is_current('ROI_offset_y',offset_y):
             self.ROI_offset_y = offset_y
                 # stop streaming if streaming is on
             if self.is_streaming == True:
@@ -259,13 +294,14 @@ class Camera(object):
             # update the camera setting
             if self.camera.OffsetY.is_implemented() and self.camera.OffsetY.is_writable():
                 self.camera.OffsetY.set(self.ROI_offset_y)
+                self.state_cache.set('ROI_offset_y',self.ROI_offset_y)
             else:
                 print("OffsetX is not implemented or not writable")
             # restart streaming if it was previously on
             if was_streaming == True:
                 self.start_streaming()
 
-        if width is not None:
+        if width is not None and not self.state_cache.is_current('ROI_width',width):
             self.ROI_width = width
             # stop streaming if streaming is on
             if self.is_streaming == True:
@@ -276,6 +312,7 @@ class Camera(object):
             # update the camera setting
             if self.camera.Width.is_implemented() and self.camera.Width.is_writable():
                 self.camera.Width.set(self.ROI_width)
+                self.state_cache.set('ROI_width',self.ROI_width)
             else:
                 print("OffsetX is not implemented or not writable")
             # restart streaming if it was previously on
@@ -283,7 +320,7 @@ class Camera(object):
                 self.start_streaming()
 
 
-        if height is not None:
+        if height is not None and not self.state_cache.is_current('ROI_height',height):
             self.ROI_height = height
             # stop streaming if streaming is on
             if self.is_streaming == True:
@@ -294,6 +331,7 @@ class Camera(object):
             # update the camera setting
             if self.camera.Height.is_implemented() and self.camera.Height.is_writable():
                 self.camera.Height.set(self.ROI_height)
+                self.state_cache.set('ROI_height',self.ROI_height)
             else:
                 print("Height is not implemented or not writable")
             # restart streaming if it was previously on
@@ -345,6 +383,11 @@ class Camera_Simulation(object):
 
         self.image_locked = False
         self.current_frame = None
+        self.frame_pool = FramePool()
+        self.metric_frames_received = metrics.counter('camera_frames_received',camera=str(sn))
+        self.metric_frames_dropped = metrics.counter('frames_dropped',reason='no_free_frame_slot',camera=str(sn))
+        self.metric_callback_duration = metrics.histogram('camera_callback_duration_s',camera=str(sn))
+        self.state_cache = DeviceStateCache('camera_' + str(sn))
 
         self.callback_is_enabled = False
         self.callback_was_enabled_before_autofocus = False
@@ -375,10 +418,16 @@ class Camera_Simulation(object):
         pass
 
     def set_exposure_time(self,exposure_time):
-        pass
+        if self.state_cache.is_current('exposure_time',exposure_time):
+            return
+        self.exposure_time = exposure_time
+        self.state_cache.set('exposure_time',exposure_time)
 
     def set_analog_gain(self,analog_gain):
-        pass
+        if self.state_cache.is_current('analog_gain',analog_gain):
+            return
+        self.analog_gain = analog_gain
+        self.state_cache.set('analog_gain',analog_gain)
 
     def get_awb_ratios(self):
         pass
@@ -415,7 +464,17 @@ class Camera_Simulation(object):
             pass 
             # self.current_frame = np.random.randint(255,size=(768,1024),dtype=np.uint8)
         if self.new_image_callback_external is not None and self.callback_is_enabled:
+            # np.roll returns a new array for every frame, so it is handed over to the pool without a copy
+            lease = self.frame_pool.adopt(self.current_frame)
+            self.metric_frames_received.inc()
+            if lease is None:
+                self.metric_frames_dropped.inc()
+                return
+            self.current_frame = lease.image
+            t0 = time.perf_counter()
             self.new_image_callback_external(self)
+            self.metric_callback_duration.observe(time.perf_counter()-t0)
+            lease.release()
 
     def read_frame(self):
         return self.current_frame
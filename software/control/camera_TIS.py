@@ -33,6 +33,7 @@ class Camera(object):
         self.image_locked = False
         self.is_streaming = False
         self.is_color = color
+        self.exposure_time = 0
 
         self.GAIN_MAX = 480
         self.GAIN_MIN = 0
@@ -92,6 +93,7 @@ class Camera(object):
         self.stop_streaming()
 
     def set_exposure_time(self,exposure_time):
+        self.exposure_time = exposure_time
         self._set_property('Exposure Auto',False)
         self._set_property('Exposure Time (us)',int(exposure_time*1000))
 
@@ -212,6 +214,7 @@ class Camera_Simulation(object):
         self.image_locked = False
         self.is_streaming = False
         self.is_color = color
+        self.exposure_time = 0
 
         self.GAIN_MAX = 480
         self.GAIN_MIN = 0
@@ -242,7 +245,7 @@ class Camera_Simulation(object):
         pass
 
     def set_exposure_time(self,exposure_time):
-        pass
+        self.exposure_time = exposure_time
 
     def set_analog_gain(self,analog_gain):
         pass
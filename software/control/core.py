@@ -11,14 +11,26 @@ from qtpy.QtGui import *
 import control.utils as utils
 from control._def import *
 import control.tracking as tracking
-
-from queue import Queue
-from threading import Thread, Lock
+import control.frame_pool as frame_pool
+import control.metrics as metrics
+import control.offload as offload
+from control.processing_graph import FrameProcessingGraph
+from control.utils_queue import ByteBoundedQueue, Mailbox
+from control.frame_container import ChunkedFrameWriter
+from control.write_governor import WriteRateGovernor
+from control.software_trigger import SoftwareTriggerGenerator
+from control.stage_telemetry import monotonic_from_wall_time, get_mm_per_ustep
+import control.image_codecs as image_codecs
+from control.multipoint_writer import MultiPointImageWriter
+
+from queue import Queue, Full, Empty
+from threading import Thread, Lock, Event
 import time
 import numpy as np
 import pyqtgraph as pg
 import cv2
 from datetime import datetime
+from collections import deque
 
 from lxml import etree as ET
 from pathlib import Path
@@ -30,6 +42,8 @@ import math
 class StreamHandler(QObject):
 
     image_to_display = Signal(np.ndarray)
+    # frames emitted for writing and tracking may be views into the camera's frame pool - 
+    # a reference is retained for every connected receiver, which calls frame_pool.release_frame() when done
     packet_image_to_write = Signal(np.ndarray, int, float)
     packet_image_for_tracking = Signal(np.ndarray, int, float)
     signal_new_frame_received = Signal()
@@ -39,49 +53,81 @@ class StreamHandler(QObject):
         self.fps_display = 1
         self.fps_save = 1
         self.fps_track = 1
-        self.timestamp_last_display = 0
-        self.timestamp_last_save = 0
-        self.timestamp_last_track = 0
 
         self.crop_width = crop_width
         self.crop_height = crop_height
         self.display_resolution_scaling = display_resolution_scaling
+        self.frame_transform = utils.FrameTransform(crop_width,crop_height,ROTATE_IMAGE_ANGLE,FLIP_IMAGE)
 
         self.save_image_flag = False
         self.track_flag = False
         self.handler_busy = False
+        self.is_color = False
 
         # for fps measurement
         self.timestamp_last = 0
         self.counter = 0
         self.fps_real = 0
+        self.metric_fps = metrics.gauge('camera_fps')
+
+        # frame processing - the camera callback only hands the frame to the graph, each stage runs on its own thread
+        # transform (crop, rotate, flip) -> display / save / track, more nodes can be added with add_processing_node()
+        self.processing_graph = FrameProcessingGraph()
+        # never blocks the camera callback - a frame the transform cannot keep up with is dropped and counted
+        self.processing_graph.add_node('transform',self._transform,queue_policy=QueuePolicy.DROP_OLDEST,queue_size=2)
+        self.processing_graph.add_node('display',self._send_to_display,fps=self.fps_display,queue_policy=QueuePolicy.DROP_OLDEST,queue_size=1,parent='transform')
+        self.processing_graph.add_node('save',self._send_to_write,fps=self.fps_save,queue_policy=QueuePolicy.DROP_NEWEST,queue_size=10,parent='transform')
+        self.processing_graph.add_node('track',self._send_to_track,fps=self.fps_track,queue_policy=QueuePolicy.DROP_OLDEST,queue_size=1,parent='transform')
+        self.processing_graph.get_node('save').enabled = False
+        self.processing_graph.get_node('track').enabled = False
 
     def start_recording(self):
         self.save_image_flag = True
+        self.processing_graph.get_node('save').enabled = True
 
     def stop_recording(self):
         self.save_image_flag = False
+        self.processing_graph.get_node('save').enabled = False
 
     def start_tracking(self):
-        self.tracking_flag = True
+        self.track_flag = True
+        self.processing_graph.get_node('track').enabled = True
 
     def stop_tracking(self):
-        self.tracking_flag = False
+        self.track_flag = False
+        self.processing_graph.get_node('track').enabled = False
 
     def set_display_fps(self,fps):
         self.fps_display = fps
+        self.processing_graph.get_node('display').set_fps(fps)
 
     def set_save_fps(self,fps):
         self.fps_save = fps
+        self.processing_graph.get_node('save').set_fps(fps)
 
-    def set_crop(self,crop_width,height):
+    def set_track_fps(self,fps):
+        self.fps_track = fps
+        self.processing_graph.get_node('track').set_fps(fps)
+
+    def set_crop(self,crop_width,crop_height):
         self.crop_width = crop_width
         self.crop_height = crop_height
+        self.frame_transform = utils.FrameTransform(crop_width,crop_height,ROTATE_IMAGE_ANGLE,FLIP_IMAGE)
 
     def set_display_resolution_scaling(self, display_resolution_scaling):
         self.display_resolution_scaling = display_resolution_scaling/100
         print(self.display_resolution_scaling)
 
+    def add_processing_node(self,name,function,fps=None,queue_policy=QueuePolicy.DROP_OLDEST,queue_size=1,parent='transform'):
+        # function(image,frame_ID,timestamp) runs on the node's own thread; return an image to feed child nodes, or None
+        return self.processing_graph.add_node(name,function,fps,queue_policy,queue_size,parent)
+
+    def remove_processing_node(self,name):
+        self.processing_graph.remove_node(name)
+
+    def get_processing_stats(self):
+        return self.processing_graph.get_stats()
+
     def on_new_frame(self, camera):
 
         camera.image_locked = True
@@ -96,37 +142,40 @@ class StreamHandler(QObject):
             self.timestamp_last = timestamp_now
             self.fps_real = self.counter
             self.counter = 0
-            print('real camera fps is ' + str(self.fps_real))
+            self.metric_fps.set(self.fps_real)
 
-        # crop image
-        image_cropped = utils.crop_image(camera.current_frame,self.crop_width,self.crop_height)
-        image_cropped = np.squeeze(image_cropped)
-        # rotate and flip
-        image_cropped = utils.rotate_and_flip_image(image_cropped,rotate_image_angle=ROTATE_IMAGE_ANGLE,flip_image=FLIP_IMAGE)
+        self.is_color = camera.is_color
+        self.processing_graph.submit(camera.current_frame,camera.frame_ID,camera.timestamp)
 
-        # send image to display
-        time_now = time.time()
-        if time_now-self.timestamp_last_display >= 1/self.fps_display:
-            # self.image_to_display.emit(cv2.resize(image_cropped,(round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)),cv2.INTER_LINEAR))
-            self.image_to_display.emit(utils.crop_image(image_cropped,round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)))
-            self.timestamp_last_display = time_now
+        self.handler_busy = False
+        camera.image_locked = False
 
-        # send image to write
-        if self.save_image_flag and time_now-self.timestamp_last_save >= 1/self.fps_save:
-            if camera.is_color:
-                image_cropped = cv2.cvtColor(image_cropped,cv2.COLOR_RGB2BGR)
-            self.packet_image_to_write.emit(image_cropped,camera.frame_ID,camera.timestamp)
-            self.timestamp_last_save = time_now
+    def _transform(self,image,frame_ID,timestamp):
+        # crop, rotate and flip - a strided view of the pooled frame, no copy is made here
+        return self.frame_transform.apply(image)
 
-        # send image to track
-        if self.track_flag and time_now-self.timestamp_last_track >= 1/self.fps_track:
-            # track is a blocking operation - it needs to be
-            # @@@ will cropping before emitting the signal lead to speedup?
-            self.packet_image_for_tracking.emit(image_cropped,camera.frame_ID,camera.timestamp)
-            self.timestamp_last_track = time_now
+    def _send_to_display(self,image,frame_ID,timestamp):
+        # self.image_to_display.emit(cv2.resize(image_cropped,(round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)),cv2.INTER_LINEAR))
+        # the display keeps a reference for an unknown time, so it gets a (display-sized) copy instead of a lease
+        self.image_to_display.emit(frame_pool.detach_frame(utils.crop_image(image,round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling))))
 
-        self.handler_busy = False
-        camera.image_locked = False
+    def _send_to_write(self,image,frame_ID,timestamp):
+        if self.is_color:
+            image = cv2.cvtColor(image,cv2.COLOR_RGB2BGR)
+        self._emit_leased(self.packet_image_to_write,image,frame_ID,timestamp)
+
+    def _send_to_track(self,image,frame_ID,timestamp):
+        # @@@ will cropping before emitting the signal lead to speedup?
+        self._emit_leased(self.packet_image_for_tracking,image,frame_ID,timestamp)
+
+    def _emit_leased(self,signal,image,frame_ID,timestamp):
+        # one reference per receiver, so that the pool slot stays valid until the last receiver has released it
+        for i in range(self.receivers(signal)):
+            frame_pool.retain_frame(image)
+        signal.emit(image,frame_ID,timestamp)
+
+    def close(self):
+        self.processing_graph.close()
 
     '''
     def on_new_frame_from_simulation(self,image,frame_ID,timestamp):
@@ -159,21 +208,37 @@ class StreamHandler(QObject):
 class ImageSaver(QObject):
 
     stop_recording = Signal()
+    save_fps_changed = Signal(float) # lowered by the write-rate governor
+    buffer_status = Signal(float,float) # spill buffer fill (0-1), predicted time to overflow (s)
 
-    def __init__(self,image_format='bmp'):
+    def __init__(self,image_format=Acquisition.RECORDING_FORMAT,num_writer_threads=IMAGE_SAVER.NUM_WRITER_THREADS,max_queue_bytes=IMAGE_SAVER.SPILL_BUFFER_BYTES):
         QObject.__init__(self)
         self.base_path = './'
         self.experiment_ID = ''
         self.image_format = image_format
+        self.frame_writer = None # for RECORDING.FORMAT_CHUNKED
         self.max_num_image_per_folder = 1000
-        self.queue = Queue(10) # max 10 items in the queue
+        # file names are assigned in enqueue(), in the order the frames arrive, so that they do not depend on which writer thread saves a frame
+        # the queue is the RAM spill buffer that absorbs disk stalls, the governor adapts the recording before it overflows
+        self.queue = ByteBoundedQueue(max_queue_bytes)
+        self.governor = WriteRateGovernor(max_queue_bytes)
         self.image_lock = Lock()
         self.stop_signal_received = False
-        self.thread = Thread(target=self.process_queue)
-        self.thread.start()
+        self.metric_frames_dropped = metrics.counter('frames_dropped',reason='saver_queue_full')
+        self.metric_queue_depth = metrics.gauge('saver_queue_depth')
+        self.metric_queue_bytes = metrics.gauge('saver_queue_bytes')
+        self.metric_save_latency = metrics.histogram('save_latency_s')
+        self.metric_write_bandwidth = metrics.gauge('saver_write_bandwidth_bytes_per_s')
+        self.metric_time_to_overflow = metrics.gauge('saver_time_to_overflow_s')
+        self.metric_adaptations = metrics.counter('saver_adaptations')
+        self.threads = [Thread(target=self.process_queue) for i in range(num_writer_threads)]
+        for thread in self.threads:
+            thread.start()
         self.counter = 0
         self.recording_start_time = 0
         self.recording_time_limit = -1
+        self.stage_position_source = None # function of monotonic time returning the stage position [x,y,z] in mm
+        self.stage_positions_file = None
 
     def process_queue(self):
         while True:
@@ -182,41 +247,119 @@ class ImageSaver(QObject):
                 return
             # process the queue
             try:
-                [image,frame_ID,timestamp] = self.queue.get(timeout=0.1)
-                self.image_lock.acquire(True)
+                [image,frame_ID,timestamp,saving_path,sequence] = self.queue.get(timeout=0.1)
+            except Empty:
+                continue
+            try:
+                t0 = time.perf_counter()
+                if sequence is not None:
+                    self.frame_writer.write(image,frame_ID,timestamp,sequence)
+                else:
+                    image_codecs.imwrite(saving_path,image)
+                self.metric_save_latency.observe(time.perf_counter()-t0)
+            except Exception as e:
+                print('saving frame ' + str(frame_ID) + ' failed: ' + str(e))
+            self.governor.on_written(image.nbytes)
+            frame_pool.release_frame(image)
+            self.queue.task_done()
+                            
+    def enqueue(self,image,frame_ID,timestamp):
+        with self.image_lock:
+            # frames are only put here, so a frame that fits now will still fit when it is put
+            if self.queue.get_nbytes() + image.nbytes > self.queue.max_bytes and not self.queue.empty():
+                frame_pool.release_frame(image)
+                self.metric_frames_dropped.inc()
+                return
+            if self.image_format == RECORDING.FORMAT_CHUNKED:
+                if self.frame_writer is None:
+                    self.frame_writer = ChunkedFrameWriter(os.path.join(self.base_path,self.experiment_ID,'recording'))
+                sequence = self.frame_writer.next_sequence()
+                saving_path = None
+            else:
                 folder_ID = int(self.counter/self.max_num_image_per_folder)
                 file_ID = int(self.counter%self.max_num_image_per_folder)
                 # create a new folder
                 if file_ID == 0:
-                    os.mkdir(os.path.join(self.base_path,self.experiment_ID,str(folder_ID)))
+                    os.makedirs(os.path.join(self.base_path,self.experiment_ID,str(folder_ID)),exist_ok=True)
                 saving_path = os.path.join(self.base_path,self.experiment_ID,str(folder_ID),str(file_ID) + '_' + str(frame_ID) + '.' + self.image_format)
-                
-                cv2.imwrite(saving_path,image)
-                self.counter = self.counter + 1
-                self.queue.task_done()
-                self.image_lock.release()
-            except:
-                pass
-                            
-    def enqueue(self,image,frame_ID,timestamp):
-        try:
-            self.queue.put_nowait([image,frame_ID,timestamp])
-            if ( self.recording_time_limit>0 ) and ( time.time()-self.recording_start_time >= self.recording_time_limit ):
-                self.stop_recording.emit()
-            # when using self.queue.put(str_), program can be slowed down despite multithreading because of the block and the GIL
-        except:
-            print('imageSaver queue is full, image discarded')
+                sequence = None
+            if self.queue.qsize() >= IMAGE_SAVER.MAX_POOLED_FRAMES_QUEUED:
+                # the frame will wait in the spill buffer - give its slot back to the camera's frame pool
+                spilled_image = frame_pool.detach_frame(image)
+                frame_pool.release_frame(image)
+                image = spilled_image
+            self.queue.put_nowait([image,frame_ID,timestamp,saving_path,sequence],image.nbytes)
+            self.counter = self.counter + 1
+            if self.stage_position_source is not None:
+                self.write_stage_position(frame_ID,timestamp)
+        self.governor.on_enqueued(image.nbytes)
+        self.metric_queue_depth.set(self.queue.qsize())
+        self.metric_queue_bytes.set(self.queue.get_nbytes())
+        if self.governor.update(self.queue.get_nbytes()):
+            self.adapt_to_write_rate()
+        if ( self.recording_time_limit>0 ) and ( time.time()-self.recording_start_time >= self.recording_time_limit ):
+            self.stop_recording.emit()
 
     def set_base_path(self,path):
         self.base_path = path
 
+    def set_stage_position_source(self,function):
+        self.stage_position_source = function
+
+    def write_stage_position(self,frame_ID,timestamp):
+        # stage position when the frame was captured, from the stage telemetry. called from enqueue() with image_lock held
+        if self.stage_positions_file is None or self.stage_positions_file.closed:
+            # appended to - a frame that arrives after the file was closed does not overwrite the rows written before
+            self.stage_positions_file = open(os.path.join(self.base_path,self.experiment_ID,'stage_positions.csv'),'a')
+            if self.stage_positions_file.tell() == 0:
+                self.stage_positions_file.write('frame_ID,timestamp (s),x (mm),y (mm),z (mm)\n')
+        [x_mm,y_mm,z_mm] = self.stage_position_source(monotonic_from_wall_time(timestamp))
+        self.stage_positions_file.write(str(frame_ID) + ',' + str(timestamp) + ',' + str(x_mm) + ',' + str(y_mm) + ',' + str(z_mm) + '\n')
+
+    def close_stage_positions_file(self):
+        # enqueue() writes to the file from the camera's thread
+        with self.image_lock:
+            if self.stage_positions_file is not None and not self.stage_positions_file.closed:
+                self.stage_positions_file.close()
+            self.stage_positions_file = None
+
+    def adapt_to_write_rate(self):
+        if self.governor.write_bandwidth is not None:
+            self.metric_write_bandwidth.set(self.governor.write_bandwidth)
+        self.metric_time_to_overflow.set(min(self.governor.time_to_overflow,1e9))
+        self.buffer_status.emit(self.governor.get_fill(),self.governor.time_to_overflow)
+        if not IMAGE_SAVER.GOVERNOR_ENABLED or not self.governor.is_overflow_expected():
+            return
+        # first try a faster codec, then lower the save fps to what the disk sustains
+        if self.frame_writer is not None:
+            if self.frame_writer.codec in IMAGE_SAVER.GOVERNOR_CODECS:
+                codecs = IMAGE_SAVER.GOVERNOR_CODECS[IMAGE_SAVER.GOVERNOR_CODECS.index(self.frame_writer.codec)+1:]
+            else:
+                codecs = IMAGE_SAVER.GOVERNOR_CODECS
+            codecs = [codec for codec in codecs if image_codecs.is_available(codec)]
+            if codecs:
+                print('recording buffer fills up (' + '{:.0f}'.format(100*self.governor.get_fill()) + '%), switching to codec ' + codecs[0])
+                self.frame_writer.set_codec(codecs[0])
+                self.governor.on_adapted()
+                self.metric_adaptations.inc()
+                return
+        fps = self.governor.get_sustainable_fps()
+        if fps is not None and fps < 0.95*self.governor.frame_rate_in:
+            print('recording buffer fills up (' + '{:.0f}'.format(100*self.governor.get_fill()) + '%), lowering the save fps to ' + '{:.2f}'.format(fps))
+            self.save_fps_changed.emit(fps)
+            self.governor.on_adapted()
+            self.metric_adaptations.inc()
+
     def set_recording_time_limit(self,time_limit):
         self.recording_time_limit = time_limit
 
     def start_new_experiment(self,experiment_ID):
+        self.close_frame_writer()
+        self.close_stage_positions_file()
         # generate unique experiment ID
         self.experiment_ID = experiment_ID + '_' + datetime.now().strftime('%Y-%m-%d %H-%M-%-S.%f')
         self.recording_start_time = time.time()
+        self.governor.reset()
         # create a new folder
         try:
             os.mkdir(os.path.join(self.base_path,self.experiment_ID))
@@ -226,23 +369,37 @@ class ImageSaver(QObject):
         # reset the counter
         self.counter = 0
 
+    def close_frame_writer(self):
+        # finish the recording container of the previous experiment
+        if self.frame_writer is not None:
+            self.queue.join()
+            self.frame_writer.close()
+            self.frame_writer = None
+
     def close(self):
         self.queue.join()
+        self.close_frame_writer()
+        self.close_stage_positions_file()
         self.stop_signal_received = True
-        self.thread.join()
+        for thread in self.threads:
+            thread.join()
 
 
 class ImageSaver_Tracking(QObject):
-    def __init__(self,base_path,image_format='bmp'):
+    def __init__(self,base_path,image_format='bmp',num_writer_threads=IMAGE_SAVER.NUM_WRITER_THREADS,max_queue_bytes=IMAGE_SAVER.MAX_QUEUE_BYTES):
         QObject.__init__(self)
         self.base_path = base_path
         self.image_format = image_format
         self.max_num_image_per_folder = 1000
-        self.queue = Queue(100) # max 100 items in the queue
+        self.queue = ByteBoundedQueue(max_queue_bytes)
         self.image_lock = Lock()
         self.stop_signal_received = False
-        self.thread = Thread(target=self.process_queue)
-        self.thread.start()
+        self.metric_frames_dropped = metrics.counter('frames_dropped',reason='tracking_saver_queue_full')
+        self.metric_queue_depth = metrics.gauge('tracking_saver_queue_depth')
+        self.metric_save_latency = metrics.histogram('save_latency_s',saver='tracking')
+        self.threads = [Thread(target=self.process_queue) for i in range(num_writer_threads)]
+        for thread in self.threads:
+            thread.start()
 
     def process_queue(self):
         while True:
@@ -251,30 +408,35 @@ class ImageSaver_Tracking(QObject):
                 return
             # process the queue
             try:
-                [image,frame_counter,postfix] = self.queue.get(timeout=0.1)
-                self.image_lock.acquire(True)
-                folder_ID = int(frame_counter/self.max_num_image_per_folder)
-                file_ID = int(frame_counter%self.max_num_image_per_folder)
-                # create a new folder
-                if file_ID == 0:
-                    os.mkdir(os.path.join(self.base_path,str(folder_ID)))
-                saving_path = os.path.join(self.base_path,str(folder_ID),str(file_ID) + '_' + str(frame_counter) + '_' + postfix + '.' + self.image_format)
-                cv2.imwrite(saving_path,image)
-                self.queue.task_done()
-                self.image_lock.release()
-            except:
-                pass
+                [image,saving_path] = self.queue.get(timeout=0.1)
+            except Empty:
+                continue
+            try:
+                t0 = time.perf_counter()
+                image_codecs.imwrite(saving_path,image)
+                self.metric_save_latency.observe(time.perf_counter()-t0)
+            except Exception as e:
+                print('saving ' + saving_path + ' failed: ' + str(e))
+            self.queue.task_done()
                             
     def enqueue(self,image,frame_counter,postfix):
+        folder_ID = int(frame_counter/self.max_num_image_per_folder)
+        file_ID = int(frame_counter%self.max_num_image_per_folder)
+        # create a new folder
+        if file_ID == 0:
+            os.makedirs(os.path.join(self.base_path,str(folder_ID)),exist_ok=True)
+        saving_path = os.path.join(self.base_path,str(folder_ID),str(file_ID) + '_' + str(frame_counter) + '_' + postfix + '.' + self.image_format)
         try:
-            self.queue.put_nowait([image,frame_counter,postfix])
-        except:
-            print('imageSaver queue is full, image discarded')
+            self.queue.put_nowait([image,saving_path],image.nbytes)
+            self.metric_queue_depth.set(self.queue.qsize())
+        except Full:
+            self.metric_frames_dropped.inc()
 
     def close(self):
         self.queue.join()
         self.stop_signal_received = True
-        self.thread.join()
+        for thread in self.threads:
+            thread.join()
 
 
 '''
@@ -283,45 +445,137 @@ class ImageSaver_MultiPointAcquisition(QObject):
 
 class ImageDisplay(QObject):
 
-    image_to_display = Signal(np.ndarray)
+    # image, [x, y, width, height, frame width, frame height] - the part of the frame the image covers, in frame pixels (None: the whole image)
+    image_to_display = Signal(np.ndarray,object)
 
-    def __init__(self):
+    def __init__(self,refresh_rate=DISPLAY.REFRESH_RATE_HZ):
         QObject.__init__(self)
-        self.queue = Queue(10) # max 10 items in the queue
-        self.image_lock = Lock()
+        # latest-wins: a frame that has not been shown yet is replaced by a newer one, frames never pile up
+        # incoming frames -> (thread) resample -> rendered by a GUI timer at the refresh rate of the screen
+        self.mailbox_in = Mailbox()
+        self.mailbox_out = Mailbox()
         self.stop_signal_received = False
+        # visible region of the frame [x_min, x_max, y_min, y_max] and its size on screen [width, height], reported by the display window
+        self.viewport = None
+        self.lod_enabled = DISPLAY.LOD_ENABLED
+        # 16 bit frames are converted to 8 bit for display; three output buffers, so that the thread can always write into
+        # one while one waits in the mailbox and one is shown
+        self.display_lut = utils.DisplayLUT(gamma=DISPLAY.GAMMA,auto_contrast=DISPLAY.AUTO_CONTRAST,percentiles=DISPLAY.AUTO_CONTRAST_PERCENTILES)
+        self.display_buffers = [None]*3
+        self.buffer_pending = None
+        self.buffer_displayed = None
+        self.metric_frames_dropped = metrics.counter('frames_dropped',reason='display_superseded')
+        self.metric_display_latency = metrics.histogram('display_latency_s')
         self.thread = Thread(target=self.process_queue)
-        self.thread.start()        
-        
+        self.thread.start()
+        if refresh_rate is None:
+            try:
+                refresh_rate = QApplication.primaryScreen().refreshRate()
+            except:
+                refresh_rate = 60
+        self.timer_display = QTimer()
+        self.timer_display.setTimerType(Qt.PreciseTimer)
+        self.timer_display.setInterval(int(1000/max(refresh_rate,1)))
+        self.timer_display.timeout.connect(self.display_latest)
+        self.timer_display.start()
+
     def process_queue(self):
         while True:
             # stop the thread if stop signal is received
             if self.stop_signal_received:
                 return
-            # process the queue
             try:
-                [image,frame_ID,timestamp] = self.queue.get(timeout=0.1)
-                self.image_lock.acquire(True)
-                self.image_to_display.emit(image)
-                self.image_lock.release()
-                self.queue.task_done()
-            except:
-                pass
+                [image,t_received] = self.mailbox_in.get(timeout=0.1)
+            except Empty:
+                continue
+            try:
+                if self.lod_enabled:
+                    image,rect = self.resample_for_display(image)
+                else:
+                    rect = None
+                image = self.convert_for_display(image)
+                self.buffer_pending = image
+                if self.mailbox_out.put([image,rect,t_received]):
+                    self.metric_frames_dropped.inc()
+            except Exception as e:
+                print('display: ' + str(e))
+
+    def display_latest(self):
+        # GUI thread - at most one frame per screen refresh
+        try:
+            [image,rect,t_received] = self.mailbox_out.get_nowait()
+        except Empty:
+            return
+        self.buffer_displayed = image
+        self.image_to_display.emit(image,rect)
+        self.metric_display_latency.observe(time.perf_counter()-t_received)
+
+    def set_viewport(self,x_min,x_max,y_min,y_max,width,height):
+        self.viewport = [x_min,x_max,y_min,y_max,width,height]
+
+    def resample_for_display(self,image):
+        # keep only the visible part of the frame and bin it down to the number of screen pixels it covers
+        frame_height = image.shape[0]
+        frame_width = image.shape[1]
+        if self.viewport is None:
+            [x_min,x_max,y_min,y_max] = [0,frame_width,0,frame_height]
+            width = height = DISPLAY.DEFAULT_VIEWPORT_SIZE_PX
+        else:
+            [x_min,x_max,y_min,y_max,width,height] = self.viewport
+        x0 = int(max(math.floor(x_min),0))
+        x1 = int(min(math.ceil(x_max),frame_width))
+        y0 = int(max(math.floor(y_min),0))
+        y1 = int(min(math.ceil(y_max),frame_height))
+        if x1 <= x0 or y1 <= y0:
+            # nothing of the frame is visible
+            [x0,x1,y0,y1] = [0,frame_width,0,frame_height]
+        # integer bin factor, so that displayed pixels stay square and aligned with the frame pixels
+        factor = int(min((x1-x0)/max(width,1),(y1-y0)/max(height,1)))
+        if factor >= 2:
+            width_out = (x1-x0)//factor
+            height_out = (y1-y0)//factor
+            x1 = x0 + width_out*factor
+            y1 = y0 + height_out*factor
+            image = cv2.resize(image[y0:y1,x0:x1],(width_out,height_out),interpolation=cv2.INTER_AREA)
+        else:
+            image = image[y0:y1,x0:x1]
+        return image,[x0,y0,x1-x0,y1-y0,frame_width,frame_height]
+
+    def convert_for_display(self,image):
+        if image.dtype != np.uint16:
+            return np.ascontiguousarray(image)
+        # a buffer that is neither waiting in the mailbox nor shown
+        for i in range(len(self.display_buffers)):
+            buffer = self.display_buffers[i]
+            if buffer is not self.buffer_pending and buffer is not self.buffer_displayed:
+                if buffer is None or buffer.shape != image.shape:
+                    buffer = self.display_buffers[i] = np.empty(image.shape,dtype=np.uint8)
+                return self.display_lut.apply(image,buffer)
+
+    def set_display_levels(self,black_level,white_level):
+        # manual levels, turns auto contrast off
+        self.display_lut.set_auto_contrast(False)
+        self.display_lut.set_levels(black_level,white_level)
+
+    def set_display_gamma(self,gamma):
+        self.display_lut.set_gamma(gamma)
+
+    def set_auto_contrast(self,enabled):
+        self.display_lut.set_auto_contrast(enabled)
+        if not enabled:
+            self.display_lut.set_levels(0,65535)
 
     # def enqueue(self,image,frame_ID,timestamp):
     def enqueue(self,image):
-        try:
-            self.queue.put_nowait([image,None,None])
-            # when using self.queue.put(str_) instead of try + nowait, program can be slowed down despite multithreading because of the block and the GIL
-            pass
-        except:
-            print('imageDisplay queue is full, image discarded')
+        # thread safe - can be connected with Qt.DirectConnection, so that frames do not go through the GUI event queue
+        if self.mailbox_in.put([image,time.perf_counter()]):
+            self.metric_frames_dropped.inc()
 
     def emit_directly(self,image):
-        self.image_to_display.emit(image)
+        self.image_to_display.emit(image,None)
 
     def close(self):
-        self.queue.join()
+        self.timer_display.stop()
         self.stop_signal_received = True
         self.thread.join()
 
@@ -348,19 +602,19 @@ class LiveController(QObject):
         self.was_live_before_autofocus = False
         self.was_live_before_multipoint = False
         self.control_illumination = control_illumination
+        self.illumination_commands = {} # (illumination source, intensity): mcu command
 
         self.fps_software_trigger = 1;
-        self.timer_software_trigger_interval = (1/self.fps_software_trigger)*1000
-
-        self.timer_software_trigger = QTimer()
-        self.timer_software_trigger.setInterval(self.timer_software_trigger_interval)
-        self.timer_software_trigger.timeout.connect(self.trigger_acquisition_software)
+        # triggers are sent from the generator's thread (illumination on + camera trigger), not from the GUI event loop
+        self.software_trigger_generator = SoftwareTriggerGenerator(self.trigger_acquisition_software,self.fps_software_trigger)
 
         self.trigger_ID = -1
+        self.t_last_trigger = 0
 
         self.fps_real = 0
         self.counter = 0
         self.timestamp_last = 0
+        self.metric_fps = metrics.gauge('trigger_fps')
 
         self.display_resolution_scaling = Acquisition.IMAGE_DISPLAY_SCALING_FACTOR
 
@@ -372,10 +626,27 @@ class LiveController(QObject):
         self.microcontroller.turn_off_illumination()
 
     def set_illumination(self,illumination_source,intensity):
-        if illumination_source < 10: # LED matrix
-            self.microcontroller.set_illumination_led_matrix(illumination_source,r=(intensity/100)*LED_MATRIX_R_FACTOR,g=(intensity/100)*LED_MATRIX_G_FACTOR,b=(intensity/100)*LED_MATRIX_B_FACTOR)
-        else:
-            self.microcontroller.set_illumination(illumination_source,intensity)
+        # the mcu skips the command if it already has this illumination
+        self.microcontroller.send_illumination_command(self.get_illumination_command(illumination_source,intensity))
+
+    def get_illumination_command(self,illumination_source,intensity):
+        # command bytes are computed once per illumination source and intensity, i.e. per configuration
+        key = (illumination_source,intensity)
+        if key not in self.illumination_commands:
+            if illumination_source < 10: # LED matrix
+                self.illumination_commands[key] = self.microcontroller.get_illumination_led_matrix_command(illumination_source,r=(intensity/100)*LED_MATRIX_R_FACTOR,g=(intensity/100)*LED_MATRIX_G_FACTOR,b=(intensity/100)*LED_MATRIX_B_FACTOR)
+            else:
+                self.illumination_commands[key] = self.microcontroller.get_illumination_command(illumination_source,intensity)
+        return self.illumination_commands[key]
+
+    def get_device_state_stats(self):
+        # number of camera and mcu writes done and skipped because the device already had the value
+        stats = {}
+        for [name,device] in [['camera',self.camera],['microcontroller',self.microcontroller]]:
+            state_cache = getattr(device,'state_cache',None)
+            if state_cache is not None:
+                stats[name] = state_cache.get_stats()
+        return stats
 
     def start_live(self):
         self.is_live = True
@@ -401,6 +672,7 @@ class LiveController(QObject):
         if self.control_illumination:
             self.turn_on_illumination()
         self.trigger_ID = self.trigger_ID + 1
+        self.t_last_trigger = time.perf_counter()
         self.camera.send_trigger()
         # measure real fps
         timestamp_now = round(time.time())
@@ -410,18 +682,21 @@ class LiveController(QObject):
             self.timestamp_last = timestamp_now
             self.fps_real = self.counter
             self.counter = 0
+            self.metric_fps.set(self.fps_real)
             # print('real trigger fps is ' + str(self.fps_real))
 
     def _start_software_triggerred_acquisition(self):
-        self.timer_software_trigger.start()
+        self.software_trigger_generator.resume()
 
     def _set_software_trigger_fps(self,fps_software_trigger):
         self.fps_software_trigger = fps_software_trigger
-        self.timer_software_trigger_interval = (1/self.fps_software_trigger)*1000
-        self.timer_software_trigger.setInterval(self.timer_software_trigger_interval)
+        self.software_trigger_generator.set_fps(self.fps_software_trigger)
 
     def _stop_software_triggerred_acquisition(self):
-        self.timer_software_trigger.stop()
+        self.software_trigger_generator.pause()
+
+    def get_software_trigger_stats(self):
+        return self.software_trigger_generator.get_stats()
 
     # trigger mode and settings
     def set_trigger_mode(self,mode):
@@ -453,7 +728,7 @@ class LiveController(QObject):
         
         # temporarily stop live while changing mode
         if self.is_live is True:
-            self.timer_software_trigger.stop()
+            self.software_trigger_generator.pause()
             if self.control_illumination:
                 self.turn_off_illumination()
 
@@ -469,7 +744,8 @@ class LiveController(QObject):
         if self.is_live is True:
             if self.control_illumination:
                 self.turn_on_illumination()
-            self.timer_software_trigger.start()
+            if self.trigger_mode == TriggerMode.SOFTWARE:
+                self.software_trigger_generator.resume()
 
     def get_trigger_mode(self):
         return self.trigger_mode
@@ -478,11 +754,20 @@ class LiveController(QObject):
     def on_new_frame(self):
         if self.fps_software_trigger <= 5:
             if self.control_illumination:
-                self.turn_off_illumination()
+                # from the trigger thread, which turns the illumination on - the commands cannot arrive out of order
+                self.software_trigger_generator.call_soon(self._turn_off_illumination_after_frame)
+
+    def _turn_off_illumination_after_frame(self):
+        # not during the exposure of a trigger sent since - its frame turns the illumination off
+        if time.perf_counter() - self.t_last_trigger >= self.camera.exposure_time/1000:
+            self.turn_off_illumination()
 
     def set_display_resolution_scaling(self, display_resolution_scaling):
         self.display_resolution_scaling = display_resolution_scaling/100
 
+    def close(self):
+        self.software_trigger_generator.close()
+
 class NavigationController(QObject):
 
     xPos = Signal(float)
@@ -502,9 +787,13 @@ class NavigationController(QObject):
         self.y_microstepping = MICROSTEPPING_DEFAULT_Y
         self.z_microstepping = MICROSTEPPING_DEFAULT_Z
         self.theta_microstepping = MICROSTEPPING_DEFAULT_THETA
+        # position conversion, done once per packet by the telemetry bus
+        self.mm_per_ustep = get_mm_per_ustep(self.x_microstepping,self.y_microstepping,self.z_microstepping,self.theta_microstepping)
+        self.microcontroller.telemetry_bus.set_conversion_factors(self.mm_per_ustep)
 
-        # to be moved to gui for transparency
-        self.microcontroller.set_callback(self.update_pos)
+        # the position is kept up to date with every packet, the gui is updated at a lower rate
+        self.microcontroller.telemetry_bus.subscribe(self.update_pos_state)
+        self.microcontroller.telemetry_bus.subscribe(self.update_pos,max_rate_hz=STAGE_TELEMETRY.GUI_UPDATE_RATE_HZ)
 
         # self.timer_read_pos = QTimer()
         # self.timer_read_pos.setInterval(PosUpdate.INTERVAL_MS)
@@ -512,80 +801,74 @@ class NavigationController(QObject):
         # self.timer_read_pos.start()
 
     def move_x(self,delta):
-        self.microcontroller.move_x_usteps(int(delta/(SCREW_PITCH_X_MM/(self.x_microstepping*FULLSTEPS_PER_REV_X))))
+        return self.microcontroller.move_x_usteps(int(delta/(SCREW_PITCH_X_MM/(self.x_microstepping*FULLSTEPS_PER_REV_X))))
 
     def move_y(self,delta):
-        self.microcontroller.move_y_usteps(int(delta/(SCREW_PITCH_Y_MM/(self.y_microstepping*FULLSTEPS_PER_REV_Y))))
+        return self.microcontroller.move_y_usteps(int(delta/(SCREW_PITCH_Y_MM/(self.y_microstepping*FULLSTEPS_PER_REV_Y))))
 
     def move_z(self,delta):
-        self.microcontroller.move_z_usteps(int(delta/(SCREW_PITCH_Z_MM/(self.z_microstepping*FULLSTEPS_PER_REV_Z))))
+        return self.microcontroller.move_z_usteps(int(delta/(SCREW_PITCH_Z_MM/(self.z_microstepping*FULLSTEPS_PER_REV_Z))))
 
     def move_x_usteps(self,usteps):
-        self.microcontroller.move_x_usteps(usteps)
+        return self.microcontroller.move_x_usteps(usteps)
 
     def move_y_usteps(self,usteps):
-        self.microcontroller.move_y_usteps(usteps)
+        return self.microcontroller.move_y_usteps(usteps)
 
     def move_z_usteps(self,usteps):
-        self.microcontroller.move_z_usteps(usteps)
-
-    def update_pos(self,microcontroller):
-        # get position from the microcontroller
-        x_pos, y_pos, z_pos, theta_pos = microcontroller.get_pos()
-        # calculate position in mm or rad
-        if USE_ENCODER_X:
-            self.x_pos_mm = x_pos*STAGE_POS_SIGN_X*ENCODER_STEP_SIZE_X_MM
-        else:
-            self.x_pos_mm = x_pos*STAGE_POS_SIGN_X*(SCREW_PITCH_X_MM/(self.x_microstepping*FULLSTEPS_PER_REV_X))
-        if USE_ENCODER_Y:
-            self.y_pos_mm = y_pos*STAGE_POS_SIGN_Y*ENCODER_STEP_SIZE_Y_MM
-        else:
-            self.y_pos_mm = y_pos*STAGE_POS_SIGN_Y*(SCREW_PITCH_Y_MM/(self.y_microstepping*FULLSTEPS_PER_REV_Y))
-        if USE_ENCODER_Z:
-            self.z_pos_mm = z_pos*STAGE_POS_SIGN_Z*ENCODER_STEP_SIZE_Z_MM
-        else:
-            self.z_pos_mm = z_pos*STAGE_POS_SIGN_Z*(SCREW_PITCH_Z_MM/(self.z_microstepping*FULLSTEPS_PER_REV_Z))
-        if USE_ENCODER_THETA:
-            self.theta_pos_rad = theta_pos*STAGE_POS_SIGN_THETA*ENCODER_STEP_SIZE_THETA
-        else:
-            self.theta_pos_rad = theta_pos*STAGE_POS_SIGN_THETA*(2*math.pi/(self.theta_microstepping*FULLSTEPS_PER_REV_THETA))
+        return self.microcontroller.move_z_usteps(usteps)
+
+    def update_pos_state(self,state):
+        self.x_pos_mm = state.x_mm
+        self.y_pos_mm = state.y_mm
+        self.z_pos_mm = state.z_mm
+        self.theta_pos_rad = state.theta_rad
+
+    def update_pos(self,state):
         # emit the updated position
         self.xPos.emit(self.x_pos_mm)
         self.yPos.emit(self.y_pos_mm)
         self.zPos.emit(self.z_pos_mm*1000)
         self.thetaPos.emit(self.theta_pos_rad*360/(2*math.pi))
 
-        if microcontroller.signal_joystick_button_pressed_event:
+        if self.microcontroller.signal_joystick_button_pressed_event:
             self.signal_joystick_button_pressed.emit()
             print('joystick button pressed')
-            microcontroller.signal_joystick_button_pressed_event = False
+            self.microcontroller.signal_joystick_button_pressed_event = False
+
+    def get_pos_mm_at(self,t):
+        # stage position [x,y,z] in mm at monotonic time(s) t, interpolated between the mcu's status packets
+        pos = self.microcontroller.telemetry.position_at(t)
+        if pos is None:
+            return np.array([self.x_pos_mm,self.y_pos_mm,self.z_pos_mm])
+        return pos[...,:3]*np.array(self.mm_per_ustep[:3])
 
     def home_x(self):
-        self.microcontroller.home_x()
+        return self.microcontroller.home_x()
 
     def home_y(self):
-        self.microcontroller.home_y()
+        return self.microcontroller.home_y()
 
     def home_z(self):
-        self.microcontroller.home_z()
+        return self.microcontroller.home_z()
 
     def home_theta(self):
-        self.microcontroller.home_theta()
+        return self.microcontroller.home_theta()
 
     def home_xy(self):
-        self.microcontroller.home_xy()
+        return self.microcontroller.home_xy()
 
     def zero_x(self):
-        self.microcontroller.zero_x()
+        return self.microcontroller.zero_x()
 
     def zero_y(self):
-        self.microcontroller.zero_y()
+        return self.microcontroller.zero_y()
 
     def zero_z(self):
-        self.microcontroller.zero_z()
+        return self.microcontroller.zero_z()
 
     def zero_theta(self):
-        self.microcontroller.zero_tehta()
+        return self.microcontroller.zero_tehta()
 
     def home(self):
         pass
@@ -612,13 +895,21 @@ class AutofocusWorker(QObject):
         self.crop_width = self.autofocusController.crop_width
         self.crop_height = self.autofocusController.crop_height
 
+        self.metric_step_time = metrics.histogram('autofocus_step_s')
+        self.metric_focus_measure = metrics.histogram('autofocus_focus_measure_s')
+
     def run(self):
-        self.run_autofocus()
-        self.finished.emit()
+        # finished is always emitted - the controller restores live and the callback and releases the waiters
+        try:
+            self.run_autofocus()
+        except Exception as e:
+            print('autofocus failed: ' + str(e))
+        finally:
+            self.finished.emit()
 
-    def wait_till_operation_is_completed(self):
-        while self.microcontroller.is_busy():
-            time.sleep(SLEEP_TIME_S)
+    def wait_till_operation_is_completed(self,*futures):
+        # waits for the given mcu commands, or for the last command that was sent
+        self.microcontroller.wait_till_operation_is_completed(*futures)
 
     def run_autofocus(self):
         # @@@ to add: increase gain, decrease exposure time
@@ -627,20 +918,21 @@ class AutofocusWorker(QObject):
         focus_measure_max = 0
 
         z_af_offset_usteps = self.deltaZ_usteps*round(self.N/2)
-        self.navigationController.move_z_usteps(-z_af_offset_usteps)
-        self.wait_till_operation_is_completed()
+        future = self.navigationController.move_z_usteps(-z_af_offset_usteps)
+        self.wait_till_operation_is_completed(future)
 
         # maneuver for achiving uniform step size and repeatability when using open-loop control
         # can be moved to the firmware
-        self.navigationController.move_z_usteps(80)
-        self.wait_till_operation_is_completed()
-        self.navigationController.move_z_usteps(-80)
-        self.wait_till_operation_is_completed()
+        future = self.navigationController.move_z_usteps(80)
+        self.wait_till_operation_is_completed(future)
+        future = self.navigationController.move_z_usteps(-80)
+        self.wait_till_operation_is_completed(future)
 
         steps_moved = 0
         for i in range(self.N):
-            self.navigationController.move_z_usteps(self.deltaZ_usteps)
-            self.wait_till_operation_is_completed()
+            t_step = time.perf_counter()
+            future = self.navigationController.move_z_usteps(self.deltaZ_usteps)
+            self.wait_till_operation_is_completed(future)
             steps_moved = steps_moved + 1
             self.liveController.turn_on_illumination()
             self.wait_till_operation_is_completed()
@@ -650,25 +942,24 @@ class AutofocusWorker(QObject):
             image = utils.crop_image(image,self.crop_width,self.crop_height)
             self.image_to_display.emit(image)
             QApplication.processEvents()
-            timestamp_0 = time.time()
-            focus_measure = utils.calculate_focus_measure(image)
-            timestamp_1 = time.time()
-            print('             calculating focus measure took ' + str(timestamp_1-timestamp_0) + ' second')
+            with self.metric_focus_measure.time():
+                focus_measure = utils.calculate_focus_measure(image)
             focus_measure_vs_z[i] = focus_measure
+            self.metric_step_time.observe(time.perf_counter()-t_step)
             print(i,focus_measure)
             focus_measure_max = max(focus_measure, focus_measure_max)
             if focus_measure < focus_measure_max*AF.STOP_THRESHOLD:
                 break
 
         # maneuver for achiving uniform step size and repeatability when using open-loop control
-        self.navigationController.move_z_usteps(80)
-        self.wait_till_operation_is_completed()
-        self.navigationController.move_z_usteps(-80)
-        self.wait_till_operation_is_completed()
+        future = self.navigationController.move_z_usteps(80)
+        self.wait_till_operation_is_completed(future)
+        future = self.navigationController.move_z_usteps(-80)
+        self.wait_till_operation_is_completed(future)
 
         idx_in_focus = focus_measure_vs_z.index(max(focus_measure_vs_z))
-        self.navigationController.move_z_usteps((idx_in_focus-steps_moved)*self.deltaZ_usteps)
-        self.wait_till_operation_is_completed()
+        future = self.navigationController.move_z_usteps((idx_in_focus-steps_moved)*self.deltaZ_usteps)
+        self.wait_till_operation_is_completed(future)
         if idx_in_focus == 0:
             print('moved to the bottom end of the AF range')
         if idx_in_focus == self.N-1:
@@ -691,6 +982,11 @@ class AutoFocusController(QObject):
         self.crop_width = AF.CROP_WIDTH
         self.crop_height = AF.CROP_HEIGHT
         self.autofocus_in_progress = False
+        # set when no autofocus is running - wait_till_autofocus_has_completed() blocks on it
+        self.autofocus_completed = Event()
+        self.autofocus_completed.set()
+        self.t_autofocus_completed = 0
+        self.metric_wakeup_latency = metrics.histogram('wait_wakeup_latency_s',wait='autofocus')
 
     def set_N(self,N):
         self.N = N
@@ -722,6 +1018,7 @@ class AutoFocusController(QObject):
             self.callback_was_enabled_before_autofocus = False
 
         self.autofocus_in_progress = True
+        self.autofocus_completed.clear()
 
         # create a QThread object
         try:
@@ -766,14 +1063,19 @@ class AutoFocusController(QObject):
 
         # update the state
         self.autofocus_in_progress = False
+        self.t_autofocus_completed = time.perf_counter()
+        self.autofocus_completed.set()
 
     def slot_image_to_display(self,image):
         #self.image_to_display.emit(image)
         pass
 
     def wait_till_autofocus_has_completed(self):
-        while self.autofocus_in_progress == True:
-            time.sleep(0.005)
+        was_in_progress = not self.autofocus_completed.is_set()
+        if not self.autofocus_completed.wait(AF.WAIT_TIMEOUT_S):
+            raise TimeoutError('autofocus has not completed within ' + str(AF.WAIT_TIMEOUT_S) + ' s')
+        if was_in_progress:
+            self.metric_wakeup_latency.observe(time.perf_counter()-self.t_autofocus_completed)
         print('autofocus wait has completed, exit wait')
 
 class MultiPointWorker(QObject):
@@ -815,31 +1117,37 @@ class MultiPointWorker(QObject):
 
         self.timestamp_acquisition_started = self.multiPointController.timestamp_acquisition_started
         self.time_point = 0
+        self.image_writer = MultiPointImageWriter()
 
     def run(self):
-        while self.time_point < self.Nt:
-            # continous acquisition
-            if self.dt == 0:
-                self.run_single_time_point()
-                self.time_point = self.time_point + 1
-            # timed acquisition
-            else:
-                self.run_single_time_point()
-                self.time_point = self.time_point + 1
-                # check if the aquisition has taken longer than dt or integer multiples of dt, if so skip the next time point(s)
-                while time.time() > self.timestamp_acquisition_started + self.time_point*self.dt:
-                    print('skip time point ' + str(self.time_point+1))
-                    self.time_point = self.time_point+1
-                if self.time_point == self.Nt:
-                    break # no waiting after taking the last time point
-                # wait until it's time to do the next acquisition
-                while time.time() < self.timestamp_acquisition_started + self.time_point*self.dt:
-                    time.sleep(0.05)
-        self.finished.emit()
-
-    def wait_till_operation_is_completed(self):
-        while self.microcontroller.is_busy():
-            time.sleep(SLEEP_TIME_S)
+        try:
+            while self.time_point < self.Nt:
+                # continous acquisition
+                if self.dt == 0:
+                    self.run_single_time_point()
+                    self.time_point = self.time_point + 1
+                # timed acquisition
+                else:
+                    self.run_single_time_point()
+                    self.time_point = self.time_point + 1
+                    # check if the aquisition has taken longer than dt or integer multiples of dt, if so skip the next time point(s)
+                    while time.time() > self.timestamp_acquisition_started + self.time_point*self.dt:
+                        print('skip time point ' + str(self.time_point+1))
+                        self.time_point = self.time_point+1
+                    if self.time_point == self.Nt:
+                        break # no waiting after taking the last time point
+                    # wait until it's time to do the next acquisition
+                    time.sleep(max(self.timestamp_acquisition_started + self.time_point*self.dt - time.time(),0))
+        except Exception as e:
+            print('acquisition failed at time point ' + str(self.time_point) + ': ' + str(e))
+        finally:
+            # wait for the images still being written and finish the open stacks
+            self.image_writer.close()
+            self.finished.emit()
+
+    def wait_till_operation_is_completed(self,*futures):
+        # waits for the given mcu commands, or for the last command that was sent
+        self.microcontroller.wait_till_operation_is_completed(*futures)
 
     def run_single_time_point(self):
         self.FOV_counter = 0
@@ -872,10 +1180,10 @@ class MultiPointWorker(QObject):
 
                     if (self.NZ > 1):
                         # maneuver for achiving uniform step size and repeatability when using open-loop control
-                        self.navigationController.move_z_usteps(80)
-                        self.wait_till_operation_is_completed()
-                        self.navigationController.move_z_usteps(-80)
-                        self.wait_till_operation_is_completed()
+                        future = self.navigationController.move_z_usteps(80)
+                        self.wait_till_operation_is_completed(future)
+                        future = self.navigationController.move_z_usteps(-80)
+                        self.wait_till_operation_is_completed(future)
                         time.sleep(SCAN_STABILIZATION_TIME_MS_Z/1000)
 
                     file_ID = str(i) + '_' + str(j) + '_' + str(k)
@@ -886,18 +1194,28 @@ class MultiPointWorker(QObject):
                         self.wait_till_operation_is_completed()
                         self.liveController.turn_on_illumination()
                         self.wait_till_operation_is_completed()
+                        timestamp = time.time()
                         self.camera.send_trigger() 
                         image = self.camera.read_frame()
                         self.liveController.turn_off_illumination()
                         image = utils.crop_image(image,self.crop_width,self.crop_height)
-                        saving_path = os.path.join(current_path, file_ID + str(config.name) + '.' + Acquisition.IMAGE_FORMAT)
                         # self.image_to_display.emit(cv2.resize(image,(round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)),cv2.INTER_LINEAR))
                         image_to_display = utils.crop_image(image,round(self.crop_width*self.liveController.display_resolution_scaling), round(self.crop_height*self.liveController.display_resolution_scaling))
                         self.image_to_display.emit(image_to_display)
                         self.image_to_display_multi.emit(image_to_display,config.illumination_source)
-                        if self.camera.is_color:
-                            image = cv2.cvtColor(image,cv2.COLOR_RGB2BGR)
-                        cv2.imwrite(saving_path,image)
+                        # saved on the writer thread
+                        if self.image_writer.save_as_tiff_stack:
+                            metadata = {'i':i,'j':j,'k':k,'time_point':self.time_point,
+                                        'x_mm':self.navigationController.x_pos_mm,'y_mm':self.navigationController.y_pos_mm,'z_mm':self.navigationController.z_pos_mm,
+                                        'configuration':config.name,'exposure_time_ms':config.exposure_time,'analog_gain':config.analog_gain,
+                                        'illumination_source':config.illumination_source,'illumination_intensity':config.illumination_intensity,
+                                        'timestamp':timestamp}
+                            self.image_writer.save_plane(self._get_stack_path(current_path,i,j),image,metadata)
+                        else:
+                            saving_path = os.path.join(current_path, file_ID + str(config.name) + '.' + Acquisition.IMAGE_FORMAT)
+                            if self.camera.is_color:
+                                image = cv2.cvtColor(image,cv2.COLOR_RGB2BGR)
+                            self.image_writer.save_image(saving_path,image)
                         QApplication.processEvents()
                     
                     # QApplication.processEvents()
@@ -905,14 +1223,17 @@ class MultiPointWorker(QObject):
                     if self.NZ > 1:
                         # move z
                         if k < self.NZ - 1:
-                            self.navigationController.move_z_usteps(self.deltaZ_usteps)
-                            self.wait_till_operation_is_completed()
+                            future = self.navigationController.move_z_usteps(self.deltaZ_usteps)
+                            self.wait_till_operation_is_completed(future)
                             time.sleep(SCAN_STABILIZATION_TIME_MS_Z/1000)
                 
                 if self.NZ > 1:
                     # move z back
-                    self.navigationController.move_z_usteps(-self.deltaZ_usteps*(self.NZ-1))
-                    self.wait_till_operation_is_completed()
+                    future = self.navigationController.move_z_usteps(-self.deltaZ_usteps*(self.NZ-1))
+                    self.wait_till_operation_is_completed(future)
+
+                if self.image_writer.save_as_tiff_stack and not MULTIPOINT.STACK_PER_TIME_POINT:
+                    self.image_writer.close_stack(self._get_stack_path(current_path,i,j))
 
                 # update FOV counter
                 self.FOV_counter = self.FOV_counter + 1
@@ -920,29 +1241,37 @@ class MultiPointWorker(QObject):
                 if self.NX > 1:
                     # move x
                     if j < self.NX - 1:
-                        self.navigationController.move_x_usteps(self.deltaX_usteps)
-                        self.wait_till_operation_is_completed()
+                        future = self.navigationController.move_x_usteps(self.deltaX_usteps)
+                        self.wait_till_operation_is_completed(future)
                         time.sleep(SCAN_STABILIZATION_TIME_MS_X/1000)
 
             if self.NX > 1:
                 # move x back
-                self.navigationController.move_x_usteps(-self.deltaX_usteps*(self.NX-1))
-                self.wait_till_operation_is_completed()
+                future = self.navigationController.move_x_usteps(-self.deltaX_usteps*(self.NX-1))
+                self.wait_till_operation_is_completed(future)
                 time.sleep(SCAN_STABILIZATION_TIME_MS_X/1000)
 
             if self.NY > 1:
                 # move y
                 if i < self.NY - 1:
-                    self.navigationController.move_y_usteps(self.deltaY_usteps)
-                    self.wait_till_operation_is_completed()
+                    future = self.navigationController.move_y_usteps(self.deltaY_usteps)
+                    self.wait_till_operation_is_completed(future)
                     time.sleep(SCAN_STABILIZATION_TIME_MS_Y/1000)
 
         if self.NY > 1:
             # move y back
-            self.navigationController.move_y_usteps(-self.deltaY_usteps*(self.NY-1))
-            self.wait_till_operation_is_completed()
+            future = self.navigationController.move_y_usteps(-self.deltaY_usteps*(self.NY-1))
+            self.wait_till_operation_is_completed(future)
             time.sleep(SCAN_STABILIZATION_TIME_MS_Y/1000)
 
+        if self.image_writer.save_as_tiff_stack and MULTIPOINT.STACK_PER_TIME_POINT:
+            self.image_writer.close_stack(self._get_stack_path(current_path,None,None))
+
+    def _get_stack_path(self,current_path,i,j):
+        if MULTIPOINT.STACK_PER_TIME_POINT:
+            return os.path.join(current_path,str(self.time_point) + '.tiff')
+        return os.path.join(current_path,str(i) + '_' + str(j) + '.tiff')
+
 class MultiPointController(QObject):
 
     acquisitionFinished = Signal()
@@ -1106,6 +1435,8 @@ class TrackingController(QObject):
     image_to_display = Signal(np.ndarray)
     image_to_display_multi = Signal(np.ndarray,int)
     signal_current_configuration = Signal(Configuration)
+    signal_bounding_box = Signal(object)
+    signal_centroid = Signal(object)
 
     def __init__(self,camera,microcontroller,navigationController,configurationManager,liveController,autofocusController,imageDisplayWindow):
         QObject.__init__(self)
@@ -1140,6 +1471,13 @@ class TrackingController(QObject):
         self.pixel_size_um = None
         self.objective = None
 
+        # optional - run the tracker in a worker process (see control/offload.py)
+        self.offload_executor = None
+
+    def set_offload_executor(self,offload_executor):
+        offload_executor.register('track_object',offload.track_object)
+        self.offload_executor = offload_executor
+
     def start_tracking(self):
         
         # save pre-tracking configuration
@@ -1164,6 +1502,7 @@ class TrackingController(QObject):
 
         # hide roi selector
         self.imageDisplayWindow.hide_ROI_selector()
+        self.imageDisplayWindow.clear_overlay()
 
         # run tracking
         self.flag_stop_tracking_requested = False
@@ -1188,6 +1527,8 @@ class TrackingController(QObject):
         self.trackingWorker.finished.connect(self.thread.quit)
         self.trackingWorker.image_to_display.connect(self.slot_image_to_display)
         self.trackingWorker.image_to_display_multi.connect(self.slot_image_to_display_multi)
+        self.trackingWorker.signal_bounding_box.connect(self.slot_bounding_box)
+        self.trackingWorker.signal_centroid.connect(self.slot_centroid)
         self.trackingWorker.signal_current_configuration.connect(self.slot_current_configuration,type=Qt.BlockingQueuedConnection)
         # self.thread.finished.connect(self.thread.deleteLater)
         self.thread.finished.connect(self.thread.quit)
@@ -1259,6 +1600,12 @@ class TrackingController(QObject):
     def slot_image_to_display_multi(self,image,illumination_source):
         self.image_to_display_multi.emit(image,illumination_source)
 
+    def slot_bounding_box(self,rect_pts):
+        self.signal_bounding_box.emit(rect_pts)
+
+    def slot_centroid(self,centroid):
+        self.signal_centroid.emit(centroid)
+
     def slot_current_configuration(self,configuration):
         self.signal_current_configuration.emit(configuration)
 
@@ -1317,6 +1664,8 @@ class TrackingWorker(QObject):
 
     finished = Signal()
     image_to_display = Signal(np.ndarray)
+    signal_bounding_box = Signal(object)
+    signal_centroid = Signal(object)
     image_to_display_multi = Signal(np.ndarray,int)
     signal_current_configuration = Signal(Configuration)
 
@@ -1339,6 +1688,8 @@ class TrackingWorker(QObject):
         self.base_path = self.trackingController.base_path
         self.selected_configurations = self.trackingController.selected_configurations
         self.tracker = trackingController.tracker
+        self.offload_executor = trackingController.offload_executor
+        self.frame_transform = utils.FrameTransform(self.crop_width,self.crop_height,ROTATE_IMAGE_ANGLE,FLIP_IMAGE)
         
         self.number_of_selected_configurations = len(self.selected_configurations)
 
@@ -1349,8 +1700,21 @@ class TrackingWorker(QObject):
         # self.flag_stop_tracking_requested = False
 
         self.image_saver = ImageSaver_Tracking(base_path=os.path.join(self.base_path,self.experiment_ID),image_format='bmp')
+        self.csv_file = None
 
     def run(self):
+        try:
+            self.run_tracking()
+        except Exception as e:
+            print('tracking failed: ' + str(e))
+        finally:
+            # tracking terminated
+            if self.csv_file is not None:
+                self.csv_file.close()
+            self.image_saver.close()
+            self.finished.emit()
+
+    def run_tracking(self):
 
         tracking_frame_counter = 0
         t0 = time.time()
@@ -1397,11 +1761,6 @@ class TrackingWorker(QObject):
                 self.autofocusController.wait_till_autofocus_has_completed()
                 print('>>> autofocus completed')
 
-            # get current position
-            x_stage = self.navigationController.x_pos_mm
-            y_stage = self.navigationController.y_pos_mm
-            z_stage = self.navigationController.z_pos_mm
-
             # grab an image
             config = self.selected_configurations[0]
             if(self.number_of_selected_configurations > 1):
@@ -1410,14 +1769,15 @@ class TrackingWorker(QObject):
                 self.liveController.turn_on_illumination()        # keep illumination on for single configuration acqusition
                 self.wait_till_operation_is_completed()
             t = time.time()
+            t_trigger = time.monotonic()
             self.camera.send_trigger() 
             image = self.camera.read_frame()
             if(self.number_of_selected_configurations > 1):
                 self.liveController.turn_off_illumination()       # keep illumination on for single configuration acqusition
+            # stage position in the middle of the exposure
+            [x_stage,y_stage,z_stage] = self.navigationController.get_pos_mm_at(t_trigger + self.camera.exposure_time/2000)
             # image crop, rotation and flip
-            image = utils.crop_image(image,self.crop_width,self.crop_height)
-            image = np.squeeze(image)
-            image = utils.rotate_and_flip_image(image,rotate_image_angle=ROTATE_IMAGE_ANGLE,flip_image=FLIP_IMAGE)
+            image = self.frame_transform.apply(image)
             # get image size
             image_shape = image.shape
             image_center = np.array([image_shape[1]*0.5,image_shape[0]*0.5])
@@ -1431,9 +1791,7 @@ class TrackingWorker(QObject):
                 self.camera.send_trigger() 
                 image_ = self.camera.read_frame()
                 self.liveController.turn_off_illumination()
-                image_ = utils.crop_image(image_,self.crop_width,self.crop_height)
-                image_ = np.squeeze(image_)
-                image_ = utils.rotate_and_flip_image(image_,rotate_image_angle=ROTATE_IMAGE_ANGLE,flip_image=FLIP_IMAGE)
+                image_ = self.frame_transform.apply(image_)
                 # display image
                 # self.image_to_display.emit(cv2.resize(image,(round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)),cv2.INTER_LINEAR))
                 image_to_display_ = utils.crop_image(image_,round(self.crop_width*self.liveController.display_resolution_scaling), round(self.crop_height*self.liveController.display_resolution_scaling))
@@ -1446,7 +1804,10 @@ class TrackingWorker(QObject):
                     self.image_saver.enqueue(image_,tracking_frame_counter,str(config_.name))
 
             # track
-            objectFound,centroid,rect_pts = self.tracker.track(image, None, is_first_frame = is_first_frame)
+            if self.offload_executor is None:
+                objectFound,centroid,rect_pts = self.tracker.track(image, None, is_first_frame = is_first_frame)
+            else:
+                objectFound,centroid,rect_pts = self.offload_executor.run('track_object',[image],(is_first_frame,self.tracker.tracker_type,self.tracker.init_method,self.tracker.roi_bbox,self.tracker.searchArea),key='tracker')
             if objectFound == False:
                 print('')
                 break
@@ -1455,16 +1816,19 @@ class TrackingWorker(QObject):
             x_error_mm = in_plane_position_error_mm[0]
             y_error_mm = in_plane_position_error_mm[1]
 
-            # display the new bounding box and the image
-            self.imageDisplayWindow.update_bounding_box(rect_pts)
-            self.imageDisplayWindow.display_image(image)
+            # display the new bounding box and the image - drawn as an overlay in the GUI thread
+            self.signal_bounding_box.emit(rect_pts)
+            self.signal_centroid.emit(centroid)
+            self.image_to_display.emit(image)
 
             # move
             if self.trackingController.flag_stage_tracking_enabled:
                 x_correction_usteps = int(x_error_mm/(SCREW_PITCH_X_MM/FULLSTEPS_PER_REV_X/self.navigationController.x_microstepping))
                 y_correction_usteps = int(y_error_mm/(SCREW_PITCH_Y_MM/FULLSTEPS_PER_REV_Y/self.navigationController.y_microstepping))
-                self.microcontroller.move_x_usteps(TRACKING_MOVEMENT_SIGN_X*x_correction_usteps)
-                self.microcontroller.move_y_usteps(TRACKING_MOVEMENT_SIGN_Y*y_correction_usteps) 
+                move_futures = [self.microcontroller.move_x_usteps(TRACKING_MOVEMENT_SIGN_X*x_correction_usteps),
+                                self.microcontroller.move_y_usteps(TRACKING_MOVEMENT_SIGN_Y*y_correction_usteps)]
+            else:
+                move_futures = []
 
             # save image
             if self.trackingController.flag_save_image:
@@ -1476,28 +1840,25 @@ class TrackingWorker(QObject):
             if tracking_frame_counter%100 == 0:
                 self.csv_file.flush()
 
-            # wait for movement to complete
-            self.wait_till_operation_is_completed() # to do - make sure both x movement and y movement are complete
+            # wait for both the x and the y movement to complete
+            self.wait_till_operation_is_completed(*move_futures)
 
             # wait till tracking interval has elapsed
-            while(time.time() - timestamp_last_frame < self.trackingController.tracking_time_interval_s):
-                time.sleep(0.005)
+            time.sleep(max(timestamp_last_frame + self.trackingController.tracking_time_interval_s - time.time(),0))
 
             # increament counter 
             tracking_frame_counter = tracking_frame_counter + 1
 
-        # tracking terminated
-        self.csv_file.close()
-        self.image_saver.close()
-        self.finished.emit()
-
-    def wait_till_operation_is_completed(self):
-        while self.microcontroller.is_busy():
-            time.sleep(SLEEP_TIME_S)
+    def wait_till_operation_is_completed(self,*futures):
+        # waits for the given mcu commands, or for the last command that was sent
+        self.microcontroller.wait_till_operation_is_completed(*futures)
 
 
 class ImageDisplayWindow(QMainWindow):
 
+    # visible region in frame pixels (x_min, x_max, y_min, y_max) and the size of the view on screen (width, height)
+    signal_viewport_changed = Signal(float,float,float,float,int,int)
+
     def __init__(self, window_title='', draw_crosshairs = False, invertX=False):
         super().__init__()
         self.setWindowTitle(window_title)
@@ -1517,6 +1878,9 @@ class ImageDisplayWindow(QMainWindow):
         ## Create image item
         self.graphics_widget.img = pg.ImageItem(border='w')
         self.graphics_widget.view.addItem(self.graphics_widget.img)
+        self.frame_size = None
+        self.graphics_widget.view.sigRangeChanged.connect(self.report_viewport)
+        self.graphics_widget.view.sigResized.connect(self.report_viewport)
 
         ## Create ROI
         self.roi_pos = (500,500)
@@ -1531,14 +1895,19 @@ class ImageDisplayWindow(QMainWindow):
         self.roi_pos = self.ROI.pos()
         self.roi_size = self.ROI.size()
 
-        ## Variables for annotating images
-        self.draw_rectangle = False
-        self.ptRect1 = None
-        self.ptRect2 = None
-        self.DrawCirc = False
-        self.centroid = None
-        self.DrawCrossHairs = False
-        self.image_offset = np.array([0, 0])
+        ## Annotation overlay - vector items on top of the image, in frame pixels, so that annotating never touches the frame
+        pen = pg.mkPen((255,255,255),width=2)
+        self.bounding_box = pg.PlotCurveItem(pen=pen)
+        self.track_trail = pg.PlotCurveItem(pen=pg.mkPen((255,255,0),width=1))
+        self.centroid_marker = pg.ScatterPlotItem(size=12,symbol='+',pen=pen,brush=pg.mkBrush(255,255,255))
+        self.crosshair_h = pg.InfiniteLine(angle=0,movable=False,pen=pg.mkPen((255,0,0),width=1))
+        self.crosshair_v = pg.InfiniteLine(angle=90,movable=False,pen=pg.mkPen((255,0,0),width=1))
+        for item in [self.bounding_box,self.track_trail,self.centroid_marker,self.crosshair_h,self.crosshair_v]:
+            item.setZValue(5)
+            self.graphics_widget.view.addItem(item)
+        self.crosshair_h.setVisible(draw_crosshairs)
+        self.crosshair_v.setVisible(draw_crosshairs)
+        self.trail = deque(maxlen=DISPLAY.TRACK_TRAIL_LENGTH)
 
         ## Layout
         layout = QGridLayout()
@@ -1552,17 +1921,25 @@ class ImageDisplayWindow(QMainWindow):
         height = width
         self.setFixedSize(width,height)
 
-    def display_image(self,image):
-        if ENABLE_TRACKING:
-            image = np.copy(image)
-            self.image_height = image.shape[0],
-            self.image_width = image.shape[1]
-            if(self.draw_rectangle):
-                cv2.rectangle(image, self.ptRect1, self.ptRect2,(255,255,255) , 4)
-                self.draw_rectangle = False
-            self.graphics_widget.img.setImage(image,autoLevels=False)
-        else:
-            self.graphics_widget.img.setImage(image,autoLevels=False)
+    def display_image(self,image,rect=None):
+        self.graphics_widget.img.setImage(image,autoLevels=False)
+        # place the (possibly resampled) image on the part of the frame it covers, so that zoom and pan stay in frame pixels
+        if rect is None:
+            rect = [0,0,image.shape[1],image.shape[0],image.shape[1],image.shape[0]]
+        [x,y,width,height,frame_width,frame_height] = rect
+        self.graphics_widget.img.setRect(QRectF(x,y,width,height))
+        if self.frame_size != (frame_width,frame_height):
+            # new frame size - show the whole frame; from here on the range only changes when the user zooms or pans
+            self.frame_size = (frame_width,frame_height)
+            self.graphics_widget.view.setRange(QRectF(0,0,frame_width,frame_height),padding=0)
+            self.crosshair_h.setPos(frame_height/2)
+            self.crosshair_v.setPos(frame_width/2)
+
+    def report_viewport(self):
+        [[x_min,x_max],[y_min,y_max]] = self.graphics_widget.view.viewRange()
+        width = int(self.graphics_widget.view.width())
+        height = int(self.graphics_widget.view.height())
+        self.signal_viewport_changed.emit(x_min,x_max,y_min,y_max,width,height)
        
     def update_ROI(self):
         self.roi_pos = self.ROI.pos()
@@ -1578,9 +1955,20 @@ class ImageDisplayWindow(QMainWindow):
         return self.roi_pos,self.roi_size
 
     def update_bounding_box(self,pts):
-        self.draw_rectangle=True
-        self.ptRect1=(pts[0][0],pts[0][1])
-        self.ptRect2=(pts[1][0],pts[1][1])
+        # pts: two opposite corners, in frame pixels
+        [[x1,y1],[x2,y2]] = [pts[0][:2],pts[1][:2]]
+        self.bounding_box.setData([x1,x2,x2,x1,x1],[y1,y1,y2,y2,y1])
+
+    def update_centroid(self,centroid):
+        self.centroid_marker.setData([centroid[0]],[centroid[1]])
+        self.trail.append((centroid[0],centroid[1]))
+        self.track_trail.setData([p[0] for p in self.trail],[p[1] for p in self.trail])
+
+    def clear_overlay(self):
+        self.trail.clear()
+        self.bounding_box.setData([],[])
+        self.track_trail.setData([],[])
+        self.centroid_marker.setData([],[])
 
     def get_roi_bounding_box(self):
         self.update_ROI()
@@ -1592,7 +1980,11 @@ class ImageDisplayWindow(QMainWindow):
 
 class ImageArrayDisplayWindow(QMainWindow):
 
-    def __init__(self, window_title=''):
+    # shows any number of channels (or planes) as one RGB composite - tiled side by side, or overlaid in their channel colors.
+    # display_image() only downsamples the new image and converts it to 8 bit; the composite is assembled and uploaded
+    # with a single setImage() at most once per screen refresh, and the view range only changes when the composite size does
+
+    def __init__(self, window_title='', mode=DISPLAY.COMPOSITE_MODE, channel_colors=DISPLAY.CHANNEL_COLORS, refresh_rate=DISPLAY.REFRESH_RATE_HZ):
         super().__init__()
         self.setWindowTitle(window_title)
         self.setWindowFlags(self.windowFlags() | Qt.CustomizeWindowHint)
@@ -1602,36 +1994,29 @@ class ImageArrayDisplayWindow(QMainWindow):
         # interpret image data as row-major instead of col-major
         pg.setConfigOptions(imageAxisOrder='row-major')
 
-        self.graphics_widget_1 = pg.GraphicsLayoutWidget()
-        self.graphics_widget_1.view = self.graphics_widget_1.addViewBox()
-        self.graphics_widget_1.view.setAspectLocked(True)
-        self.graphics_widget_1.img = pg.ImageItem(border='w')
-        self.graphics_widget_1.view.addItem(self.graphics_widget_1.img)
-
-        self.graphics_widget_2 = pg.GraphicsLayoutWidget()
-        self.graphics_widget_2.view = self.graphics_widget_2.addViewBox()
-        self.graphics_widget_2.view.setAspectLocked(True)
-        self.graphics_widget_2.img = pg.ImageItem(border='w')
-        self.graphics_widget_2.view.addItem(self.graphics_widget_2.img)
-
-        self.graphics_widget_3 = pg.GraphicsLayoutWidget()
-        self.graphics_widget_3.view = self.graphics_widget_3.addViewBox()
-        self.graphics_widget_3.view.setAspectLocked(True)
-        self.graphics_widget_3.img = pg.ImageItem(border='w')
-        self.graphics_widget_3.view.addItem(self.graphics_widget_3.img)
-
-        self.graphics_widget_4 = pg.GraphicsLayoutWidget()
-        self.graphics_widget_4.view = self.graphics_widget_4.addViewBox()
-        self.graphics_widget_4.view.setAspectLocked(True)
-        self.graphics_widget_4.img = pg.ImageItem(border='w')
-        self.graphics_widget_4.view.addItem(self.graphics_widget_4.img)
+        self.graphics_widget = pg.GraphicsLayoutWidget()
+        self.graphics_widget.view = self.graphics_widget.addViewBox()
+        self.graphics_widget.view.setAspectLocked(True)
+        self.graphics_widget.img = pg.ImageItem(border='w')
+        self.graphics_widget.view.addItem(self.graphics_widget.img)
+
+        self.dropdown_mode = QComboBox()
+        self.dropdown_mode.addItems(['tiled','overlay'])
+        self.dropdown_mode.setCurrentText(mode)
+        self.dropdown_mode.currentTextChanged.connect(self.set_mode)
+
+        self.mode = mode
+        self.channel_colors = channel_colors
+        self.channels = {} # channel: 8 bit image, downsampled to at most DISPLAY.COMPOSITE_SIZE_PX
+        self.display_luts = {} # channel: utils.DisplayLUT, for 16 bit images
+        self.color_tables = {} # channel: 256 x 3 table from gray level to RGB
+        self.composite = None
+        self.composite_is_outdated = False
 
         ## Layout
         layout = QGridLayout()
-        layout.addWidget(self.graphics_widget_1, 0, 0)
-        layout.addWidget(self.graphics_widget_2, 0, 1)
-        layout.addWidget(self.graphics_widget_3, 1, 0)
-        layout.addWidget(self.graphics_widget_4, 1, 1) 
+        layout.addWidget(self.dropdown_mode, 0, 0)
+        layout.addWidget(self.graphics_widget, 1, 0)
         self.widget.setLayout(layout)
         self.setCentralWidget(self.widget)
 
@@ -1641,15 +2026,90 @@ class ImageArrayDisplayWindow(QMainWindow):
         height = width
         self.setFixedSize(width,height)
 
-    def display_image(self,image,illumination_source):
-        if illumination_source < 11:
-            self.graphics_widget_1.img.setImage(image,autoLevels=False)
-        elif illumination_source == 11:
-            self.graphics_widget_2.img.setImage(image,autoLevels=False)
-        elif illumination_source == 12:
-            self.graphics_widget_3.img.setImage(image,autoLevels=False)
-        elif illumination_source == 13:
-            self.graphics_widget_4.img.setImage(image,autoLevels=False)
+        if refresh_rate is None:
+            try:
+                refresh_rate = QApplication.primaryScreen().refreshRate()
+            except:
+                refresh_rate = 60
+        self.timer_update = QTimer()
+        self.timer_update.setInterval(int(1000/max(refresh_rate,1)))
+        self.timer_update.timeout.connect(self.update_composite)
+        self.timer_update.start()
+
+    def display_image(self,image,channel):
+        # channel: illumination source for multipoint acquisitions, plane index for volumetric imaging
+        image = np.squeeze(image)
+        factor = max(image.shape[0],image.shape[1])/DISPLAY.COMPOSITE_SIZE_PX
+        if factor > 1:
+            image = cv2.resize(image,(max(round(image.shape[1]/factor),1),max(round(image.shape[0]/factor),1)),interpolation=cv2.INTER_AREA)
+        if image.dtype == np.uint16:
+            if channel not in self.display_luts:
+                self.display_luts[channel] = utils.DisplayLUT(gamma=DISPLAY.GAMMA,auto_contrast=DISPLAY.AUTO_CONTRAST,percentiles=DISPLAY.AUTO_CONTRAST_PERCENTILES)
+            image = self.display_luts[channel].apply(image)
+        elif image.dtype != np.uint8:
+            image = np.clip(image,0,255).astype(np.uint8)
+        self.channels[channel] = image
+        self.composite_is_outdated = True
+
+    def set_mode(self,mode):
+        self.mode = mode
+        self.composite_is_outdated = True
+
+    def clear(self):
+        self.channels = {}
+        self.composite_is_outdated = True
+
+    def _to_rgb(self,channel,image):
+        if image.ndim == 3:
+            return image
+        if channel not in self.color_tables:
+            color = np.array(self.channel_colors.get(channel,(255,255,255)),dtype=np.float32)/255
+            self.color_tables[channel] = (np.arange(256,dtype=np.float32)[:,None]*color + 0.5).astype(np.uint8)
+        return self.color_tables[channel][image]
+
+    def _get_composite(self,height,width):
+        # reused between updates of the same size
+        if self.composite is None or self.composite.shape[:2] != (height,width):
+            self.composite = np.zeros((height,width,3),dtype=np.uint8)
+        else:
+            self.composite.fill(0)
+        return self.composite
+
+    def update_composite(self):
+        if not self.composite_is_outdated or not self.channels:
+            return
+        self.composite_is_outdated = False
+        channels = sorted(self.channels.keys())
+        previous_shape = None if self.composite is None else self.composite.shape
+        if self.mode == 'overlay':
+            height = max(self.channels[channel].shape[0] for channel in channels)
+            width = max(self.channels[channel].shape[1] for channel in channels)
+            composite = self._get_composite(height,width)
+            for channel in channels:
+                image = self._to_rgb(channel,self.channels[channel])
+                region = composite[:image.shape[0],:image.shape[1]]
+                cv2.add(region,image,dst=region)
+        else:
+            num_columns = int(math.ceil(math.sqrt(len(channels))))
+            num_rows = int(math.ceil(len(channels)/num_columns))
+            tile_size = DISPLAY.COMPOSITE_SIZE_PX//num_columns
+            composite = self._get_composite(num_rows*tile_size,num_columns*tile_size)
+            for n,channel in enumerate(channels):
+                image = self.channels[channel]
+                factor = max(image.shape[0],image.shape[1])/tile_size
+                if factor > 1:
+                    image = cv2.resize(image,(max(int(image.shape[1]/factor),1),max(int(image.shape[0]/factor),1)),interpolation=cv2.INTER_AREA)
+                image = self._to_rgb(channel,image)
+                y = (n//num_columns)*tile_size
+                x = (n%num_columns)*tile_size
+                composite[y:y+image.shape[0],x:x+image.shape[1]] = image
+        self.graphics_widget.img.setImage(composite,autoLevels=False,levels=(0,255))
+        if previous_shape != composite.shape:
+            self.graphics_widget.view.autoRange(padding=0)
+
+    def closeEvent(self, event):
+        self.timer_update.stop()
+        event.accept()
 
 class ConfigurationManager(QObject):
     def __init__(self,filename=str(Path.home()) + "/configurations_default.xml"):
@@ -1706,72 +2166,61 @@ class PlateReaderNavigationController(QObject):
         self.column = ''
         self.row = ''
 
-        # to be moved to gui for transparency
-        self.microcontroller.set_callback(self.update_pos)
+        self.microcontroller.telemetry_bus.subscribe(self.update_pos,max_rate_hz=STAGE_TELEMETRY.GUI_UPDATE_RATE_HZ)
 
         self.is_homing = False
         self.is_scanning = False
 
     def move_x_usteps(self,usteps):
-        self.microcontroller.move_x_usteps(usteps)
+        return self.microcontroller.move_x_usteps(usteps)
 
     def move_y_usteps(self,usteps):
-        self.microcontroller.move_y_usteps(usteps)
+        return self.microcontroller.move_y_usteps(usteps)
 
     def move_z_usteps(self,usteps):
-        self.microcontroller.move_z_usteps(usteps)
+        return self.microcontroller.move_z_usteps(usteps)
 
     def move_x_to_usteps(self,usteps):
-        self.microcontroller.move_x_to_usteps(usteps)
+        return self.microcontroller.move_x_to_usteps(usteps)
 
     def move_y_to_usteps(self,usteps):
-        self.microcontroller.move_y_to_usteps(usteps)
+        return self.microcontroller.move_y_to_usteps(usteps)
 
     def move_z_to_usteps(self,usteps):
-        self.microcontroller.move_z_to_usteps(usteps)
+        return self.microcontroller.move_z_to_usteps(usteps)
 
     def moveto(self,column,row):
+        futures = []
         if column != '':
             mm_per_ustep_X = SCREW_PITCH_X_MM/(self.x_microstepping*FULLSTEPS_PER_REV_X)
             x_mm = PLATE_READER.OFFSET_COLUMN_1_MM + (int(column)-1)*PLATE_READER.COLUMN_SPACING_MM
             x_usteps = round(x_mm/mm_per_ustep_X)
-            self.move_x_to_usteps(x_usteps)
+            futures.append(self.move_x_to_usteps(x_usteps))
         if row != '':
             mm_per_ustep_Y = SCREW_PITCH_Y_MM/(self.y_microstepping*FULLSTEPS_PER_REV_Y)
             y_mm = PLATE_READER.OFFSET_ROW_A_MM + (ord(row) - ord('A'))*PLATE_READER.ROW_SPACING_MM
             y_usteps = round(y_mm/mm_per_ustep_Y)
-            self.move_y_to_usteps(y_usteps)
+            futures.append(self.move_y_to_usteps(y_usteps))
+        return futures
 
     def moveto_row(self,row):
         # row: int, starting from 0
         mm_per_ustep_Y = SCREW_PITCH_Y_MM/(self.y_microstepping*FULLSTEPS_PER_REV_Y)
         y_mm = PLATE_READER.OFFSET_ROW_A_MM + row*PLATE_READER.ROW_SPACING_MM
         y_usteps = round(y_mm/mm_per_ustep_Y)
-        self.move_y_to_usteps(y_usteps)
+        return self.move_y_to_usteps(y_usteps)
 
     def moveto_column(self,column):
         # column: int, starting from 0
         mm_per_ustep_X = SCREW_PITCH_X_MM/(self.x_microstepping*FULLSTEPS_PER_REV_X)
         x_mm = PLATE_READER.OFFSET_COLUMN_1_MM + column*PLATE_READER.COLUMN_SPACING_MM
         x_usteps = round(x_mm/mm_per_ustep_X)
-        self.move_x_to_usteps(x_usteps)
-
-    def update_pos(self,microcontroller):
-        # get position from the microcontroller
-        x_pos, y_pos, z_pos, theta_pos = microcontroller.get_pos()
-        # calculate position in mm or rad
-        if USE_ENCODER_X:
-            self.x_pos_mm = x_pos*STAGE_POS_SIGN_X*ENCODER_STEP_SIZE_X_MM
-        else:
-            self.x_pos_mm = x_pos*STAGE_POS_SIGN_X*(SCREW_PITCH_X_MM/(self.x_microstepping*FULLSTEPS_PER_REV_X))
-        if USE_ENCODER_Y:
-            self.y_pos_mm = y_pos*STAGE_POS_SIGN_Y*ENCODER_STEP_SIZE_Y_MM
-        else:
-            self.y_pos_mm = y_pos*STAGE_POS_SIGN_Y*(SCREW_PITCH_Y_MM/(self.y_microstepping*FULLSTEPS_PER_REV_Y))
-        if USE_ENCODER_Z:
-            self.z_pos_mm = z_pos*STAGE_POS_SIGN_Z*ENCODER_STEP_SIZE_Z_MM
-        else:
-            self.z_pos_mm = z_pos*STAGE_POS_SIGN_Z*(SCREW_PITCH_Z_MM/(self.z_microstepping*FULLSTEPS_PER_REV_Z))
+        return self.move_x_to_usteps(x_usteps)
+
+    def update_pos(self,state):
+        self.x_pos_mm = state.x_mm
+        self.y_pos_mm = state.y_mm
+        self.z_pos_mm = state.z_mm
         # check homing status
         if self.is_homing and self.microcontroller.mcu_cmd_execution_in_progress == False:
             self.signal_homing_complete.emit()
@@ -1794,10 +2243,10 @@ class PlateReaderNavigationController(QObject):
 
     def home(self):
         self.is_homing = True
-        self.microcontroller.home_xy()
+        return self.microcontroller.home_xy()
 
     def home_x(self):
-        self.microcontroller.home_x()
+        return self.microcontroller.home_x()
 
     def home_y(self):
-        self.microcontroller.home_y()
+        return self.microcontroller.home_y()
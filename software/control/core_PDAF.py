@@ -12,6 +12,7 @@ import control.utils as utils
 from control._def import *
 from control.core import *
 import control.tracking as tracking
+import control.offload as offload
 
 from queue import Queue
 from threading import Thread, Lock
@@ -30,7 +31,7 @@ class PDAFController(QObject):
     # input: from internal_states shared variables
     # output: amount of defocus, which may be read by or emitted to focusTrackingController (that manages focus tracking on/off, PID coefficients)
 
-    def __init__(self,internal_states):
+    def __init__(self,internal_states,offload_executor=None):
         QObject.__init__(self)
         self.coefficient_shift2defocus = 1
         self.registration_upsample_factor = 5
@@ -38,6 +39,10 @@ class PDAFController(QObject):
         self.image2_received = False
         self.locked = False
         self.shared_variables = internal_states
+        # optional - compute the phase correlation in a worker process, the result arrives asynchronously
+        self.offload_executor = offload_executor
+        if self.offload_executor is not None:
+            self.offload_executor.register('phase_correlation_shift',offload.phase_correlation_shift)
 
     def register_image_from_camera_1(self,image):
         if(self.locked==True):
@@ -66,7 +71,24 @@ class PDAFController(QObject):
         # crop
         self.image1 = self.image1[(self.y-int(self.h/2)):(self.y+int(self.h/2)),(self.x-int(self.w/2)):(self.x+int(self.w/2))]
         self.image2 = self.image2[(self.y-int(self.h/2)):(self.y+int(self.h/2)),(self.x-int(self.w/2)):(self.x+int(self.w/2))] # additional offsets may need to be added
+        if self.offload_executor is not None:
+            task_id = self.offload_executor.submit('phase_correlation_shift',[self.image1,self.image2],(self.registration_upsample_factor,),callback=self._on_shifts_computed,error_callback=self._on_shift_computation_failed)
+            if task_id is not None:
+                return
+            # no free slot - compute the shift here
         shift = self._compute_shift_from_image_pair()
+        self._on_defocus_computed(shift)
+
+    def _on_shifts_computed(self,shifts):
+        self._on_defocus_computed(shifts[0]) # can be shifts[1] - depending on camera orientation
+
+    def _on_shift_computation_failed(self,error):
+        # drop this image pair
+        self.image1_received = False
+        self.image2_received = False
+        self.locked = False
+
+    def _on_defocus_computed(self,shift):
         self.defocus = shift*self.coefficient_shift2defocus
         self.image1_received = False
         self.image2_received = False
@@ -164,6 +186,10 @@ class TwoCamerasPDAFCalibrationController(QObject):
         for configuration_name in selected_configurations_name:
             self.selected_configurations.append(next((config for config in self.configurationManager.configurations if config.name == configuration_name)))
         
+    def wait_till_operation_is_completed(self,*futures):
+        # waits for the given mcu commands, or for the last command that was sent
+        self.navigationController.microcontroller.wait_till_operation_is_completed(*futures)
+
     def run_acquisition(self): # @@@ to do: change name to run_experiment
         print('start multipoint')
         
@@ -277,7 +303,9 @@ class TwoCamerasPDAFCalibrationController(QObject):
                 QApplication.processEvents()
             # move z
             if k < self.NZ - 1:
-                self.navigationController.move_z_usteps(self.deltaZ_usteps)
+                future = self.navigationController.move_z_usteps(self.deltaZ_usteps)
+                self.wait_till_operation_is_completed(future)
         
         # move z back
-        self.navigationController.move_z_usteps(-self.deltaZ_usteps*(self.NZ-1))
\ No newline at end of file
+        future = self.navigationController.move_z_usteps(-self.deltaZ_usteps*(self.NZ-1))
+        self.wait_till_operation_is_completed(future)
\ No newline at end of file
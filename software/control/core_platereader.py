@@ -71,30 +71,33 @@ class PlateReadingWorker(QObject):
     def run(self):
         self.abort_acquisition_requested = False
         self.plateReaderNavigationController.is_scanning = True
-        while self.time_point < self.Nt and self.abort_acquisition_requested == False:
-            # continous acquisition
-            if self.dt == 0:
-                self.run_single_time_point()
-                self.time_point = self.time_point + 1
-            # timed acquisition
-            else:
-                self.run_single_time_point()
-                self.time_point = self.time_point + 1
-                # check if the aquisition has taken longer than dt or integer multiples of dt, if so skip the next time point(s)
-                while time.time() > self.timestamp_acquisition_started + self.time_point*self.dt:
-                    print('skip time point ' + str(self.time_point+1))
-                    self.time_point = self.time_point+1
-                if self.time_point == self.Nt:
-                    break # no waiting after taking the last time point
-                # wait until it's time to do the next acquisition
-                while time.time() < self.timestamp_acquisition_started + self.time_point*self.dt:
-                    time.sleep(0.05)
-        self.plateReaderNavigationController.is_scanning = False
-        self.finished.emit()
-
-    def wait_till_operation_is_completed(self):
-        while self.microcontroller.is_busy():
-            time.sleep(SLEEP_TIME_S)
+        try:
+            while self.time_point < self.Nt and self.abort_acquisition_requested == False:
+                # continous acquisition
+                if self.dt == 0:
+                    self.run_single_time_point()
+                    self.time_point = self.time_point + 1
+                # timed acquisition
+                else:
+                    self.run_single_time_point()
+                    self.time_point = self.time_point + 1
+                    # check if the aquisition has taken longer than dt or integer multiples of dt, if so skip the next time point(s)
+                    while time.time() > self.timestamp_acquisition_started + self.time_point*self.dt:
+                        print('skip time point ' + str(self.time_point+1))
+                        self.time_point = self.time_point+1
+                    if self.time_point == self.Nt:
+                        break # no waiting after taking the last time point
+                    # wait until it's time to do the next acquisition
+                    time.sleep(max(self.timestamp_acquisition_started + self.time_point*self.dt - time.time(),0))
+        except Exception as e:
+            print('plate reading failed at time point ' + str(self.time_point) + ': ' + str(e))
+        finally:
+            self.plateReaderNavigationController.is_scanning = False
+            self.finished.emit()
+
+    def wait_till_operation_is_completed(self,*futures):
+        # waits for the given mcu commands, or for the last command that was sent
+        self.microcontroller.wait_till_operation_is_completed(*futures)
 
     def run_single_time_point(self):
         self.FOV_counter = 0
@@ -106,8 +109,8 @@ class PlateReadingWorker(QObject):
         os.mkdir(current_path)
 
         # run homing
-        self.plateReaderNavigationController.home()
-        self.wait_till_operation_is_completed()
+        future = self.plateReaderNavigationController.home()
+        self.wait_till_operation_is_completed(future)
 
         # row scan direction
         row_scan_direction = 1 # 1: A -> H, 0: H -> A
@@ -119,14 +122,14 @@ class PlateReadingWorker(QObject):
             column_counter = column_counter + 1
             
             # move to the current column
-            self.plateReaderNavigationController.moveto_column(column-1)
-            self.wait_till_operation_is_completed()
+            future = self.plateReaderNavigationController.moveto_column(column-1)
+            self.wait_till_operation_is_completed(future)
             
             '''
             # row homing
             if column_counter > 1:
-                self.plateReaderNavigationController.home_y()
-                self.wait_till_operation_is_completed()
+                future = self.plateReaderNavigationController.home_y()
+                self.wait_till_operation_is_completed(future)
             '''
             
             # go through rows
@@ -139,8 +142,8 @@ class PlateReadingWorker(QObject):
                 file_ID = row_str + str(column)
 
                 # move to the selected row
-                self.plateReaderNavigationController.moveto_row(row)
-                self.wait_till_operation_is_completed()
+                future = self.plateReaderNavigationController.moveto_row(row)
+                self.wait_till_operation_is_completed(future)
                 time.sleep(SCAN_STABILIZATION_TIME_MS_Y/1000)
                 
                 # AF
@@ -158,10 +161,10 @@ class PlateReadingWorker(QObject):
                         # update file ID
                         file_ID = file_ID + '_' + str(k)
                         # maneuver for achiving uniform step size and repeatability when using open-loop control
-                        self.plateReaderNavigationController.move_z_usteps(80)
-                        self.wait_till_operation_is_completed()
-                        self.plateReaderNavigationController.move_z_usteps(-80)
-                        self.wait_till_operation_is_completed()
+                        future = self.plateReaderNavigationController.move_z_usteps(80)
+                        self.wait_till_operation_is_completed(future)
+                        future = self.plateReaderNavigationController.move_z_usteps(-80)
+                        self.wait_till_operation_is_completed(future)
                         time.sleep(SCAN_STABILIZATION_TIME_MS_Z/1000)
 
                     # iterate through selected modes
@@ -188,14 +191,14 @@ class PlateReadingWorker(QObject):
                     if(self.NZ > 1):
                         # move z
                         if k < self.NZ - 1:
-                            self.plateReaderNavigationController.move_z_usteps(self.deltaZ_usteps)
-                            self.wait_till_operation_is_completed()
+                            future = self.plateReaderNavigationController.move_z_usteps(self.deltaZ_usteps)
+                            self.wait_till_operation_is_completed(future)
                             time.sleep(SCAN_STABILIZATION_TIME_MS_Z/1000)
 
                 if self.NZ > 1:
                     # move z back
-                    self.plateReaderNavigationController.move_z_usteps(-self.deltaZ_usteps*(self.NZ-1))
-                    self.wait_till_operation_is_completed()
+                    future = self.plateReaderNavigationController.move_z_usteps(-self.deltaZ_usteps*(self.NZ-1))
+                    self.wait_till_operation_is_completed(future)
 
                 if self.abort_acquisition_requested:
                     return
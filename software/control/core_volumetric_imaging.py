@@ -11,6 +11,8 @@ from qtpy.QtGui import *
 import control.utils as utils
 from control._def import *
 import control.tracking as tracking
+import control.core as core
+import control.frame_pool as frame_pool
 
 from queue import Queue
 from threading import Thread, Lock
@@ -28,6 +30,8 @@ import control.utils_config as utils_config
 class StreamHandler(QObject):
 
     image_to_display = Signal(np.ndarray)
+    # frames emitted for writing and tracking may be views into the camera's frame pool -
+    # a reference is retained for every connected receiver, which calls frame_pool.release_frame() when done
     packet_image_to_write = Signal(np.ndarray, int, float)
     packet_image_for_tracking = Signal(np.ndarray, int, float)
     packet_image_for_array_display = Signal(np.ndarray, int)
@@ -105,71 +109,38 @@ class StreamHandler(QObject):
         time_now = time.time()
         if time_now-self.timestamp_last_display >= 1/self.fps_display:
             # self.image_to_display.emit(cv2.resize(image_cropped,(round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)),cv2.INTER_LINEAR))
-            self.image_to_display.emit(utils.crop_image(image_cropped,round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)))
+            self.image_to_display.emit(frame_pool.detach_frame(utils.crop_image(image_cropped,round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling))))
             self.timestamp_last_display = time_now
 
-        # send image to array display
-        self.packet_image_for_array_display.emit(image_cropped,(camera.frame_ID - camera.frame_ID_offset_hardware_trigger - 1) % VOLUMETRIC_IMAGING.NUM_PLANES_PER_VOLUME)
+        # send image to array display - the displays keep a reference for an unknown time, so they get a copy instead of a lease
+        self.packet_image_for_array_display.emit(frame_pool.detach_frame(image_cropped),(camera.frame_ID - camera.frame_ID_offset_hardware_trigger - 1) % VOLUMETRIC_IMAGING.NUM_PLANES_PER_VOLUME)
 
         # send image to write
         if self.save_image_flag and time_now-self.timestamp_last_save >= 1/self.fps_save:
             if camera.is_color:
                 image_cropped = cv2.cvtColor(image_cropped,cv2.COLOR_RGB2BGR)
-            self.packet_image_to_write.emit(image_cropped,camera.frame_ID,camera.timestamp)
+            self._emit_leased(self.packet_image_to_write,image_cropped,camera.frame_ID,camera.timestamp)
             self.timestamp_last_save = time_now
 
         # send image to track
         if self.track_flag and time_now-self.timestamp_last_track >= 1/self.fps_track:
             # track is a blocking operation - it needs to be
             # @@@ will cropping before emitting the signal lead to speedup?
-            self.packet_image_for_tracking.emit(image_cropped,camera.frame_ID,camera.timestamp)
+            self._emit_leased(self.packet_image_for_tracking,image_cropped,camera.frame_ID,camera.timestamp)
             self.timestamp_last_track = time_now
 
         self.handler_busy = False
         camera.image_locked = False
 
+    def _emit_leased(self,signal,image,frame_ID,timestamp):
+        # one reference per receiver, so that the pool slot stays valid until the last receiver has released it
+        for i in range(self.receivers(signal)):
+            frame_pool.retain_frame(image)
+        signal.emit(image,frame_ID,timestamp)
 
-class ImageArrayDisplayWindow(QMainWindow):
 
+class ImageArrayDisplayWindow(core.ImageArrayDisplayWindow):
+
+    # one tile per plane of the volume, any number of planes
     def __init__(self, window_title=''):
-        super().__init__()
-        self.setWindowTitle(window_title)
-        self.setWindowFlags(self.windowFlags() | Qt.CustomizeWindowHint)
-        self.setWindowFlags(self.windowFlags() & ~Qt.WindowCloseButtonHint)
-        self.widget = QWidget()
-
-        # interpret image data as row-major instead of col-major
-        pg.setConfigOptions(imageAxisOrder='row-major')
-
-        self.sub_windows = []
-        for i in range(9):
-            self.sub_windows.append(pg.GraphicsLayoutWidget())
-            self.sub_windows[i].view = self.sub_windows[i].addViewBox(enableMouse=True)
-            self.sub_windows[i].img = pg.ImageItem(border='w')
-            self.sub_windows[i].view.setAspectLocked(True)
-            self.sub_windows[i].view.addItem(self.sub_windows[i].img)
-
-        ## Layout
-        layout = QGridLayout()
-        layout.addWidget(self.sub_windows[0], 0, 0)
-        layout.addWidget(self.sub_windows[1], 0, 1)
-        layout.addWidget(self.sub_windows[2], 0, 2)
-        layout.addWidget(self.sub_windows[3], 1, 0) 
-        layout.addWidget(self.sub_windows[4], 1, 1) 
-        layout.addWidget(self.sub_windows[5], 1, 2) 
-        layout.addWidget(self.sub_windows[6], 2, 0) 
-        layout.addWidget(self.sub_windows[7], 2, 1) 
-        layout.addWidget(self.sub_windows[8], 2, 2) 
-        self.widget.setLayout(layout)
-        self.setCentralWidget(self.widget)
-
-        # set window size
-        desktopWidget = QDesktopWidget();
-        width = min(desktopWidget.height()*0.9,1000) #@@@TO MOVE@@@#
-        height = width
-        self.setFixedSize(width,height)
-
-    def display_image(self,image,i):
-        if i < 9:
-            self.sub_windows[i].img.setImage(image,autoLevels=False)
-            self.sub_windows[i].view.autoRange(padding=0)
+        super().__init__(window_title,mode='tiled',channel_colors={})
@@ -0,0 +1,54 @@
+import threading
+
+import control.metrics as metrics
+
+# Write-through cache of device settings (camera features, mcu illumination state).
+#
+# A setter asks is_current() before writing to the device and calls set() once the write
+# has succeeded, so a value is only cached when the device has actually accepted it. Writes
+# of the value the device already has are skipped and counted. invalidate() forgets the
+# cached values, e.g. when the device is (re)opened and its state is unknown.
+#
+#   if self.state_cache.is_current('exposure_time',exposure_time):
+#       return
+#   self.camera.ExposureTime.set(exposure_time * 1000)
+#   self.state_cache.set('exposure_time',exposure_time)
+
+class DeviceStateCache(object):
+
+    def __init__(self,device):
+        self.device = device
+        self.values = {}
+        self.lock = threading.Lock()
+        self.num_writes = 0
+        self.num_writes_elided = 0
+        self.metric_writes = metrics.counter('device_writes',device=device)
+        self.metric_writes_elided = metrics.counter('device_writes_elided',device=device)
+
+    def is_current(self,key,value):
+        with self.lock:
+            if key in self.values and self.values[key] == value:
+                self.num_writes_elided = self.num_writes_elided + 1
+                self.metric_writes_elided.inc()
+                return True
+            return False
+
+    def set(self,key,value):
+        with self.lock:
+            self.values[key] = value
+            self.num_writes = self.num_writes + 1
+            self.metric_writes.inc()
+
+    def get(self,key,default=None):
+        with self.lock:
+            return self.values.get(key,default)
+
+    def invalidate(self,key=None):
+        with self.lock:
+            if key is None:
+                self.values = {}
+            else:
+                self.values.pop(key,None)
+
+    def get_stats(self):
+        return {'writes':self.num_writes,'writes_elided':self.num_writes_elided}
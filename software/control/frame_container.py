@@ -0,0 +1,177 @@
+import os
+import threading
+import numpy as np
+
+from control._def import *
+import control.image_codecs as image_codecs
+
+# Recording container: frames are appended to large preallocated chunk files through
+# memory maps, and a binary index holds one fixed-size record per frame. This replaces
+# one image file per frame (and a new folder every 1000 files) for long recordings.
+#
+#   <path>/chunk_00000.dat, chunk_00001.dat, ... pixel data (raw or compressed), frames aligned to RECORDING.ALIGNMENT_BYTES
+#   <path>/index.bin                             records of INDEX_DTYPE, in the order the frames were written
+#
+#   reader = ChunkedFrameReader(path)
+#   image = reader[i]  # uncompressed: numpy view into the memory-mapped chunk, nothing is read until it is used
+
+INDEX_DTYPE = np.dtype([('sequence','<u8'), # order in which the frames arrived
+                        ('frame_ID','<i8'),
+                        ('timestamp','<f8'),
+                        ('chunk','<u4'),
+                        ('offset','<u8'),
+                        ('nbytes','<u8'), # stored size
+                        ('shape','<u4',(3,)), # trailing dimensions are 0
+                        ('dtype','S4'),
+                        ('codec','S4'),
+                        ('byte_shuffle','u1')])
+
+def _chunk_path(path,chunk):
+    return os.path.join(path,'chunk_' + str(chunk).zfill(5) + '.dat')
+
+class ChunkedFrameWriter(object):
+
+    def __init__(self,path,chunk_size_bytes=RECORDING.CHUNK_SIZE_BYTES,alignment_bytes=RECORDING.ALIGNMENT_BYTES,codec=RECORDING.CODEC,codec_level=RECORDING.CODEC_LEVEL,byte_shuffle=RECORDING.BYTE_SHUFFLE):
+        self.path = path
+        self.chunk_size_bytes = chunk_size_bytes
+        self.alignment_bytes = alignment_bytes
+        self.codec = codec
+        self.codec_level = codec_level
+        self.byte_shuffle = byte_shuffle
+        if not image_codecs.is_available(codec):
+            raise ValueError('codec ' + str(codec) + ' is not available')
+        os.makedirs(path,exist_ok=True)
+        self.index_file = open(os.path.join(path,'index.bin'),'ab')
+        self.lock = threading.Lock()
+        self.chunks = {} # chunk: [memmap, used bytes, writes in progress, retired]
+        self.current_chunk = -1
+        self.num_frames = 0
+        self.sequence = 0
+        self.nbytes_in = 0
+        self.nbytes_out = 0
+
+    def next_sequence(self):
+        # called in frame order - the frame can then be written from any thread
+        with self.lock:
+            sequence = self.sequence
+            self.sequence = self.sequence + 1
+            return sequence
+
+    def write(self,image,frame_ID,timestamp,sequence):
+        image = np.asarray(image)
+        codec = self.codec # may be changed by set_codec() while the frame is compressed
+        # compress outside of the lock, so that several writer threads compress in parallel
+        data = image_codecs.encode(image,codec,self.codec_level,self.byte_shuffle)
+        nbytes = len(data) if not isinstance(data,np.ndarray) else data.nbytes
+        [chunk,offset] = self._allocate(nbytes)
+        memmap = self.chunks[chunk][0]
+        memmap[offset:offset+nbytes] = np.frombuffer(data,dtype=np.uint8)
+        record = np.zeros(1,dtype=INDEX_DTYPE)
+        record['sequence'] = sequence
+        record['frame_ID'] = frame_ID if frame_ID is not None else -1
+        record['timestamp'] = timestamp if timestamp is not None else 0
+        record['chunk'] = chunk
+        record['offset'] = offset
+        record['nbytes'] = nbytes
+        record['shape'][0,:image.ndim] = image.shape
+        record['dtype'] = image.dtype.str
+        record['codec'] = codec
+        record['byte_shuffle'] = self.byte_shuffle
+        with self.lock:
+            self.index_file.write(record.tobytes())
+            self.num_frames = self.num_frames + 1
+            self.nbytes_in = self.nbytes_in + image.nbytes
+            self.nbytes_out = self.nbytes_out + nbytes
+            if self.num_frames % RECORDING.INDEX_FLUSH_INTERVAL == 0:
+                self.index_file.flush()
+            self.chunks[chunk][2] = self.chunks[chunk][2] - 1
+            self._close_retired_chunks()
+
+    def append(self,image,frame_ID,timestamp):
+        self.write(image,frame_ID,timestamp,self.next_sequence())
+
+    def set_codec(self,codec):
+        # the codec is recorded per frame, so it can be changed during a recording
+        if not image_codecs.is_available(codec):
+            raise ValueError('codec ' + str(codec) + ' is not available')
+        self.codec = codec
+
+    def get_compression_ratio(self):
+        return self.nbytes_in/self.nbytes_out if self.nbytes_out > 0 else 1
+
+    def _allocate(self,nbytes):
+        with self.lock:
+            chunk = self.chunks.get(self.current_chunk)
+            if chunk is None or chunk[1] + nbytes > chunk[0].size:
+                self._open_new_chunk(nbytes)
+                chunk = self.chunks[self.current_chunk]
+            offset = chunk[1]
+            chunk[1] = offset + (nbytes + self.alignment_bytes - 1)//self.alignment_bytes*self.alignment_bytes
+            chunk[2] = chunk[2] + 1
+            return [self.current_chunk,offset]
+
+    def _open_new_chunk(self,nbytes):
+        if self.current_chunk in self.chunks:
+            self.chunks[self.current_chunk][3] = True
+            self._close_retired_chunks()
+        self.current_chunk = self.current_chunk + 1
+        size = max(self.chunk_size_bytes,nbytes)
+        with open(_chunk_path(self.path,self.current_chunk),'wb') as f:
+            f.truncate(size) # sparse preallocation
+        self.chunks[self.current_chunk] = [np.memmap(_chunk_path(self.path,self.current_chunk),dtype=np.uint8,mode='r+',shape=(size,)),0,0,False]
+
+    def _close_retired_chunks(self):
+        for chunk in list(self.chunks.keys()):
+            [memmap,used_bytes,writes_in_progress,retired] = self.chunks[chunk]
+            if retired and writes_in_progress == 0:
+                self._close_chunk(chunk)
+
+    def _close_chunk(self,chunk):
+        [memmap,used_bytes,writes_in_progress,retired] = self.chunks.pop(chunk)
+        memmap.flush()
+        del memmap
+        # give back the preallocated space that was not used
+        with open(_chunk_path(self.path,chunk),'r+b') as f:
+            f.truncate(used_bytes)
+
+    def close(self):
+        # all reserved frames must have been written
+        with self.lock:
+            for chunk in list(self.chunks.keys()):
+                self._close_chunk(chunk)
+            self.index_file.close()
+
+class ChunkedFrameReader(object):
+
+    def __init__(self,path):
+        self.path = path
+        self.index = np.fromfile(os.path.join(path,'index.bin'),dtype=INDEX_DTYPE)
+        # writers may finish out of order - return frames in the order they arrived
+        self.index = self.index[np.argsort(self.index['sequence'],kind='stable')]
+        self.frame_IDs = self.index['frame_ID']
+        self.timestamps = self.index['timestamp']
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self,i):
+        record = self.index[i]
+        chunk = int(record['chunk'])
+        if chunk not in self._chunks:
+            self._chunks[chunk] = np.memmap(_chunk_path(self.path,chunk),dtype=np.uint8,mode='r')
+        shape = tuple(int(n) for n in record['shape'] if n > 0)
+        dtype = np.dtype(record['dtype'].decode())
+        offset = int(record['offset'])
+        data = self._chunks[chunk][offset:offset+int(record['nbytes'])]
+        codec = record['codec'].decode()
+        if codec == 'none':
+            return data.view(dtype).reshape(shape)
+        return image_codecs.decode(data,codec,shape,dtype,bool(record['byte_shuffle']))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self._chunks = {}
@@ -0,0 +1,122 @@
+import threading
+from collections import deque
+import numpy as np
+
+from control._def import *
+
+# A fixed pool of frame slots shared by the camera callback and the frame consumers.
+#
+# The camera callback acquires a lease (ref count 1), copies the frame into the slot
+# (or hands over a buffer it already owns with adopt()) and releases its own reference
+# once the stream handler returns. Every consumer that keeps the frame beyond the
+# callback (saver, tracker) holds an additional reference and releases it when done.
+# A slot goes back to the free list when its last reference is released, so one slow
+# consumer only ever holds on to its own slots instead of blocking the camera.
+
+class LeasedFrame(np.ndarray):
+    # ndarray view of a pool slot - views derived from it (crop, squeeze, flip) keep the lease
+    def __array_finalize__(self,obj):
+        self.lease = getattr(obj,'lease',None)
+
+class FrameLease(object):
+
+    def __init__(self,pool,index):
+        self.pool = pool
+        self.index = index
+        self.image = None
+        self.ref_count = 0
+
+    def retain(self):
+        self.pool._retain(self)
+        return self
+
+    def release(self):
+        self.pool._release(self)
+
+class FramePool(object):
+
+    def __init__(self,num_slots=FRAME_POOL.NUM_SLOTS):
+        self.num_slots = num_slots
+        self.shape = None
+        self.dtype = None
+        self._buffers = [None]*num_slots
+        self._free_slots = deque(range(num_slots))
+        self._lock = threading.Lock()
+
+        self.num_frames_acquired = 0
+        self.num_frames_dropped = 0
+
+    def acquire(self,shape,dtype):
+        # lease a preallocated slot of the given shape and dtype, the caller copies the frame into lease.image
+        with self._lock:
+            if shape != self.shape or np.dtype(dtype) != self.dtype:
+                self._reallocate(shape,dtype)
+            lease = self._take_slot()
+            if lease is None:
+                return None
+            if self._buffers[lease.index] is None:
+                self._buffers[lease.index] = np.empty(shape,dtype=dtype)
+            lease.image = self._buffers[lease.index].view(LeasedFrame)
+            lease.image.lease = lease
+            return lease
+
+    def adopt(self,image):
+        # lease a slot without copying - for buffers that were freshly allocated for this frame only
+        with self._lock:
+            lease = self._take_slot()
+            if lease is None:
+                return None
+            lease.image = np.asarray(image).view(LeasedFrame)
+            lease.image.lease = lease
+            return lease
+
+    def num_free_slots(self):
+        with self._lock:
+            return len(self._free_slots)
+
+    def _take_slot(self):
+        if not self._free_slots:
+            self.num_frames_dropped = self.num_frames_dropped + 1
+            return None
+        lease = FrameLease(self,self._free_slots.popleft())
+        lease.ref_count = 1
+        self.num_frames_acquired = self.num_frames_acquired + 1
+        return lease
+
+    def _reallocate(self,shape,dtype):
+        # frame size or pixel format changed - slots still leased out keep their old buffer until released
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self._buffers = [None]*self.num_slots
+
+    def _retain(self,lease):
+        with self._lock:
+            # a lease whose slot has been returned cannot be revived
+            if lease.ref_count > 0:
+                lease.ref_count = lease.ref_count + 1
+
+    def _release(self,lease):
+        with self._lock:
+            if lease.ref_count <= 0:
+                return
+            lease.ref_count = lease.ref_count - 1
+            if lease.ref_count == 0:
+                lease.image = None
+                self._free_slots.append(lease.index)
+
+def retain_frame(image):
+    # no-op for frames that do not come from a pool
+    lease = getattr(image,'lease',None)
+    if lease is not None:
+        lease.retain()
+
+def release_frame(image):
+    lease = getattr(image,'lease',None)
+    if lease is not None:
+        lease.release()
+
+def detach_frame(image):
+    # return a copy that is independent of the pool (e.g. for the display, which keeps a reference for an unknown time)
+    if isinstance(image,LeasedFrame):
+        return np.array(image,subok=False)
+    return image
@@ -13,6 +13,8 @@ import control.widgets as widgets
 import control.camera as camera
 import control.core as core
 import control.microcontroller as microcontroller
+import control.metrics as metrics
+import control.offload as offload
 from control._def import *
 
 class OctopiGUI(QMainWindow):
@@ -51,6 +53,12 @@ class OctopiGUI(QMainWindow):
 			self.trackingController = core.TrackingController(self.camera,self.microcontroller,self.navigationController,self.configurationManager,self.liveController,self.autofocusController,self.imageDisplayWindow)
 		self.imageSaver = core.ImageSaver()
 		self.imageDisplay = core.ImageDisplay()
+		if METRICS.DUMP_ENABLED:
+			self.metricsDumper = metrics.start_dumper()
+		if OFFLOAD.ENABLED:
+			self.offloadExecutor = offload.OffloadExecutor()
+			if ENABLE_TRACKING:
+				self.trackingController.set_offload_executor(self.offloadExecutor)
 
 		# open the camera
 		# camera start streaming
@@ -90,15 +98,20 @@ class OctopiGUI(QMainWindow):
 
 		# make connections
 		self.streamHandler.signal_new_frame_received.connect(self.liveController.on_new_frame)
-		self.streamHandler.image_to_display.connect(self.imageDisplay.enqueue)
+		self.streamHandler.image_to_display.connect(self.imageDisplay.enqueue,Qt.DirectConnection)
 		self.streamHandler.packet_image_to_write.connect(self.imageSaver.enqueue)
+		self.imageSaver.set_stage_position_source(self.navigationController.get_pos_mm_at)
 		# self.streamHandler.packet_image_for_tracking.connect(self.trackingController.on_new_frame)
 		self.imageDisplay.image_to_display.connect(self.imageDisplayWindow.display_image) # may connect streamHandler directly to imageDisplayWindow
+		self.imageDisplayWindow.signal_viewport_changed.connect(self.imageDisplay.set_viewport)
 		self.navigationController.xPos.connect(self.navigationWidget.label_Xpos.setNum)
 		self.navigationController.yPos.connect(self.navigationWidget.label_Ypos.setNum)
 		self.navigationController.zPos.connect(self.navigationWidget.label_Zpos.setNum)
 		if ENABLE_TRACKING:
 			self.navigationController.signal_joystick_button_pressed.connect(self.trackingControlWidget.slot_joystick_button_pressed)
+			self.trackingController.image_to_display.connect(self.imageDisplay.enqueue)
+			self.trackingController.signal_bounding_box.connect(self.imageDisplayWindow.update_bounding_box)
+			self.trackingController.signal_centroid.connect(self.imageDisplayWindow.update_centroid)
 		self.autofocusController.image_to_display.connect(self.imageDisplayWindow.display_image)
 		# self.multipointController.image_to_display.connect(self.imageDisplayWindow.display_image)
 		self.multipointController.signal_current_configuration.connect(self.liveControlWidget.set_microscope_mode)
@@ -112,9 +125,15 @@ class OctopiGUI(QMainWindow):
 		# self.softwareTriggerGenerator.stop() @@@ => 
 		self.navigationController.home()
 		self.liveController.stop_live()
+		self.liveController.close()
 		self.camera.close()
+		self.streamHandler.close()
 		self.imageSaver.close()
 		self.imageDisplay.close()
 		self.imageDisplayWindow.close()
 		self.imageArrayDisplayWindow.close()
 		self.microcontroller.close()
+		if METRICS.DUMP_ENABLED:
+			self.metricsDumper.close()
+		if OFFLOAD.ENABLED:
+			self.offloadExecutor.close()
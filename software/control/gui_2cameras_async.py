@@ -129,10 +129,12 @@ class OctopiGUI(QMainWindow):
 		event.accept()
 		# self.softwareTriggerGenerator.stop() @@@ => 
 		self.liveController_1.stop_live()
+		self.liveController_1.close()
 		self.camera_1.close()
 		self.imageSaver_1.close()
 		self.imageDisplayWindow_1.close()
 		self.liveController_2.stop_live()
+		self.liveController_2.close()
 		self.camera_2.close()
 		self.imageSaver_2.close()
 		self.imageDisplayWindow_2.close()
@@ -90,15 +90,17 @@ class OctopiGUI(QMainWindow):
 
 		# make connections
 		self.streamHandler_1.signal_new_frame_received.connect(self.liveController_1.on_new_frame)
-		self.streamHandler_1.image_to_display.connect(self.imageDisplay_1.enqueue)
+		self.streamHandler_1.image_to_display.connect(self.imageDisplay_1.enqueue,Qt.DirectConnection)
 		self.streamHandler_1.packet_image_to_write.connect(self.imageSaver_1.enqueue)
 		self.streamHandler_1.packet_image_for_tracking.connect(self.trackingController.on_new_frame)
 		self.imageDisplay_1.image_to_display.connect(self.imageDisplayWindow_1.display_image) # may connect streamHandler directly to imageDisplayWindow
+		self.imageDisplayWindow_1.signal_viewport_changed.connect(self.imageDisplay_1.set_viewport)
 
 		self.streamHandler_2.signal_new_frame_received.connect(self.liveController_2.on_new_frame)
-		self.streamHandler_2.image_to_display.connect(self.imageDisplay_2.enqueue)
+		self.streamHandler_2.image_to_display.connect(self.imageDisplay_2.enqueue,Qt.DirectConnection)
 		self.streamHandler_2.packet_image_to_write.connect(self.imageSaver_2.enqueue)
 		self.imageDisplay_2.image_to_display.connect(self.imageDisplayWindow_2.display_image) # may connect streamHandler directly to imageDisplayWindow
+		self.imageDisplayWindow_2.signal_viewport_changed.connect(self.imageDisplay_2.set_viewport)
 		
 		self.navigationController.xPos.connect(self.navigationWidget.label_Xpos.setNum)
 		self.navigationController.yPos.connect(self.navigationWidget.label_Ypos.setNum)
@@ -113,11 +115,13 @@ class OctopiGUI(QMainWindow):
 		event.accept()
 		# self.softwareTriggerGenerator.stop() @@@ => 
 		self.liveController_1.stop_live()
+		self.liveController_1.close()
 		self.camera_1.close()
 		self.imageSaver_1.close()
 		self.imageDisplay_1.close()
 		self.imageDisplayWindow_1.close()
 		self.liveController_2.stop_live()
+		self.liveController_2.close()
 		self.camera_2.close()
 		self.imageSaver_2.close()
 		self.imageDisplay_2.close()
@@ -15,6 +15,8 @@ import control.camera as camera
 import control.core as core
 import control.core_PDAF as core_PDAF
 import control.microcontroller as microcontroller
+import control.offload as offload
+from control._def import *
 
 class Internal_States():
 	def __init__(self):
@@ -44,7 +46,8 @@ class OctopiGUI(QMainWindow):
 		self.internal_states = Internal_States()
 		
 		self.navigationController = core.NavigationController(self.microcontroller)
-		self.PDAFController = core_PDAF.PDAFController(self.internal_states)
+		self.offloadExecutor = offload.OffloadExecutor() if OFFLOAD.ENABLED else None
+		self.PDAFController = core_PDAF.PDAFController(self.internal_states,self.offloadExecutor)
 
 		self.configurationManager = core.ConfigurationManager(filename=str(Path.home()) + "/configurations_PDAF.xml")
 
@@ -127,10 +130,14 @@ class OctopiGUI(QMainWindow):
 		event.accept()
 		# self.softwareTriggerGenerator.stop() @@@ => 
 		self.liveController_1.stop_live()
+		self.liveController_1.close()
 		self.camera_1.close()
 		self.imageSaver_1.close()
 		self.imageDisplayWindow_1.close()
 		self.liveController_2.stop_live()
+		self.liveController_2.close()
 		self.camera_2.close()
 		self.imageSaver_2.close()
 		self.imageDisplayWindow_2.close()
+		if self.offloadExecutor is not None:
+			self.offloadExecutor.close()
@@ -61,9 +61,10 @@ class OctopiGUI(QMainWindow):
 
 		# make connections
 		self.streamHandler.signal_new_frame_received.connect(self.liveController.on_new_frame)
-		self.streamHandler.image_to_display.connect(self.imageDisplay.enqueue)
+		self.streamHandler.image_to_display.connect(self.imageDisplay.enqueue,Qt.DirectConnection)
 		self.streamHandler.packet_image_to_write.connect(self.imageSaver.enqueue)
 		self.imageDisplay.image_to_display.connect(self.imageDisplayWindow.display_image) # may connect streamHandler directly to imageDisplayWindow
+		self.imageDisplayWindow.signal_viewport_changed.connect(self.imageDisplay.set_viewport)
 		self.liveControlWidget.signal_newExposureTime.connect(self.cameraSettingWidget.set_exposure_time)
 		self.liveControlWidget.signal_newAnalogGain.connect(self.cameraSettingWidget.set_analog_gain)
 		self.liveControlWidget.update_camera_settings()
@@ -72,6 +73,7 @@ class OctopiGUI(QMainWindow):
 		event.accept()
 		# self.softwareTriggerGenerator.stop() @@@ => 
 		self.liveController.stop_live()
+		self.liveController.close()
 		self.camera.close()
 		self.imageSaver.close()
 		self.imageDisplay.close()
@@ -87,7 +87,6 @@ class OctopiGUI(QMainWindow):
 		self.liveControlWidget.signal_newAnalogGain.connect(self.cameraSettingWidget.set_analog_gain)
 		self.liveControlWidget.update_camera_settings()
 
-		self.microcontroller.set_callback(self.plateReaderNavigationController.update_pos)
 		self.plateReaderNavigationController.signal_homing_complete.connect(self.plateReaderNavigationWidget.slot_homing_complete)
 		self.plateReaderNavigationController.signal_homing_complete.connect(self.plateReaderAcquisitionWidget.slot_homing_complete)
 		self.plateReaderNavigationController.signal_current_well.connect(self.plateReaderNavigationWidget.update_current_location)
@@ -97,6 +96,7 @@ class OctopiGUI(QMainWindow):
 		# self.softwareTriggerGenerator.stop() @@@ => 
 		# self.plateReaderNavigationController.home()
 		self.liveController.stop_live()
+		self.liveController.close()
 		self.camera.close()
 		self.imageSaver.close()
 		self.imageDisplayWindow.close()
@@ -84,10 +84,11 @@ class OctopiGUI(QMainWindow):
 
 		# make connections
 		self.streamHandler.signal_new_frame_received.connect(self.liveController.on_new_frame)
-		self.streamHandler.image_to_display.connect(self.imageDisplay.enqueue)
+		self.streamHandler.image_to_display.connect(self.imageDisplay.enqueue,Qt.DirectConnection)
 		self.streamHandler.packet_image_to_write.connect(self.imageSaver.enqueue)
 		self.streamHandler.packet_image_for_tracking.connect(self.trackingController.on_new_frame)
 		self.imageDisplay.image_to_display.connect(self.imageDisplayWindow.display_image) # may connect streamHandler directly to imageDisplayWindow
+		self.imageDisplayWindow.signal_viewport_changed.connect(self.imageDisplay.set_viewport)
 		self.navigationController.xPos.connect(self.navigationWidget.label_Xpos.setNum)
 		self.navigationController.yPos.connect(self.navigationWidget.label_Ypos.setNum)
 		self.navigationController.zPos.connect(self.navigationWidget.label_Zpos.setNum)
@@ -104,6 +105,7 @@ class OctopiGUI(QMainWindow):
 		# self.softwareTriggerGenerator.stop() @@@ => 
 		self.navigationController.home()
 		self.liveController.stop_live()
+		self.liveController.close()
 		self.camera.close()
 		self.imageSaver.close()
 		self.imageDisplay.close()
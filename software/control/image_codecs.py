@@ -0,0 +1,115 @@
+import threading
+import zlib
+import numpy as np
+import cv2
+
+from control._def import *
+
+try:
+    import lz4.block
+except:
+    lz4 = None
+    print('lz4 import error')
+
+try:
+    import zstandard
+except:
+    zstandard = None
+    print('zstandard import error')
+
+# Lossless codecs for saving frames.
+#
+# imwrite(path,image) - one file per image, with fast encoder settings (PNG at a low compression level)
+# encode()/decode()   - raw frame bytes for the chunked recording container: 'none', 'zlib', 'lz4' or 'zstd',
+#                       optionally after a byte shuffle, which groups the high and low bytes of 16-bit pixels
+#
+# Compressor objects are created once per thread and codec, and reused for every frame.
+
+CODECS = ['none','zlib','lz4','zstd']
+
+_thread_local = threading.local()
+
+def is_available(codec):
+    if codec == 'lz4':
+        return lz4 is not None
+    if codec == 'zstd':
+        return zstandard is not None
+    return codec in CODECS
+
+def _get_compressor(codec,level):
+    compressors = getattr(_thread_local,'compressors',None)
+    if compressors is None:
+        compressors = _thread_local.compressors = {}
+    key = (codec,level)
+    if key not in compressors:
+        if codec == 'zstd':
+            compressors[key] = zstandard.ZstdCompressor(level=level)
+        elif codec == 'zlib':
+            compressors[key] = lambda data: zlib.compress(data,level)
+        elif codec == 'lz4':
+            # lz4.block is stateless. always the fast mode - lz4 is the codec the governor switches to when saving
+            # falls behind; the level is the acceleration (1 is the default, higher is faster with less compression)
+            compressors[key] = lambda data: lz4.block.compress(data,mode='fast',acceleration=max(level,1),store_size=False)
+    return compressors[key]
+
+def _get_decompressor(codec):
+    decompressors = getattr(_thread_local,'decompressors',None)
+    if decompressors is None:
+        decompressors = _thread_local.decompressors = {}
+    if codec not in decompressors:
+        if codec == 'zstd':
+            decompressors[codec] = zstandard.ZstdDecompressor()
+    return decompressors.get(codec)
+
+def shuffle(image):
+    # byte planes - all first bytes, then all second bytes, ...
+    data = np.ascontiguousarray(image).view(np.uint8)
+    if image.dtype.itemsize == 1:
+        return data.reshape(-1)
+    return data.reshape(-1,image.dtype.itemsize).T.copy().reshape(-1)
+
+def unshuffle(data,dtype):
+    dtype = np.dtype(dtype)
+    data = np.frombuffer(data,dtype=np.uint8)
+    if dtype.itemsize == 1:
+        return data
+    return data.reshape(dtype.itemsize,-1).T.copy().view(dtype).reshape(-1)
+
+def encode(image,codec,level=RECORDING.CODEC_LEVEL,byte_shuffle=RECORDING.BYTE_SHUFFLE):
+    # returns a bytes-like object
+    if codec == 'none':
+        return np.ascontiguousarray(image).view(np.uint8).reshape(-1)
+    if not is_available(codec):
+        raise ValueError('codec ' + str(codec) + ' is not available')
+    data = shuffle(image) if byte_shuffle else np.ascontiguousarray(image).view(np.uint8).reshape(-1)
+    compressor = _get_compressor(codec,level)
+    if codec == 'zstd':
+        return compressor.compress(data)
+    return compressor(data)
+
+def decode(data,codec,shape,dtype,byte_shuffle=RECORDING.BYTE_SHUFFLE):
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape))*dtype.itemsize
+    if codec == 'none':
+        return np.frombuffer(data,dtype=dtype,count=int(np.prod(shape))).reshape(shape)
+    if codec == 'zstd':
+        raw = _get_decompressor('zstd').decompress(bytes(data),max_output_size=nbytes)
+    elif codec == 'zlib':
+        raw = zlib.decompress(bytes(data))
+    elif codec == 'lz4':
+        raw = lz4.block.decompress(bytes(data),uncompressed_size=nbytes)
+    else:
+        raise ValueError('unknown codec ' + str(codec))
+    if byte_shuffle:
+        return unshuffle(raw,dtype).reshape(shape)
+    return np.frombuffer(raw,dtype=dtype).reshape(shape)
+
+def get_imwrite_params(path):
+    if path.lower().endswith('.png'):
+        return [cv2.IMWRITE_PNG_COMPRESSION,IMAGE_CODECS.PNG_COMPRESSION_LEVEL,cv2.IMWRITE_PNG_STRATEGY,IMAGE_CODECS.PNG_STRATEGY]
+    if path.lower().endswith('.tif') or path.lower().endswith('.tiff'):
+        return [cv2.IMWRITE_TIFF_COMPRESSION,IMAGE_CODECS.TIFF_COMPRESSION]
+    return []
+
+def imwrite(path,image):
+    return cv2.imwrite(path,image,get_imwrite_params(path))
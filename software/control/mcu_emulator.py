@@ -0,0 +1,161 @@
+import os
+import pty
+import select
+import threading
+import tty
+
+from control._def import *
+import control.protocol as protocol
+from control.motion_simulation import SimulationClock, get_simulated_axes
+
+# Emulator of the microcontroller (octopi_firmware_v1_030) on a pseudo-terminal, so that the
+# unmodified Microcontroller class - command framing, the serial reader and the packet
+# parsing - can be run and measured without an Arduino.
+#
+# The emulator reads the 8 byte commands from the pty and sends a 24 byte status packet
+# every SIMULATION.PACKET_INTERVAL_S, written in one go like the firmware. Moves and homing
+# run on the trapezoidal motion model of the simulation; the clock (and time_scale) is the
+# same as for Microcontroller_Simulation. As in the firmware, MOVE_THETA is ignored, theta
+# and the CRC are always 0, and the status byte is the in-progress flag.
+#
+#   emulator = MicrocontrollerEmulator()
+#   mcu = microcontroller.Microcontroller(port=emulator.port)
+#   ...
+#   mcu.close()
+#   emulator.close()
+
+class MicrocontrollerEmulator(object):
+
+    def __init__(self,time_scale=SIMULATION.TIME_SCALE):
+        self.master_fd, self.slave_fd = pty.openpty()
+        # no echo and no newline translation before the host has opened (and configured) the port
+        tty.setraw(self.slave_fd)
+        os.set_blocking(self.master_fd,False)
+        self.port = os.ttyname(self.slave_fd)
+
+        self.clock = SimulationClock(time_scale)
+        self.packet_interval_s = SIMULATION.PACKET_INTERVAL_S
+        [self.axis_x,self.axis_y,self.axis_z,self.axis_theta] = get_simulated_axes()
+        # the state of the mcu, only changed by events on the clock's thread
+        self.cmd_id = 0
+        self.mcu_cmd_execution_in_progress = False
+        self.t_movement_complete = 0
+        self.illumination_on = False
+        self.illumination = None # last SET_ILLUMINATION / SET_ILLUMINATION_LED_MATRIX: [source, ...]
+        self.joystick_button_pressed = False
+
+        self.num_commands_received = 0
+        self.num_packets_sent = 0
+        self.num_packets_dropped = 0 # the host did not read and the pty buffer was full
+
+        self.terminate_reading_thread = False
+        self.buffer_rx = bytearray()
+        self.thread_read = threading.Thread(target=self._read_commands,daemon=True)
+        self.thread_read.start()
+        self.clock.call_at(0,self._send_packet)
+        self.clock.start()
+
+    def _read_commands(self):
+        while self.terminate_reading_thread == False:
+            try:
+                data = os.read(self.master_fd,4096)
+            except BlockingIOError:
+                # no host input - wait for it without spinning
+                self._wait_readable()
+                continue
+            except OSError:
+                # the host has closed the port
+                self._wait_readable()
+                continue
+            self.buffer_rx.extend(data)
+            while len(self.buffer_rx) >= MicrocontrollerDef.CMD_LENGTH:
+                command = bytes(self.buffer_rx[:MicrocontrollerDef.CMD_LENGTH])
+                del self.buffer_rx[:MicrocontrollerDef.CMD_LENGTH]
+                self.clock.call_at(self.clock.now(),lambda t,command=command: self._execute_command(t,command))
+
+    def _wait_readable(self):
+        select.select([self.master_fd],[],[],MicrocontrollerDef.READ_TIMEOUT_S)
+
+    def _execute_command(self,t,command):
+        self.num_commands_received = self.num_commands_received + 1
+        [cmd_id,cmd,payload] = protocol.COMMAND_MOVE.unpack(command)
+        self.cmd_id = cmd_id
+        t_complete = None
+        if cmd == CMD_SET.MOVE_X:
+            t_complete = self.axis_x.move(t,payload)
+        elif cmd == CMD_SET.MOVE_Y:
+            t_complete = self.axis_y.move(t,payload)
+        elif cmd == CMD_SET.MOVE_Z:
+            t_complete = self.axis_z.move(t,payload)
+        elif cmd == CMD_SET.MOVETO_X:
+            t_complete = self.axis_x.move_to(t,payload)
+        elif cmd == CMD_SET.MOVETO_Y:
+            t_complete = self.axis_y.move_to(t,payload)
+        elif cmd == CMD_SET.MOVETO_Z:
+            t_complete = self.axis_z.move_to(t,payload)
+        elif cmd == CMD_SET.HOME_OR_ZERO:
+            axis = command[2]
+            if command[3] == HOME_OR_ZERO.ZERO:
+                # atomic, the in-progress flag is not changed
+                if axis == AXIS.X:
+                    self.axis_x.zero(t)
+                elif axis == AXIS.Y:
+                    self.axis_y.zero(t)
+                elif axis == AXIS.Z:
+                    self.axis_z.zero(t)
+            elif command[3] == HOME_OR_ZERO.HOME_NEGATIVE or command[3] == HOME_OR_ZERO.HOME_POSITIVE:
+                if axis == AXIS.X:
+                    t_complete = self.axis_x.home(t)
+                elif axis == AXIS.Y:
+                    t_complete = self.axis_y.home(t)
+                elif axis == AXIS.Z:
+                    t_complete = self.axis_z.home(t)
+                elif axis == AXIS.XY:
+                    t_complete = max(self.axis_x.home(t),self.axis_y.home(t))
+        elif cmd == CMD_SET.TURN_ON_ILLUMINATION:
+            self.illumination_on = True
+        elif cmd == CMD_SET.TURN_OFF_ILLUMINATION:
+            self.illumination_on = False
+        elif cmd == CMD_SET.SET_ILLUMINATION:
+            self.illumination = [command[2],(command[3] << 8) + command[4]]
+        elif cmd == CMD_SET.SET_ILLUMINATION_LED_MATRIX:
+            self.illumination = [command[2],command[3],command[4],command[5]]
+        elif cmd == CMD_SET.ACK_JOYSTICK_BUTTON_PRESSED:
+            self.joystick_button_pressed = False
+        if t_complete is not None:
+            self.mcu_cmd_execution_in_progress = True
+            self.t_movement_complete = max(self.t_movement_complete,t_complete)
+
+    def press_joystick_button(self):
+        self.clock.call_at(self.clock.now(),self._press_joystick_button)
+
+    def _press_joystick_button(self,t):
+        self.joystick_button_pressed = True
+
+    def _send_packet(self,t):
+        if self.mcu_cmd_execution_in_progress and t >= self.t_movement_complete:
+            self.mcu_cmd_execution_in_progress = False
+        status = CMD_EXECUTION_STATUS.IN_PROGRESS if self.mcu_cmd_execution_in_progress else CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+        buttons = int(self.joystick_button_pressed) << BIT_POS_JOYSTICK_BUTTON
+        packet = protocol.STATUS.pack(self.cmd_id,status,
+                                   int(round(self.axis_x.position_at(t))),int(round(self.axis_y.position_at(t))),int(round(self.axis_z.position_at(t))),0,
+                                   buttons,0)
+        try:
+            os.write(self.master_fd,packet)
+            self.num_packets_sent = self.num_packets_sent + 1
+        except (BlockingIOError,OSError):
+            self.num_packets_dropped = self.num_packets_dropped + 1
+        if self.terminate_reading_thread == False:
+            self.clock.call_at(t+self.packet_interval_s,self._send_packet)
+
+    def get_stats(self):
+        return {'commands_received':self.num_commands_received,
+                'packets_sent':self.num_packets_sent,
+                'packets_dropped':self.num_packets_dropped}
+
+    def close(self):
+        self.terminate_reading_thread = True
+        self.clock.close()
+        self.thread_read.join()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
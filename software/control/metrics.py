@@ -0,0 +1,251 @@
+import threading
+import time
+import json
+import os
+import bisect
+
+from control._def import *
+
+# In-process metrics: counters, gauges and histograms kept in a registry that can be
+# queried from Python (get_snapshot) and dumped to a JSON, CSV or Prometheus text file,
+# either on demand or periodically by a MetricsDumper thread.
+#
+#   metrics.counter('frames_dropped',reason='saver_queue_full').inc()
+#   metrics.gauge('camera_fps').set(fps)
+#   metrics.histogram('save_latency_s').observe(dt)
+#   with metrics.histogram('autofocus_step_s').time(): ...
+#
+# Updates are a lock and an add, cheap enough for the camera callback.
+
+class Counter(object):
+
+    def __init__(self,name,labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self,n=1):
+        with self._lock:
+            self.value = self.value + n
+
+    def get_value(self):
+        return self.value
+
+class Gauge(object):
+
+    def __init__(self,name,labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def set(self,value):
+        self.value = value
+
+    def get_value(self):
+        return self.value
+
+class _Timer(object):
+
+    def __init__(self,histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.histogram.observe(time.perf_counter()-self.t0)
+
+class Histogram(object):
+
+    def __init__(self,name,labels,buckets=METRICS.LATENCY_BUCKETS_S):
+        self.name = name
+        self.labels = labels
+        self.buckets = list(buckets) # upper bounds, the last bucket (+Inf) is implicit
+        self.bucket_counts = [0]*(len(self.buckets)+1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self,value):
+        i = bisect.bisect_left(self.buckets,value)
+        with self._lock:
+            self.bucket_counts[i] = self.bucket_counts[i] + 1
+            self.count = self.count + 1
+            self.sum = self.sum + value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def time(self):
+        return _Timer(self)
+
+    def get_quantile(self,q):
+        # upper bound of the bucket that contains the q-quantile
+        with self._lock:
+            if self.count == 0:
+                return None
+            target = q*self.count
+            cumulative = 0
+            for i,n in enumerate(self.bucket_counts):
+                cumulative = cumulative + n
+                if cumulative >= target:
+                    return self.buckets[i] if i < len(self.buckets) else self.max
+            return self.max
+
+    def get_value(self):
+        with self._lock:
+            count = self.count
+            value = {'count':count,
+                     'sum':self.sum,
+                     'mean':self.sum/count if count > 0 else None,
+                     'min':self.min,
+                     'max':self.max}
+        value['p50'] = self.get_quantile(0.5)
+        value['p99'] = self.get_quantile(0.99)
+        return value
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self,metric_class,name,labels,**kwargs):
+        key = (name,tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = metric_class(name,labels,**kwargs)
+                    self.metrics[key] = metric
+        if not isinstance(metric,metric_class):
+            raise TypeError('metric ' + name + ' already exists as a ' + type(metric).__name__)
+        return metric
+
+    def counter(self,name,**labels):
+        return self._get_or_create(Counter,name,labels)
+
+    def gauge(self,name,**labels):
+        return self._get_or_create(Gauge,name,labels)
+
+    def histogram(self,name,buckets=METRICS.LATENCY_BUCKETS_S,**labels):
+        return self._get_or_create(Histogram,name,labels,buckets=buckets)
+
+    def get_snapshot(self):
+        # list of {'name','type','labels','value'}
+        snapshot = []
+        for metric in list(self.metrics.values()):
+            snapshot.append({'name':metric.name,
+                             'type':type(metric).__name__.lower(),
+                             'labels':dict(metric.labels),
+                             'value':metric.get_value()})
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self.metrics = {}
+
+    def to_json(self):
+        return json.dumps({'timestamp':time.time(),'metrics':self.get_snapshot()},indent=1)
+
+    def to_csv_rows(self):
+        # timestamp, name, labels, field, value - one row per value, histograms are flattened
+        timestamp = time.time()
+        rows = []
+        for entry in self.get_snapshot():
+            labels = ';'.join(k + '=' + str(v) for k,v in sorted(entry['labels'].items()))
+            if isinstance(entry['value'],dict):
+                for field,value in entry['value'].items():
+                    rows.append([timestamp,entry['name'],labels,field,value])
+            else:
+                rows.append([timestamp,entry['name'],labels,'value',entry['value']])
+        return rows
+
+    def to_prometheus(self):
+        lines = []
+        for metric in sorted(list(self.metrics.values()),key=lambda m:m.name):
+            name = METRICS.PREFIX + metric.name
+            labels = ','.join(k + '="' + str(v) + '"' for k,v in sorted(metric.labels.items()))
+            if isinstance(metric,Histogram):
+                lines.append('# TYPE ' + name + ' histogram')
+                cumulative = 0
+                for upper_bound,n in zip(metric.buckets + ['+Inf'],metric.bucket_counts):
+                    cumulative = cumulative + n
+                    le = 'le="' + str(upper_bound) + '"'
+                    lines.append(name + '_bucket{' + (labels + ',' if labels else '') + le + '} ' + str(cumulative))
+                lines.append(name + '_sum' + ('{' + labels + '}' if labels else '') + ' ' + str(metric.sum))
+                lines.append(name + '_count' + ('{' + labels + '}' if labels else '') + ' ' + str(metric.count))
+            else:
+                lines.append('# TYPE ' + name + ' ' + type(metric).__name__.lower())
+                lines.append(name + ('{' + labels + '}' if labels else '') + ' ' + str(metric.get_value()))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self,path,file_format='json'):
+        if file_format == 'json':
+            with open(path,'w') as f:
+                f.write(self.to_json())
+        elif file_format == 'csv':
+            # appended, so that the file holds the time course of a long acquisition
+            write_header = not os.path.exists(path)
+            with open(path,'a') as f:
+                if write_header:
+                    f.write('timestamp,name,labels,field,value\n')
+                for row in self.to_csv_rows():
+                    f.write(','.join(str(x) for x in row) + '\n')
+        elif file_format == 'prometheus':
+            # written to a temporary file first, so that a scraper never reads a half-written file
+            with open(path + '.tmp','w') as f:
+                f.write(self.to_prometheus())
+            os.replace(path + '.tmp',path)
+        else:
+            raise ValueError('unknown metrics file format ' + str(file_format))
+
+class MetricsDumper(object):
+
+    def __init__(self,registry,path=METRICS.DUMP_PATH,file_format=METRICS.DUMP_FORMAT,interval_s=METRICS.DUMP_INTERVAL_S):
+        self.registry = registry
+        self.path = path
+        self.file_format = file_format
+        self.interval_s = interval_s
+        self._stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run,daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_s):
+            self._dump()
+
+    def _dump(self):
+        try:
+            self.registry.dump(self.path,self.file_format)
+        except Exception as e:
+            print('writing metrics to ' + str(self.path) + ' failed: ' + str(e))
+
+    def close(self):
+        self._stop_event.set()
+        self.thread.join()
+        self._dump()
+
+# default registry used across the software
+registry = MetricsRegistry()
+
+def counter(name,**labels):
+    return registry.counter(name,**labels)
+
+def gauge(name,**labels):
+    return registry.gauge(name,**labels)
+
+def histogram(name,buckets=METRICS.LATENCY_BUCKETS_S,**labels):
+    return registry.histogram(name,buckets,**labels)
+
+def get_snapshot():
+    return registry.get_snapshot()
+
+def start_dumper(path=METRICS.DUMP_PATH,file_format=METRICS.DUMP_FORMAT,interval_s=METRICS.DUMP_INTERVAL_S):
+    return MetricsDumper(registry,path,file_format,interval_s)
@@ -4,8 +4,15 @@ import serial.tools.list_ports
 import time
 import numpy as np
 import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 
 from control._def import *
+import control.metrics as metrics
+import control.protocol as protocol
+from control.device_state import DeviceStateCache
+from control.stage_telemetry import StageTelemetryBuffer, TelemetryBus
+from control.motion_simulation import SimulationClock, get_simulated_axes
 
 from qtpy.QtCore import *
 from qtpy.QtWidgets import *
@@ -19,17 +26,144 @@ from qtpy.QtGui import *
 
 # to do (7/28/2021) - add functions for configuring the stepper motors
 
+class MicrocontrollerError(Exception):
+    pass
+
+_metric_wakeup_latency = metrics.histogram('wait_wakeup_latency_s',wait='mcu_command')
+
+def _completed_future():
+    future = Future()
+    future.t_resolved = time.perf_counter()
+    future.set_result(None)
+    return future
+
+class CommandTracker(object):
+    # one future per command sent to the mcu, resolved from the status packets.
+    # the mcu reports the id and execution status of the last command it received, and the
+    # status stays "in progress" while any commanded movement is running - a completed command
+    # therefore means that all the commands sent before it have completed as well.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # sequence number: [cmd_id, future, deadline], in the order the commands were sent. the 8-bit command id
+        # wraps around, so several pending commands can have the same id - the sequence number only increases
+        self.pending = OrderedDict()
+        self.sequence = 0
+        self.last_future = _completed_future()
+        self.metric_commands_failed = metrics.counter('mcu_commands_failed')
+
+    def add(self,cmd_id,timeout_s,is_last_future=True):
+        # timeout_s: None for the movements, which take as long as they take
+        # is_last_future: False for the commands the reader thread sends on its own (e.g. the joystick button ack), so
+        # that a bare wait_till_operation_is_completed() still waits for the caller's last command
+        future = Future()
+        with self.lock:
+            self.pending[self.sequence] = [cmd_id,future,time.monotonic()+timeout_s if timeout_s is not None else None]
+            self.sequence = self.sequence + 1
+            if is_last_future:
+                self.last_future = future
+        return future
+
+    def update(self,cmd_id,status):
+        if status == CMD_EXECUTION_STATUS.IN_PROGRESS:
+            return
+        completed = []
+        failed = None
+        with self.lock:
+            # the oldest pending command with the id - a newer one with a reused id is resolved by a later packet
+            sequence = next((sequence for sequence in self.pending if self.pending[sequence][0] == cmd_id),None)
+            if sequence is None:
+                return
+            if status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS:
+                while len(self.pending) > 0:
+                    [pending_sequence,[pending_cmd_id,future,deadline]] = self.pending.popitem(last=False)
+                    completed.append(future)
+                    if pending_sequence == sequence:
+                        break
+            else:
+                failed = self.pending.pop(sequence)[1]
+        t_resolved = time.perf_counter()
+        for future in completed:
+            future.t_resolved = t_resolved
+            future.set_result(None)
+        if failed is not None:
+            self._fail(failed,MicrocontrollerError('mcu command ' + str(cmd_id) + ' failed with status ' + str(status)))
+
+    def expire(self):
+        t_now = time.monotonic()
+        with self.lock:
+            expired = []
+            for sequence in self.pending:
+                deadline = self.pending[sequence][2]
+                if deadline is None:
+                    # a movement - the commands sent after it stay in progress until it has completed
+                    break
+                if deadline < t_now:
+                    expired.append(sequence)
+            expired = [self.pending.pop(sequence)[0:2] for sequence in expired]
+        for [cmd_id,future] in expired:
+            self._fail(future,TimeoutError('mcu command ' + str(cmd_id) + ' timed out'))
+
+    def _fail(self,future,exception):
+        print(str(exception))
+        self.metric_commands_failed.inc()
+        future.t_resolved = time.perf_counter()
+        future.set_exception(exception)
+
+    def get_last_future(self):
+        with self.lock:
+            return self.last_future
+
+def wait_for_commands(futures,timeout_s=None):
+    # raises MicrocontrollerError or TimeoutError if a command failed
+    t_end = time.monotonic() + timeout_s if timeout_s is not None else None
+    # the waiting thread blocks on the future's condition and is woken up by the serial reader thread
+    for future in futures:
+        was_pending = not future.done()
+        future.result(timeout=max(t_end-time.monotonic(),0) if t_end is not None else None)
+        if was_pending:
+            # from the status packet that completed the command to the waiting thread running again
+            _metric_wakeup_latency.observe(time.perf_counter()-future.t_resolved)
+
+def find_port():
+    # AUTO-DETECT the Arduino! Based on Deepak's code
+    arduino_ports = [
+            p.device
+            for p in serial.tools.list_ports.comports()
+            if 'Arduino Due' == p.description]
+    if not arduino_ports:
+        raise IOError("No Arduino found")
+    if len(arduino_ports) > 1:
+        print('Multiple Arduinos found - using the first')
+    else:
+        print('Using Arduino found at : {}'.format(arduino_ports[0]))
+    return arduino_ports[0]
+
 class Microcontroller():    
-    def __init__(self,parent=None):
+    def __init__(self,parent=None,port=None):
         self.serial = None
         self.platform_name = platform.system()
         self.tx_buffer_length = MicrocontrollerDef.CMD_LENGTH
         self.rx_buffer_length = MicrocontrollerDef.MSG_LENGTH
 
         self._cmd_id = 0
+        self._send_lock = threading.Lock()
+        self._command_tracker = CommandTracker()
+        self.telemetry = StageTelemetryBuffer() # positions of the last status packets, with their receive time
+        self.telemetry_bus = TelemetryBus() # passes the status packets on to the subscribers
         self._cmd_id_mcu = None # command id of mcu's last received command 
         self._cmd_execution_status = None
         self.mcu_cmd_execution_in_progress = False
+        self._cmd_sent_time = 0
+        self.metric_round_trip_time = metrics.histogram('mcu_command_round_trip_s')
+        self.metric_commands_sent = metrics.counter('mcu_commands_sent')
+        self.metric_bytes_discarded = metrics.counter('mcu_rx_bytes_discarded')
+        self.metric_packets_backlog = metrics.counter('mcu_rx_packets_backlog')
+        self._rx_synchronized = False # the start of the rx buffer is at a packet boundary
+        self._valid_status = set(value for name,value in vars(CMD_EXECUTION_STATUS).items() if not name.startswith('_'))
+        self._tx_buffer = bytearray(self.tx_buffer_length) # only used under the send lock
+        # illumination settings the mcu already has are not sent again
+        self.state_cache = DeviceStateCache('mcu')
 
         self.x_pos = 0 # unit: microstep or encoder resolution
         self.y_pos = 0 # unit: microstep or encoder resolution
@@ -40,20 +174,13 @@ class Microcontroller():
         self.signal_joystick_button_pressed_event = False
         self.switch_state = 0
 
-        # AUTO-DETECT the Arduino! Based on Deepak's code
-        arduino_ports = [
-                p.device
-                for p in serial.tools.list_ports.comports()
-                if 'Arduino Due' == p.description]
-        if not arduino_ports:
-            raise IOError("No Arduino found")
-        if len(arduino_ports) > 1:
-            print('Multiple Arduinos found - using the first')
+        if port is None:
+            port = find_port()
         else:
-            print('Using Arduino found at : {}'.format(arduino_ports[0]))
+            print('Using the port : {}'.format(port))
 
         # establish serial communication
-        self.serial = serial.Serial(arduino_ports[0],2000000)
+        self.serial = serial.Serial(port,2000000)
         time.sleep(0.2)
         print('Serial Connection Open')
 
@@ -68,31 +195,32 @@ class Microcontroller():
         self.serial.close()
 
     def turn_on_illumination(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.TURN_ON_ILLUMINATION
-        self.send_command(cmd)
+        return self.send_encoded_command(protocol.COMMAND,(CMD_SET.TURN_ON_ILLUMINATION,))
 
     def turn_off_illumination(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.TURN_OFF_ILLUMINATION
-        self.send_command(cmd)
+        return self.send_encoded_command(protocol.COMMAND,(CMD_SET.TURN_OFF_ILLUMINATION,))
 
     def set_illumination(self,illumination_source,intensity,r=None,g=None,b=None):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.SET_ILLUMINATION
-        cmd[2] = illumination_source
-        cmd[3] = int((intensity/100)*65535) >> 8
-        cmd[4] = int((intensity/100)*65535) & 0xff
-        self.send_command(cmd)
+        return self.send_illumination_command(self.get_illumination_command(illumination_source,intensity))
 
     def set_illumination_led_matrix(self,illumination_source,r,g,b):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.SET_ILLUMINATION_LED_MATRIX
-        cmd[2] = illumination_source
-        cmd[3] = min(int(r*255),255)
-        cmd[4] = min(int(g*255),255)
-        cmd[5] = min(int(b*255),255)
-        self.send_command(cmd)
+        return self.send_illumination_command(self.get_illumination_led_matrix_command(illumination_source,r,g,b))
+
+    def get_illumination_command(self,illumination_source,intensity):
+        return protocol.new_command(protocol.COMMAND_SET_ILLUMINATION,CMD_SET.SET_ILLUMINATION,illumination_source,int((intensity/100)*65535))
+
+    def get_illumination_led_matrix_command(self,illumination_source,r,g,b):
+        return protocol.new_command(protocol.COMMAND_SET_ILLUMINATION_LED_MATRIX,CMD_SET.SET_ILLUMINATION_LED_MATRIX,illumination_source,min(int(r*255),255),min(int(g*255),255),min(int(b*255),255))
+
+    def send_illumination_command(self,cmd):
+        # both illumination commands set the same state on the mcu - compare everything but the command id
+        state = bytes(cmd[1:])
+        if self.state_cache.is_current('illumination',state):
+            return _completed_future()
+        # cmd may be precomputed and shared, send_command() writes the command id into it
+        future = self.send_command(bytearray(cmd))
+        self.state_cache.set('illumination',state)
+        return future
 
     '''
     def move_x(self,delta):
@@ -109,45 +237,10 @@ class Microcontroller():
     '''
 
     def move_x_usteps(self,usteps):
-        direction = STAGE_MOVEMENT_SIGN_X*np.sign(usteps)
-        n_microsteps_abs = abs(usteps)
-        # if n_microsteps_abs exceed the max value that can be sent in one go
-        while n_microsteps_abs >= (2**32)/2:
-            n_microsteps_partial_abs = (2**32)/2 - 1
-            n_microsteps_partial = direction*n_microsteps_partial_abs
-            payload = self._int_to_payload(n_microsteps_partial,4)
-            cmd = bytearray(self.tx_buffer_length)
-            cmd[1] = CMD_SET.MOVE_X
-            cmd[2] = payload >> 24
-            cmd[3] = (payload >> 16) & 0xff
-            cmd[4] = (payload >> 8) & 0xff
-            cmd[5] = payload & 0xff
-            self.send_command(cmd)
-            # while self.mcu_cmd_execution_in_progress == True:
-            #     time.sleep(self._motion_status_checking_interval)
-            n_microsteps_abs = n_microsteps_abs - n_microsteps_partial_abs
-
-        n_microsteps = direction*n_microsteps_abs
-        payload = self._int_to_payload(n_microsteps,4)
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.MOVE_X
-        cmd[2] = payload >> 24
-        cmd[3] = (payload >> 16) & 0xff
-        cmd[4] = (payload >> 8) & 0xff
-        cmd[5] = payload & 0xff
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
+        return self._move_usteps(CMD_SET.MOVE_X,STAGE_MOVEMENT_SIGN_X*usteps)
 
     def move_x_to_usteps(self,usteps):
-        payload = self._int_to_payload(STAGE_MOVEMENT_SIGN_X*usteps,4)
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.MOVETO_X
-        cmd[2] = payload >> 24
-        cmd[3] = (payload >> 16) & 0xff
-        cmd[4] = (payload >> 8) & 0xff
-        cmd[5] = payload & 0xff
-        self.send_command(cmd)
+        return self.send_encoded_command(protocol.COMMAND_MOVE,(CMD_SET.MOVETO_X,int(STAGE_MOVEMENT_SIGN_X*usteps)),timeout_s=None)
 
     '''
     def move_y(self,delta):
@@ -164,45 +257,10 @@ class Microcontroller():
     '''
 
     def move_y_usteps(self,usteps):
-        direction = STAGE_MOVEMENT_SIGN_Y*np.sign(usteps)
-        n_microsteps_abs = abs(usteps)
-        # if n_microsteps_abs exceed the max value that can be sent in one go
-        while n_microsteps_abs >= (2**32)/2:
-            n_microsteps_partial_abs = (2**32)/2 - 1
-            n_microsteps_partial = direction*n_microsteps_partial_abs
-            payload = self._int_to_payload(n_microsteps_partial,4)
-            cmd = bytearray(self.tx_buffer_length)
-            cmd[1] = CMD_SET.MOVE_Y
-            cmd[2] = payload >> 24
-            cmd[3] = (payload >> 16) & 0xff
-            cmd[4] = (payload >> 8) & 0xff
-            cmd[5] = payload & 0xff
-            self.send_command(cmd)
-            # while self.mcu_cmd_execution_in_progress == True:
-            #     time.sleep(self._motion_status_checking_interval)
-            n_microsteps_abs = n_microsteps_abs - n_microsteps_partial_abs
-
-        n_microsteps = direction*n_microsteps_abs
-        payload = self._int_to_payload(n_microsteps,4)
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.MOVE_Y
-        cmd[2] = payload >> 24
-        cmd[3] = (payload >> 16) & 0xff
-        cmd[4] = (payload >> 8) & 0xff
-        cmd[5] = payload & 0xff
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
-    
+        return self._move_usteps(CMD_SET.MOVE_Y,STAGE_MOVEMENT_SIGN_Y*usteps)
+
     def move_y_to_usteps(self,usteps):
-        payload = self._int_to_payload(STAGE_MOVEMENT_SIGN_Y*usteps,4)
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.MOVETO_Y
-        cmd[2] = payload >> 24
-        cmd[3] = (payload >> 16) & 0xff
-        cmd[4] = (payload >> 8) & 0xff
-        cmd[5] = payload & 0xff
-        self.send_command(cmd)
+        return self.send_encoded_command(protocol.COMMAND_MOVE,(CMD_SET.MOVETO_Y,int(STAGE_MOVEMENT_SIGN_Y*usteps)),timeout_s=None)
 
     '''
     def move_z(self,delta):
@@ -219,241 +277,229 @@ class Microcontroller():
     '''
 
     def move_z_usteps(self,usteps):
-        direction = STAGE_MOVEMENT_SIGN_Z*np.sign(usteps)
-        n_microsteps_abs = abs(usteps)
-        # if n_microsteps_abs exceed the max value that can be sent in one go
-        while n_microsteps_abs >= (2**32)/2:
-            n_microsteps_partial_abs = (2**32)/2 - 1
-            n_microsteps_partial = direction*n_microsteps_partial_abs
-            payload = self._int_to_payload(n_microsteps_partial,4)
-            cmd = bytearray(self.tx_buffer_length)
-            cmd[1] = CMD_SET.MOVE_Z
-            cmd[2] = payload >> 24
-            cmd[3] = (payload >> 16) & 0xff
-            cmd[4] = (payload >> 8) & 0xff
-            cmd[5] = payload & 0xff
-            self.send_command(cmd)
-            # while self.mcu_cmd_execution_in_progress == True:
-            #     time.sleep(self._motion_status_checking_interval)
-            n_microsteps_abs = n_microsteps_abs - n_microsteps_partial_abs
-
-        n_microsteps = direction*n_microsteps_abs
-        payload = self._int_to_payload(n_microsteps,4)
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.MOVE_Z
-        cmd[2] = payload >> 24
-        cmd[3] = (payload >> 16) & 0xff
-        cmd[4] = (payload >> 8) & 0xff
-        cmd[5] = payload & 0xff
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
+        return self._move_usteps(CMD_SET.MOVE_Z,STAGE_MOVEMENT_SIGN_Z*usteps)
 
     def move_z_to_usteps(self,usteps):
-        payload = self._int_to_payload(STAGE_MOVEMENT_SIGN_Z*usteps,4)
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.MOVETO_Z
-        cmd[2] = payload >> 24
-        cmd[3] = (payload >> 16) & 0xff
-        cmd[4] = (payload >> 8) & 0xff
-        cmd[5] = payload & 0xff
-        self.send_command(cmd)
+        return self.send_encoded_command(protocol.COMMAND_MOVE,(CMD_SET.MOVETO_Z,int(STAGE_MOVEMENT_SIGN_Z*usteps)),timeout_s=None)
 
     def move_theta_usteps(self,usteps):
-        direction = STAGE_MOVEMENT_SIGN_THETA*np.sign(usteps)
-        n_microsteps_abs = abs(usteps)
-        # if n_microsteps_abs exceed the max value that can be sent in one go
-        while n_microsteps_abs >= (2**32)/2:
-            n_microsteps_partial_abs = (2**32)/2 - 1
-            n_microsteps_partial = direction*n_microsteps_partial_abs
-            payload = self._int_to_payload(n_microsteps_partial,4)
-            cmd = bytearray(self.tx_buffer_length)
-            cmd[1] = CMD_SET.MOVE_THETA
-            cmd[2] = payload >> 24
-            cmd[3] = (payload >> 16) & 0xff
-            cmd[4] = (payload >> 8) & 0xff
-            cmd[5] = payload & 0xff
-            self.send_command(cmd)
-            # while self.mcu_cmd_execution_in_progress == True:
-            #     time.sleep(self._motion_status_checking_interval)
-            n_microsteps_abs = n_microsteps_abs - n_microsteps_partial_abs
-
-        n_microsteps = direction*n_microsteps_abs
-        payload = self._int_to_payload(n_microsteps,4)
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.MOVE_THETA
-        cmd[2] = payload >> 24
-        cmd[3] = (payload >> 16) & 0xff
-        cmd[4] = (payload >> 8) & 0xff
-        cmd[5] = payload & 0xff
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
+        return self._move_usteps(CMD_SET.MOVE_THETA,STAGE_MOVEMENT_SIGN_THETA*usteps)
+
+    def _move_usteps(self,command,usteps):
+        usteps = int(usteps)
+        # if the number of usteps exceeds the max value that can be sent in one go
+        while abs(usteps) >= 2**31:
+            usteps_partial = int(np.sign(usteps))*(2**31-1)
+            self.send_encoded_command(protocol.COMMAND_MOVE,(command,usteps_partial),timeout_s=None)
+            usteps = usteps - usteps_partial
+        return self.send_encoded_command(protocol.COMMAND_MOVE,(command,usteps),timeout_s=None)
 
     def home_x(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.X
-        cmd[3] = int((STAGE_MOVEMENT_SIGN_X+1)/2) # "move backward" if SIGN is 1, "move forward" if SIGN is -1
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
+        # "move backward" if SIGN is 1, "move forward" if SIGN is -1
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.X,int((STAGE_MOVEMENT_SIGN_X+1)/2),0),timeout_s=None)
 
     def home_y(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.Y
-        cmd[3] = int((STAGE_MOVEMENT_SIGN_Y+1)/2) # "move backward" if SIGN is 1, "move forward" if SIGN is -1
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
+        # "move backward" if SIGN is 1, "move forward" if SIGN is -1
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.Y,int((STAGE_MOVEMENT_SIGN_Y+1)/2),0),timeout_s=None)
 
     def home_z(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.Z
-        cmd[3] = int((STAGE_MOVEMENT_SIGN_Z+1)/2) # "move backward" if SIGN is 1, "move forward" if SIGN is -1
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
+        # "move backward" if SIGN is 1, "move forward" if SIGN is -1
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.Z,int((STAGE_MOVEMENT_SIGN_Z+1)/2),0),timeout_s=None)
 
     def home_theta(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = 3
-        cmd[3] = int((STAGE_MOVEMENT_SIGN_THETA+1)/2) # "move backward" if SIGN is 1, "move forward" if SIGN is -1
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
+        # "move backward" if SIGN is 1, "move forward" if SIGN is -1
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,3,int((STAGE_MOVEMENT_SIGN_THETA+1)/2),0),timeout_s=None)
 
     def home_xy(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.XY
-        cmd[3] = int((STAGE_MOVEMENT_SIGN_X+1)/2) # "move backward" if SIGN is 1, "move forward" if SIGN is -1
-        cmd[4] = int((STAGE_MOVEMENT_SIGN_Y+1)/2) # "move backward" if SIGN is 1, "move forward" if SIGN is -1
-        self.send_command(cmd)
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.XY,int((STAGE_MOVEMENT_SIGN_X+1)/2),int((STAGE_MOVEMENT_SIGN_Y+1)/2)),timeout_s=None)
 
     def zero_x(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.X
-        cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.X,HOME_OR_ZERO.ZERO,0))
 
     def zero_y(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.Y
-        cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.Y,HOME_OR_ZERO.ZERO,0))
 
     def zero_z(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.Z
-        cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.Z,HOME_OR_ZERO.ZERO,0))
 
     def zero_theta(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.HOME_OR_ZERO
-        cmd[2] = AXIS.THETA
-        cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
-        # while self.mcu_cmd_execution_in_progress == True:
-        #     time.sleep(self._motion_status_checking_interval)
-        #     # to do: add timeout
-
-    def ack_joystick_button_pressed(self):
-        cmd = bytearray(self.tx_buffer_length)
-        cmd[1] = CMD_SET.ACK_JOYSTICK_BUTTON_PRESSED
-        self.send_command(cmd)
-
-    def send_command(self,command):
-        self._cmd_id = (self._cmd_id + 1)%256
-        command[0] = self._cmd_id
-        # command[self.tx_buffer_length-1] = self._calculate_CRC(command)
-        self.serial.write(command)
-        self.mcu_cmd_execution_in_progress = True
+        return self.send_encoded_command(protocol.COMMAND_HOME_OR_ZERO,(CMD_SET.HOME_OR_ZERO,AXIS.THETA,HOME_OR_ZERO.ZERO,0))
+
+    def ack_joystick_button_pressed(self,is_last_future=True):
+        return self._send_command(None,(protocol.COMMAND,(CMD_SET.ACK_JOYSTICK_BUTTON_PRESSED,)),MicrocontrollerDef.COMMAND_TIMEOUT_S,is_last_future)
+
+    def send_command(self,command,timeout_s=MicrocontrollerDef.COMMAND_TIMEOUT_S):
+        # command: bytearray, the command id (byte 0) is filled in here
+        return self._send_command(command,None,timeout_s)
+
+    def send_encoded_command(self,layout,parameters,timeout_s=MicrocontrollerDef.COMMAND_TIMEOUT_S):
+        # the command is encoded with the protocol layout into the reusable tx buffer
+        return self._send_command(None,(layout,parameters),timeout_s)
+
+    def _send_command(self,command,encoding,timeout_s,is_last_future=True):
+        # returns a future that resolves when the mcu has completed the command
+        # commands can come from the GUI thread and from worker threads (e.g. the software trigger)
+        with self._send_lock:
+            self._cmd_id = (self._cmd_id + 1)%256
+            if encoding is None:
+                command[0] = self._cmd_id
+            else:
+                command = protocol.encode(encoding[0],self._tx_buffer,self._cmd_id,*encoding[1])
+            # command[self.tx_buffer_length-1] = self._calculate_CRC(command)
+            future = self._command_tracker.add(self._cmd_id,timeout_s,is_last_future)
+            self._cmd_sent_time = time.perf_counter()
+            self.serial.write(command)
+            self.mcu_cmd_execution_in_progress = True
+        self.metric_commands_sent.inc()
+        return future
 
     def read_received_packet(self):
+        # blocking reads: the thread sleeps in read() until bytes arrive or READ_TIMEOUT_S has passed
+        self.serial.timeout = MicrocontrollerDef.READ_TIMEOUT_S
+        rx_buffer = bytearray()
+        boundary_hints = [] # offsets in rx_buffer of reads that started on an empty input buffer
         while self.terminate_reading_received_packet_thread == False:
-            # wait to receive data
-            if self.serial.in_waiting==0:
+            try:
+                in_waiting = self.serial.in_waiting
+                data = self.serial.read(max(in_waiting,1))
+            except serial.SerialException as e:
+                print('reading from the mcu failed: ' + str(e))
+                time.sleep(MicrocontrollerDef.READ_TIMEOUT_S)
                 continue
-            if self.serial.in_waiting % self.rx_buffer_length != 0:
+            t_rx = time.monotonic()
+            self._command_tracker.expire()
+            if len(data) == 0:
                 continue
-            
-            # get rid of old data
-            num_bytes_in_rx_buffer = self.serial.in_waiting
-            if num_bytes_in_rx_buffer > self.rx_buffer_length:
-                # print('getting rid of old data')
-                for i in range(num_bytes_in_rx_buffer-self.rx_buffer_length):
-                    self.serial.read()
-            
-            # read the buffer
-            msg=[]
-            for i in range(self.rx_buffer_length):
-                msg.append(ord(self.serial.read()))
-
-            # parse the message
-            '''
-            - command ID (1 byte)
-            - execution status (1 byte)
-            - X pos (4 bytes)
-            - Y pos (4 bytes)
-            - Z pos (4 bytes)
-            - Theta (4 bytes)
-            - buttons and switches (1 byte)
-            - reserved (4 bytes)
-            - CRC (1 byte)
-            '''
-            self._cmd_id_mcu = msg[0]
-            self._cmd_execution_status = msg[1]
-            if (self._cmd_id_mcu == self._cmd_id) and (self._cmd_execution_status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS):
-                if self.mcu_cmd_execution_in_progress == True:
-                    self.mcu_cmd_execution_in_progress = False
-                    print('   mcu command ' + str(self._cmd_id) + ' complete')
-
-            # print('command id ' + str(self._cmd_id) + '; mcu command ' + str(self._cmd_id_mcu) + ' status: ' + str(msg[1]) )
-
-            self.x_pos = self._payload_to_int(msg[2:6],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            self.y_pos = self._payload_to_int(msg[6:10],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            self.z_pos = self._payload_to_int(msg[10:14],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            self.theta_pos = self._payload_to_int(msg[14:18],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            
-            self.button_and_switch_state = msg[18]
-            # joystick button
-            tmp = self.button_and_switch_state & (1 << BIT_POS_JOYSTICK_BUTTON)
-            joystick_button_pressed = tmp > 0
-            if self.joystick_button_pressed == False and joystick_button_pressed == True:
-                self.signal_joystick_button_pressed_event = True
-                self.ack_joystick_button_pressed()
-            self.joystick_button_pressed = joystick_button_pressed
-            # switch
-            tmp = self.button_and_switch_state & (1 << BIT_POS_SWITCH)
-            self.switch_state = tmp > 0
-
-            if self.new_packet_callback_external is not None:
-                self.new_packet_callback_external(self)
+            if in_waiting == 0:
+                boundary_hints.append(len(rx_buffer))
+            rx_buffer.extend(data)
+            [offsets,num_bytes_used] = self._find_packets(rx_buffer,boundary_hints)
+            if len(offsets) > 0:
+                # the most recent complete packet sets the state. a backlog of older packets (the reader was held up)
+                # is decoded in one go, for the telemetry and for the commands that completed in the meantime
+                backlog = None
+                if len(offsets) > 1:
+                    backlog = protocol.decode_status_backlog(b''.join(rx_buffer[offset:offset+self.rx_buffer_length] for offset in offsets[:-1]))
+                    self._record_backlog(backlog,t_rx)
+                self._parse_packet(rx_buffer,offsets[-1],t_rx)
+                if backlog is not None:
+                    for cmd_id,status in zip(backlog[0],backlog[1]):
+                        self._command_tracker.update(int(cmd_id),int(status))
+            del rx_buffer[:num_bytes_used]
+            boundary_hints = [hint-num_bytes_used for hint in boundary_hints if hint >= num_bytes_used]
+
+    def _is_valid_packet(self,buffer,offset):
+        # as sent by the firmware: a known execution status, only the button and switch bits, reserved bytes and CRC 0
+        return (buffer[offset+1] in self._valid_status
+                and buffer[offset+18] & ~((1 << BIT_POS_JOYSTICK_BUTTON) | (1 << BIT_POS_SWITCH)) == 0
+                and not any(buffer[offset+19:offset+self.rx_buffer_length]))
+
+    def _find_packets(self,buffer,boundary_hints):
+        # returns the offsets of the valid packets in buffer and the number of bytes used (packets and skipped bytes).
+        # in sync, the packets follow each other - however the reads split them. a frame that is not valid means the
+        # reader is out of sync (e.g. it started in the middle of a packet). the frame layout has too many zero bytes to
+        # find the packet boundary from the content alone, so it resynchronizes at a boundary hint: a read that started
+        # on an empty input buffer, i.e. with the first bytes of a write of the mcu, which sends each packet in one go
+        offsets = []
+        offset = 0
+        num_bytes_skipped = 0
+        while len(buffer) - offset >= self.rx_buffer_length:
+            if self._rx_synchronized:
+                if self._is_valid_packet(buffer,offset):
+                    offsets.append(offset)
+                    offset = offset + self.rx_buffer_length
+                    continue
+                self._rx_synchronized = False
+            candidates = [hint for hint in boundary_hints if hint >= offset]
+            if len(candidates) == 0:
+                # these bytes cannot be framed
+                num_bytes_skipped = num_bytes_skipped + len(buffer) - offset
+                offset = len(buffer)
+                break
+            num_bytes_skipped = num_bytes_skipped + candidates[0] - offset
+            offset = candidates[0]
+            if len(buffer) - offset < 2*self.rx_buffer_length:
+                break
+            # two valid frames in a row
+            if self._is_valid_packet(buffer,offset) and self._is_valid_packet(buffer,offset+self.rx_buffer_length):
+                self._rx_synchronized = True
+            else:
+                offset = offset + 1
+                num_bytes_skipped = num_bytes_skipped + 1
+        if num_bytes_skipped > 0:
+            self.metric_bytes_discarded.inc(num_bytes_skipped)
+        return [offsets,offset]
+
+    def _record_backlog(self,backlog,t_rx):
+        [cmd_ids,statuses,xs,ys,zs,thetas] = backlog[:6]
+        num_packets = len(cmd_ids)
+        self.metric_packets_backlog.inc(num_packets)
+        # received together, but sent one packet interval apart before the newest packet
+        t = t_rx - MicrocontrollerDef.PACKET_INTERVAL_S*np.arange(num_packets,0,-1)
+        latest = self.telemetry.get_latest()
+        if latest is not None:
+            t = np.maximum(t,latest[0])
+        for i in range(num_packets):
+            self.telemetry.append(t[i],xs[i],ys[i],zs[i],thetas[i],statuses[i])
+
+    def _parse_packet(self,buffer,offset=0,t_rx=None):
+        '''
+        - command ID (1 byte)
+        - execution status (1 byte)
+        - X pos (4 bytes)
+        - Y pos (4 bytes)
+        - Z pos (4 bytes)
+        - Theta (4 bytes)
+        - buttons and switches (1 byte)
+        - reserved (4 bytes)
+        - CRC (1 byte)
+        '''
+        [self._cmd_id_mcu,self._cmd_execution_status,x_pos,y_pos,z_pos,theta_pos,self.button_and_switch_state,crc] = protocol.decode_status(buffer,offset)
+        # unit: microstep or encoder resolution. set before the futures resolve, so that a caller that waited sees the new position
+        self.x_pos = x_pos
+        self.y_pos = y_pos
+        self.z_pos = z_pos
+        self.theta_pos = theta_pos
+        self._command_tracker.update(self._cmd_id_mcu,self._cmd_execution_status)
+        if (self._cmd_id_mcu == self._cmd_id) and (self._cmd_execution_status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS):
+            if self.mcu_cmd_execution_in_progress == True:
+                self.mcu_cmd_execution_in_progress = False
+                self.metric_round_trip_time.observe(time.perf_counter()-self._cmd_sent_time)
+                print('   mcu command ' + str(self._cmd_id) + ' complete')
+
+        # print('command id ' + str(self._cmd_id) + '; mcu command ' + str(self._cmd_id_mcu) + ' status: ' + str(self._cmd_execution_status) )
+
+        t_rx = t_rx if t_rx is not None else time.monotonic()
+        self.telemetry.append(t_rx,x_pos,y_pos,z_pos,theta_pos,self._cmd_execution_status)
+
+        # joystick button
+        tmp = self.button_and_switch_state & (1 << BIT_POS_JOYSTICK_BUTTON)
+        joystick_button_pressed = tmp > 0
+        if self.joystick_button_pressed == False and joystick_button_pressed == True:
+            self.signal_joystick_button_pressed_event = True
+            # sent from the reader thread - not the last command of the caller that waits
+            self.ack_joystick_button_pressed(is_last_future=False)
+        self.joystick_button_pressed = joystick_button_pressed
+        # switch
+        tmp = self.button_and_switch_state & (1 << BIT_POS_SWITCH)
+        self.switch_state = tmp > 0
+
+        self.telemetry_bus.publish(t_rx,x_pos,y_pos,z_pos,theta_pos,self._cmd_execution_status)
+        if self.new_packet_callback_external is not None:
+            self.new_packet_callback_external(self)
 
     def get_pos(self):
         return self.x_pos, self.y_pos, self.z_pos, self.theta_pos
 
+    def get_last_command_future(self):
+        return self._command_tracker.get_last_future()
+
+    def wait_till_operation_is_completed(self,*futures):
+        # waits for the given commands, or for the last command sent (and with it all the commands before it)
+        if len(futures) == 0:
+            futures = [self.get_last_command_future()]
+        wait_for_commands([future for future in futures if future is not None])
+
     def get_button_and_switch_state(self):
         return self.button_and_switch_state
 
@@ -463,32 +509,22 @@ class Microcontroller():
     def set_callback(self,function):
         self.new_packet_callback_external = function
 
-    def _int_to_payload(self,signed_int,number_of_bytes):
-        if signed_int >= 0:
-            payload = signed_int
-        else:
-            payload = 2**(8*number_of_bytes) + signed_int # find two's completement
-        return payload
-
-    def _payload_to_int(self,payload,number_of_bytes):
-        signed = 0
-        for i in range(number_of_bytes):
-            signed = signed + int(payload[i])*(256**(number_of_bytes-1-i))
-        if signed >= 256**number_of_bytes/2:
-            signed = signed - 256**number_of_bytes
-        return signed
-
 class Microcontroller_Simulation():
-    def __init__(self,parent=None):
+    def __init__(self,parent=None,time_scale=SIMULATION.TIME_SCALE):
         self.serial = None
         self.platform_name = platform.system()
         self.tx_buffer_length = MicrocontrollerDef.CMD_LENGTH
         self.rx_buffer_length = MicrocontrollerDef.MSG_LENGTH
 
         self._cmd_id = 0
+        self._send_lock = threading.Lock()
+        self._command_tracker = CommandTracker()
+        self.telemetry = StageTelemetryBuffer() # positions of the last status packets, with their receive time
+        self.telemetry_bus = TelemetryBus() # passes the status packets on to the subscribers
         self._cmd_id_mcu = None # command id of mcu's last received command 
         self._cmd_execution_status = None
         self.mcu_cmd_execution_in_progress = False
+        self.state_cache = DeviceStateCache('mcu')
 
         self.x_pos = 0 # unit: microstep or encoder resolution
         self.y_pos = 0 # unit: microstep or encoder resolution
@@ -499,172 +535,175 @@ class Microcontroller_Simulation():
         self.signal_joystick_button_pressed_event = False
         self.switch_state = 0
 
-         # for simulation
-        self.timestamp_last_command = time.time() # for simulation only
-        self._mcu_cmd_execution_status = None
-        self.timer_update_command_execution_status = QTimer()
-        self.timer_update_command_execution_status.timeout.connect(self._simulation_update_cmd_execution_status)
+        # for simulation - the state of the mcu, only changed by events on the clock's thread
+        self.clock = SimulationClock(time_scale)
+        self.packet_interval_s = SIMULATION.PACKET_INTERVAL_S
+        [self.axis_x,self.axis_y,self.axis_z,self.axis_theta] = get_simulated_axes()
+        self._mcu_cmd_id = 0
+        self._mcu_cmd_execution_status = CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+        self._t_mcu_cmd_complete = 0 # simulated time at which the last command and all movements have completed
 
         self.new_packet_callback_external = None
-        self.terminate_reading_received_packet_thread = False
-        self.thread_read_received_packet = threading.Thread(target=self.read_received_packet, daemon=True)
-        self.thread_read_received_packet.start()
+        self.clock.call_at(0,self._send_packet)
+        self.clock.start()
 
     def close(self):
-        self.terminate_reading_received_packet_thread = True
-        self.thread_read_received_packet.join()
+        self.clock.close()
 
     def move_x_usteps(self,usteps):
-        self.x_pos = self.x_pos + STAGE_MOVEMENT_SIGN_X*usteps
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: self.axis_x.move(t,STAGE_MOVEMENT_SIGN_X*usteps))
         print('   mcu command ' + str(self._cmd_id) + ': move x')
+        return future
 
     def move_x_to_usteps(self,usteps):
-        self.x_pos = STAGE_MOVEMENT_SIGN_X*usteps
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: self.axis_x.move_to(t,STAGE_MOVEMENT_SIGN_X*usteps))
         print('   mcu command ' + str(self._cmd_id) + ': move x to')
+        return future
 
     def move_y_usteps(self,usteps):
-        self.y_pos = self.y_pos + STAGE_MOVEMENT_SIGN_Y*usteps
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: self.axis_y.move(t,STAGE_MOVEMENT_SIGN_Y*usteps))
         print('   mcu command ' + str(self._cmd_id) + ': move y')
+        return future
 
     def move_y_to_usteps(self,usteps):
-        self.y_pos = STAGE_MOVEMENT_SIGN_Y*usteps
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: self.axis_y.move_to(t,STAGE_MOVEMENT_SIGN_Y*usteps))
         print('   mcu command ' + str(self._cmd_id) + ': move y to')
+        return future
 
     def move_z_usteps(self,usteps):
-        self.z_pos = self.z_pos + STAGE_MOVEMENT_SIGN_Z*usteps
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: self.axis_z.move(t,STAGE_MOVEMENT_SIGN_Z*usteps))
         print('   mcu command ' + str(self._cmd_id) + ': move z')
+        return future
 
     def move_z_to_usteps(self,usteps):
-        self.z_pos = STAGE_MOVEMENT_SIGN_Z*usteps
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: self.axis_z.move_to(t,STAGE_MOVEMENT_SIGN_Z*usteps))
         print('   mcu command ' + str(self._cmd_id) + ': move z to')
+        return future
 
     def move_theta_usteps(self,usteps):
-        self.theta_pos = self.theta_pos + usteps
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        return self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: self.axis_theta.move(t,usteps))
 
     def home_x(self):
-        self.x_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=self.axis_x.home)
         print('   mcu command ' + str(self._cmd_id) + ': home x')
+        return future
 
     def home_y(self):
-        self.y_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=self.axis_y.home)
         print('   mcu command ' + str(self._cmd_id) + ': home y')
+        return future
 
     def home_z(self):
-        self.z_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=self.axis_z.home)
         print('   mcu command ' + str(self._cmd_id) + ': home z')
+        return future
 
     def home_xy(self):
-        self.x_pos = 0
-        self.y_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=lambda t: max(self.axis_x.home(t),self.axis_y.home(t)))
         print('   mcu command ' + str(self._cmd_id) + ': home xy')
+        return future
 
     def home_theta(self):
-        self.theta_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        return self.send_command(bytearray(self.tx_buffer_length),timeout_s=None,execute=self.axis_theta.home)
 
     def zero_x(self):
-        self.x_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),execute=self.axis_x.zero)
         print('   mcu command ' + str(self._cmd_id) + ': zero x')
+        return future
 
     def zero_y(self):
-        self.y_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),execute=self.axis_y.zero)
         print('   mcu command ' + str(self._cmd_id) + ': zero y')
+        return future
 
     def zero_z(self):
-        self.z_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(bytearray(self.tx_buffer_length),execute=self.axis_z.zero)
         print('   mcu command ' + str(self._cmd_id) + ': zero z')
+        return future
 
     def zero_theta(self):
-        self.theta_pos = 0
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        return self.send_command(bytearray(self.tx_buffer_length),execute=self.axis_theta.zero)
 
-    def read_received_packet(self):
-        while self.terminate_reading_received_packet_thread == False:
-            # only for simulation - update the command execution status
-            if time.time() - self.timestamp_last_command > 0.05: # in the simulation, assume all the operation takes 0.05s to complete
-                if self._mcu_cmd_execution_status !=  CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS:
-                    self._mcu_cmd_execution_status = CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
-                    print('   mcu command ' + str(self._cmd_id) + ' complete')
-
-            # read and parse message
-            msg=[]
-            for i in range(self.rx_buffer_length):
-                msg.append(0)
-
-            msg[0] = self._cmd_id
-            msg[1] = self._mcu_cmd_execution_status
-
-            self._cmd_id_mcu = msg[0]
-            self._cmd_execution_status = msg[1]
-            if (self._cmd_id_mcu == self._cmd_id) and (self._cmd_execution_status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS):
-                self.mcu_cmd_execution_in_progress = False
-            # print('mcu_cmd_execution_in_progress: ' + str(self.mcu_cmd_execution_in_progress))
-            
-            # self.x_pos = utils.unsigned_to_signed(msg[2:6],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            # self.y_pos = utils.unsigned_to_signed(msg[6:10],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            # self.z_pos = utils.unsigned_to_signed(msg[10:14],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            # self.theta_pos = utils.unsigned_to_signed(msg[14:18],MicrocontrollerDef.N_BYTES_POS) # unit: microstep or encoder resolution
-            
-            self.button_and_switch_state = msg[18]
-
-            if self.new_packet_callback_external is not None:
-                self.new_packet_callback_external(self)
-
-            time.sleep(0.005) # simulate MCU packet transmission interval
+    def _receive_command(self,t,cmd_id,execute):
+        # simulation event: the mcu executes a command
+        t_complete = execute(t) if execute is not None else t
+        self._mcu_cmd_id = cmd_id
+        self._mcu_cmd_execution_status = CMD_EXECUTION_STATUS.IN_PROGRESS
+        # like the firmware, the command stays in progress while any axis is still moving
+        self._t_mcu_cmd_complete = max(self._t_mcu_cmd_complete,t_complete)
+
+    def _switch_illumination(self,t):
+        return t + SIMULATION.ILLUMINATION_LATENCY_S
+
+    def _send_packet(self,t):
+        # simulation event: the mcu sends its status
+        if self._mcu_cmd_execution_status == CMD_EXECUTION_STATUS.IN_PROGRESS and t >= self._t_mcu_cmd_complete:
+            self._mcu_cmd_execution_status = CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+            print('   mcu command ' + str(self._mcu_cmd_id) + ' complete')
+        self.x_pos = int(round(self.axis_x.position_at(t)))
+        self.y_pos = int(round(self.axis_y.position_at(t)))
+        self.z_pos = int(round(self.axis_z.position_at(t)))
+        self.theta_pos = int(round(self.axis_theta.position_at(t)))
+        self._cmd_id_mcu = self._mcu_cmd_id
+        self._cmd_execution_status = self._mcu_cmd_execution_status
+        self._command_tracker.update(self._cmd_id_mcu,self._cmd_execution_status)
+        self._command_tracker.expire()
+        if (self._cmd_id_mcu == self._cmd_id) and (self._cmd_execution_status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS):
+            self.mcu_cmd_execution_in_progress = False
+        t_rx = time.monotonic()
+        self.telemetry.append(t_rx,self.x_pos,self.y_pos,self.z_pos,self.theta_pos,self._cmd_execution_status)
+        self.telemetry_bus.publish(t_rx,self.x_pos,self.y_pos,self.z_pos,self.theta_pos,self._cmd_execution_status)
+
+        if self.new_packet_callback_external is not None:
+            self.new_packet_callback_external(self)
+
+        self.clock.call_at(t+self.packet_interval_s,self._send_packet)
 
     def turn_on_illumination(self):
         cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(cmd,execute=self._switch_illumination)
         print('   mcu command ' + str(self._cmd_id) + ': turn on illumination')
+        return future
 
     def turn_off_illumination(self):
         cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
+        future = self.send_command(cmd,execute=self._switch_illumination)
         print('   mcu command ' + str(self._cmd_id) + ': turn off illumination')
+        return future
 
-    def set_illumination(self,illumination_source,intensity):
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
-        print('   mcu command ' + str(self._cmd_id) + ': set illumination')
+    def set_illumination(self,illumination_source,intensity,r=None,g=None,b=None):
+        return self.send_illumination_command(self.get_illumination_command(illumination_source,intensity))
 
     def set_illumination_led_matrix(self,illumination_source,r,g,b):
-        cmd = bytearray(self.tx_buffer_length)
-        self.send_command(cmd)
-        print('   mcu command ' + str(self._cmd_id) + ': set illumination (led matrix)')
+        return self.send_illumination_command(self.get_illumination_led_matrix_command(illumination_source,r,g,b))
+
+    def get_illumination_command(self,illumination_source,intensity):
+        return protocol.new_command(protocol.COMMAND_SET_ILLUMINATION,CMD_SET.SET_ILLUMINATION,illumination_source,int((intensity/100)*65535))
+
+    def get_illumination_led_matrix_command(self,illumination_source,r,g,b):
+        return protocol.new_command(protocol.COMMAND_SET_ILLUMINATION_LED_MATRIX,CMD_SET.SET_ILLUMINATION_LED_MATRIX,illumination_source,min(int(r*255),255),min(int(g*255),255),min(int(b*255),255))
+
+    def send_illumination_command(self,cmd):
+        state = bytes(cmd[1:])
+        if self.state_cache.is_current('illumination',state):
+            return _completed_future()
+        future = self.send_command(bytearray(cmd),execute=self._switch_illumination)
+        self.state_cache.set('illumination',state)
+        print('   mcu command ' + str(self._cmd_id) + ': set illumination')
+        return future
 
     def get_pos(self):
         return self.x_pos, self.y_pos, self.z_pos, self.theta_pos
 
+    def get_last_command_future(self):
+        return self._command_tracker.get_last_future()
+
+    def wait_till_operation_is_completed(self,*futures):
+        # waits for the given commands, or for the last command sent (and with it all the commands before it)
+        if len(futures) == 0:
+            futures = [self.get_last_command_future()]
+        wait_for_commands([future for future in futures if future is not None])
+
     def get_button_and_switch_state(self):
         return self.button_and_switch_state
 
@@ -674,22 +713,14 @@ class Microcontroller_Simulation():
     def is_busy(self):
         return self.mcu_cmd_execution_in_progress
 
-    def send_command(self,command):
-        self._cmd_id = (self._cmd_id + 1)%256
-        command[0] = self._cmd_id
-        # command[self.tx_buffer_length-1] = self._calculate_CRC(command)
-        self.mcu_cmd_execution_in_progress = True
-        # for simulation
-        self._mcu_cmd_execution_status = CMD_EXECUTION_STATUS.IN_PROGRESS
-        # self.timer_update_command_execution_status.setInterval(2000)
-        # self.timer_update_command_execution_status.start()
-        # print('start timer')
-        # timer cannot be started from another thread
-        self.timestamp_last_command = time.time()
-
-    def _simulation_update_cmd_execution_status(self):
-        # print('simulation - MCU command execution finished')
-        # self._mcu_cmd_execution_status = CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
-        # self.timer_update_command_execution_status.stop()
-        pass # timer cannot be started from another thread
-
+    def send_command(self,command,timeout_s=MicrocontrollerDef.COMMAND_TIMEOUT_S,execute=None):
+        # execute(t): for simulation - carries out the command on the model at simulated time t, returns the time it completes
+        with self._send_lock:
+            self._cmd_id = (self._cmd_id + 1)%256
+            command[0] = self._cmd_id
+            future = self._command_tracker.add(self._cmd_id,timeout_s)
+            self.mcu_cmd_execution_in_progress = True
+            cmd_id = self._cmd_id
+            # scheduled under the lock, so that the commands arrive in the order of their ids
+            self.clock.call_later(SIMULATION.COMMAND_LATENCY_S,lambda t: self._receive_command(t,cmd_id,execute))
+        return future
@@ -0,0 +1,153 @@
+import heapq
+import math
+import threading
+import time
+
+from control._def import *
+
+# Motion model and clock for the simulated microcontroller.
+#
+# Moves follow a trapezoidal velocity profile (accelerate, cruise, decelerate) with the
+# velocity and acceleration limits of the firmware, so a simulated move takes as long as
+# on the stage. Positions are in usteps; a move always starts from rest.
+#
+# The simulation is event-driven: the status packets and the completion of the commands
+# are events on a SimulationClock, executed in time order by the clock's thread. The time
+# of an event is computed from the model, not measured, so the durations do not depend on
+# how busy the host is. With time_scale > 1 the simulated time runs faster than real time.
+#
+#   clock = SimulationClock(time_scale)
+#   clock.call_at(t,callback)   # callback(t), with t in simulated seconds
+#   clock.start()
+#   axis = SimulatedAxis(max_velocity,max_acceleration)  # usteps/s, usteps/s/s
+#   t_done = axis.move_to(clock.now(),target)
+#   axis.position_at(clock.now())
+
+class TrapezoidalProfile(object):
+
+    def __init__(self,t_start,p_start,p_end,max_velocity,max_acceleration):
+        self.t_start = t_start
+        self.p_start = p_start
+        self.p_end = p_end
+        self.max_acceleration = max_acceleration
+        self.direction = 1 if p_end >= p_start else -1
+        self.distance = abs(p_end-p_start)
+        if self.distance*max_acceleration <= max_velocity**2:
+            # too short to reach the max velocity
+            self.t_acceleration = math.sqrt(self.distance/max_acceleration)
+            self.velocity = max_acceleration*self.t_acceleration
+            self.t_cruise = 0
+        else:
+            self.t_acceleration = max_velocity/max_acceleration
+            self.velocity = max_velocity
+            self.t_cruise = self.distance/max_velocity - self.t_acceleration
+        self.duration = 2*self.t_acceleration + self.t_cruise
+        self.t_end = t_start + self.duration
+
+    def position_at(self,t):
+        dt = t - self.t_start
+        if dt <= 0:
+            return self.p_start
+        if dt >= self.duration:
+            return self.p_end
+        if dt < self.t_acceleration:
+            d = 0.5*self.max_acceleration*dt**2
+        elif dt < self.t_acceleration + self.t_cruise:
+            d = 0.5*self.velocity*self.t_acceleration + self.velocity*(dt-self.t_acceleration)
+        else:
+            d = self.distance - 0.5*self.max_acceleration*(self.duration-dt)**2
+        return self.p_start + self.direction*d
+
+class SimulatedAxis(object):
+
+    def __init__(self,max_velocity,max_acceleration,homing_velocity=None):
+        self.max_velocity = max_velocity # usteps/s
+        self.max_acceleration = max_acceleration # usteps/s/s
+        self.homing_velocity = homing_velocity if homing_velocity is not None else max_velocity
+        self.profile = TrapezoidalProfile(0,0,0,max_velocity,max_acceleration)
+
+    def position_at(self,t):
+        return self.profile.position_at(t)
+
+    def move_to(self,t,target,velocity=None):
+        # returns the time at which the axis reaches the target
+        self.profile = TrapezoidalProfile(t,self.position_at(t),target,velocity or self.max_velocity,self.max_acceleration)
+        return self.profile.t_end
+
+    def move(self,t,usteps):
+        return self.move_to(t,self.position_at(t)+usteps)
+
+    def home(self,t):
+        return self.move_to(t,0,self.homing_velocity)
+
+    def zero(self,t):
+        self.profile = TrapezoidalProfile(t,0,0,self.max_velocity,self.max_acceleration)
+        return t
+
+def get_simulated_axes():
+    # x, y, z and theta, with the limits converted to usteps
+    usteps_per_mm_X = FULLSTEPS_PER_REV_X*MICROSTEPPING_DEFAULT_X/SCREW_PITCH_X_MM
+    usteps_per_mm_Y = FULLSTEPS_PER_REV_Y*MICROSTEPPING_DEFAULT_Y/SCREW_PITCH_Y_MM
+    usteps_per_mm_Z = FULLSTEPS_PER_REV_Z*MICROSTEPPING_DEFAULT_Z/SCREW_PITCH_Z_MM
+    usteps_per_rev_theta = FULLSTEPS_PER_REV_THETA*MICROSTEPPING_DEFAULT_THETA
+    return [SimulatedAxis(MAX_VELOCITY_X_MM*usteps_per_mm_X,MAX_ACCELERATION_X_MM*usteps_per_mm_X,HOMING_VELOCITY_X*MAX_VELOCITY_X_MM*usteps_per_mm_X),
+            SimulatedAxis(MAX_VELOCITY_Y_MM*usteps_per_mm_Y,MAX_ACCELERATION_Y_MM*usteps_per_mm_Y,HOMING_VELOCITY_Y*MAX_VELOCITY_Y_MM*usteps_per_mm_Y),
+            SimulatedAxis(MAX_VELOCITY_Z_MM*usteps_per_mm_Z,MAX_ACCELERATION_Z_MM*usteps_per_mm_Z,HOMING_VELOCITY_Z*MAX_VELOCITY_Z_MM*usteps_per_mm_Z),
+            SimulatedAxis(SIMULATION.MAX_VELOCITY_THETA_REV*usteps_per_rev_theta,SIMULATION.MAX_ACCELERATION_THETA_REV*usteps_per_rev_theta)]
+
+class SimulationClock(object):
+
+    def __init__(self,time_scale=SIMULATION.TIME_SCALE):
+        self.time_scale = time_scale
+        self.t0_real = time.monotonic()
+        self.events = [] # heap of [t, sequence, callback]
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.stop_signal_received = False
+        self.thread = None
+
+    def now(self):
+        return (time.monotonic()-self.t0_real)*self.time_scale
+
+    def sleep(self,duration):
+        # wait for a duration in simulated time
+        time.sleep(duration/self.time_scale)
+
+    def call_at(self,t,callback):
+        with self.condition:
+            heapq.heappush(self.events,[t,self.sequence,callback])
+            self.sequence = self.sequence + 1
+            self.condition.notify()
+
+    def call_later(self,delay,callback):
+        self.call_at(self.now()+delay,callback)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run,daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stop_signal_received:
+                        return
+                    if len(self.events) > 0:
+                        remaining = (self.events[0][0] - self.now())/self.time_scale
+                        if remaining <= 0:
+                            break
+                        self.condition.wait(remaining)
+                    else:
+                        self.condition.wait()
+                [t,sequence,callback] = heapq.heappop(self.events)
+            try:
+                callback(t)
+            except Exception as e:
+                print('simulation event failed: ' + str(e))
+
+    def close(self):
+        with self.condition:
+            self.stop_signal_received = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
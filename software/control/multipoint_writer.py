@@ -0,0 +1,94 @@
+import os
+import json
+import time
+from threading import Thread
+from queue import Empty
+
+from control._def import *
+from control.utils_queue import ByteBoundedQueue
+import control.metrics as metrics
+import control.image_codecs as image_codecs
+
+try:
+    import tifffile
+except:
+    tifffile = None
+    print('tifffile import error - multipoint images will be saved as one file per image')
+
+# Saves multipoint images on a background thread, so that the acquisition loop does not wait for the disk.
+#
+# With MULTIPOINT.SAVE_AS_TIFF_STACK (and tifffile installed), the planes of a FOV (or of a
+# whole time point) are appended to one multi-page TIFF. Every page carries its metadata
+# as JSON in the ImageDescription tag: stage x/y/z, configuration, exposure, gain,
+# illumination and timestamp. Otherwise every image is written to its own file, as before.
+
+class MultiPointImageWriter(object):
+
+    def __init__(self,max_queue_bytes=IMAGE_SAVER.MAX_QUEUE_BYTES):
+        self.save_as_tiff_stack = MULTIPOINT.SAVE_AS_TIFF_STACK and tifffile is not None
+        self.queue = ByteBoundedQueue(max_queue_bytes)
+        self.stacks = {} # path: tifffile.TiffWriter
+        self.stop_signal_received = False
+        self.metric_save_latency = metrics.histogram('save_latency_s',saver='multipoint')
+        self.metric_queue_bytes = metrics.gauge('multipoint_saver_queue_bytes')
+        self.thread = Thread(target=self.process_queue)
+        self.thread.start()
+
+    def save_plane(self,stack_path,image,metadata):
+        # blocks only when more than max_queue_bytes are waiting to be written
+        self.queue.put(['plane',stack_path,image,metadata],image.nbytes)
+        self.metric_queue_bytes.set(self.queue.get_nbytes())
+
+    def save_image(self,saving_path,image):
+        self.queue.put(['image',saving_path,image,None],image.nbytes)
+        self.metric_queue_bytes.set(self.queue.get_nbytes())
+
+    def close_stack(self,stack_path):
+        self.queue.put(['close',stack_path,None,None],0)
+
+    def process_queue(self):
+        while True:
+            if self.stop_signal_received:
+                return
+            try:
+                [task,path,image,metadata] = self.queue.get(timeout=0.1)
+            except Empty:
+                continue
+            try:
+                t0 = time.perf_counter()
+                if task == 'plane':
+                    self._write_plane(path,image,metadata)
+                elif task == 'image':
+                    image_codecs.imwrite(path,image)
+                elif task == 'close':
+                    self._close_stack(path)
+                if image is not None:
+                    self.metric_save_latency.observe(time.perf_counter()-t0)
+            except Exception as e:
+                print('saving ' + str(path) + ' failed: ' + str(e))
+            self.queue.task_done()
+
+    def _write_plane(self,stack_path,image,metadata):
+        if stack_path not in self.stacks:
+            self.stacks[stack_path] = tifffile.TiffWriter(stack_path,bigtiff=True)
+        photometric = 'rgb' if image.ndim == 3 else 'minisblack'
+        # metadata=None keeps tifffile from replacing the per-page description with its own
+        self.stacks[stack_path].write(image,photometric=photometric,description=json.dumps(metadata),metadata=None,contiguous=False)
+
+    def _close_stack(self,stack_path):
+        stack = self.stacks.pop(stack_path,None)
+        if stack is not None:
+            stack.close()
+
+    def close(self):
+        # waits until everything has been written
+        self.queue.join()
+        for stack_path in list(self.stacks.keys()):
+            self._close_stack(stack_path)
+        self.stop_signal_received = True
+        self.thread.join()
+
+def read_plane_metadata(stack_path):
+    # list of the metadata of all planes of a stack written by MultiPointImageWriter
+    with tifffile.TiffFile(stack_path) as tif:
+        return [json.loads(page.description) for page in tif.pages]
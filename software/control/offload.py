@@ -0,0 +1,272 @@
+import multiprocessing
+from multiprocessing import shared_memory
+import threading
+import itertools
+import queue
+import time
+import numpy as np
+
+from control._def import *
+import control.frame_pool as frame_pool
+import control.metrics as metrics
+
+# Runs CPU-heavy frame analysis (tracking, focus measures, phase correlation) in worker
+# processes, so that it does not compete with frame handling for the GIL.
+#
+# Frames are copied once into shared memory slots; a task only carries the slot names,
+# shapes and dtypes, and the workers return small results (centroids, scores, shifts)
+# over a queue - pixels are never pickled. Functions are registered by name and must be
+# module level functions (they are pickled by reference), called as
+# function(state,*images,*args) where state is a dict kept by the worker between calls.
+# Tasks submitted with the same key always run on the same worker, which lets stateful
+# functions such as the object tracker keep their state.
+#
+#   executor = OffloadExecutor()
+#   executor.register('focus_measure',offload.focus_measure)
+#   task_id = executor.submit('focus_measure',[image],callback=on_result)
+#   result = executor.run('focus_measure',[image]) # blocking
+
+class SharedFrameSlot(object):
+
+    def __init__(self,index):
+        self.index = index
+        self.shm = None
+        self.size = 0
+
+    def write(self,image):
+        image = np.asarray(image)
+        if self.shm is None or image.nbytes > self.size:
+            # grow the slot - workers attach to the new block by its name
+            self.close()
+            self.size = max(image.nbytes,1)
+            self.shm = shared_memory.SharedMemory(create=True,size=self.size)
+        buffer = np.ndarray(image.shape,dtype=image.dtype,buffer=self.shm.buf)
+        np.copyto(buffer,image)
+        del buffer
+        return [self.shm.name,image.shape,image.dtype.str]
+
+    def close(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+class OffloadExecutor(object):
+
+    def __init__(self,num_workers=OFFLOAD.NUM_WORKERS,num_slots=OFFLOAD.NUM_SLOTS):
+        self.num_workers = num_workers
+        self.functions = {}
+        self.slots = [SharedFrameSlot(i) for i in range(num_slots)]
+        self.free_slots = queue.Queue()
+        for slot in self.slots:
+            self.free_slots.put(slot)
+        self.pending = {} # task_id: [slots, callback, error_callback, event, result, submit time]
+        self.abandoned = {} # task_id: slots, of the tasks whose wait() timed out - the slots are freed when the late result arrives
+        self.lock = threading.Lock()
+        self.task_counter = itertools.count()
+        self.metric_tasks_dropped = metrics.counter('offload_tasks_dropped')
+        self.metric_task_time = metrics.histogram('offload_task_time_s')
+
+        # spawn - the workers do not inherit the Qt application and the camera threads
+        context = multiprocessing.get_context('spawn')
+        self.result_queue = context.Queue()
+        self.task_queues = []
+        self.workers = []
+        for i in range(num_workers):
+            task_queue = context.Queue()
+            worker = context.Process(target=_worker_main,args=(task_queue,self.result_queue),daemon=True)
+            worker.start()
+            self.task_queues.append(task_queue)
+            self.workers.append(worker)
+        self.next_worker = itertools.cycle(range(num_workers))
+
+        self.stop_signal_received = False
+        self.thread = threading.Thread(target=self._process_results,daemon=True)
+        self.thread.start()
+
+    def register(self,name,function):
+        self.functions[name] = function
+
+    def submit(self,name,images,args=(),key=None,callback=None,error_callback=None):
+        # returns the task id, or None if there are not enough free slots (the task is dropped)
+        # without a callback, the result has to be collected with wait()
+        slots = []
+        try:
+            for image in images:
+                slots.append(self.free_slots.get_nowait())
+        except queue.Empty:
+            for slot in slots:
+                self.free_slots.put(slot)
+            self.metric_tasks_dropped.inc()
+            return None
+        frames = [slot.write(image) for slot,image in zip(slots,images)]
+        task_id = next(self.task_counter)
+        with self.lock:
+            self.pending[task_id] = [slots,callback,error_callback,threading.Event(),None,time.perf_counter()]
+        if key is None:
+            worker_index = next(self.next_worker)
+        else:
+            worker_index = hash(key)%self.num_workers
+        self.task_queues[worker_index].put([task_id,self.functions[name],frames,args,key])
+        return task_id
+
+    def wait(self,task_id,timeout=OFFLOAD.RESULT_TIMEOUT_S):
+        with self.lock:
+            task = self.pending.get(task_id)
+        if task is None:
+            raise KeyError('unknown offload task ' + str(task_id))
+        task[3].wait(timeout)
+        with self.lock:
+            del self.pending[task_id]
+            if task[4] is None:
+                # the worker may still be reading the slots - they are freed when its result arrives, which is ignored
+                self.abandoned[task_id] = task[0]
+                raise TimeoutError('offload task ' + str(task_id) + ' did not finish within ' + str(timeout) + ' s')
+        [succeeded,result] = task[4]
+        if not succeeded:
+            raise RuntimeError('offload task ' + str(task_id) + ' failed: ' + result)
+        return result
+
+    def run(self,name,images,args=(),key=None,timeout=OFFLOAD.RESULT_TIMEOUT_S):
+        # blocking - waits for a free slot instead of dropping the task
+        task_id = self.submit(name,images,args,key)
+        while task_id is None:
+            time.sleep(SLEEP_TIME_S)
+            task_id = self.submit(name,images,args,key)
+        return self.wait(task_id,timeout)
+
+    def _process_results(self):
+        while not self.stop_signal_received:
+            try:
+                [task_id,succeeded,result] = self.result_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            except (EOFError,OSError):
+                return
+            with self.lock:
+                task = self.pending.get(task_id)
+                if task is not None:
+                    task[4] = [succeeded,result]
+                    if task[1] is not None:
+                        # results delivered through a callback are not waited for
+                        del self.pending[task_id]
+                    slots = task[0]
+                else:
+                    # nobody waits for the result anymore
+                    slots = self.abandoned.pop(task_id,[])
+            for slot in slots:
+                self.free_slots.put(slot)
+            if task is None:
+                continue
+            [slots,callback,error_callback,event,_,t0] = task
+            self.metric_task_time.observe(time.perf_counter()-t0)
+            event.set()
+            if callback is not None:
+                try:
+                    if succeeded:
+                        callback(result)
+                    else:
+                        print('offload task failed: ' + result)
+                        if error_callback is not None:
+                            error_callback(result)
+                except Exception as e:
+                    print('offload callback failed: ' + str(e))
+
+    def close(self):
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+        self.stop_signal_received = True
+        self.thread.join()
+        for slot in self.slots:
+            slot.close()
+
+class OffloadConsumer(object):
+    # adapts an offloaded function to the frame signals of StreamHandler:
+    #   streamHandler.packet_image_for_tracking.connect(consumer.on_new_frame)
+    #   streamHandler.image_to_display.connect(consumer.on_new_image)
+    # callback(result,frame_ID,timestamp) is called from the executor's result thread
+
+    def __init__(self,executor,name,callback=None,args=(),key=None):
+        self.executor = executor
+        self.name = name
+        self.callback = callback
+        self.args = args
+        self.key = key
+
+    def on_new_frame(self,image,frame_ID,timestamp):
+        # the frame is copied into shared memory, so the pool slot can be released right away
+        try:
+            callback = None
+            if self.callback is not None:
+                callback = lambda result: self.callback(result,frame_ID,timestamp)
+            self.executor.submit(self.name,[image],self.args,self.key,callback)
+        finally:
+            frame_pool.release_frame(image)
+
+    def on_new_image(self,image):
+        self.on_new_frame(image,None,None)
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name,track=False)
+    except TypeError:
+        # python < 3.13 - the spawned workers share the parent's resource tracker, so registering the block again is harmless
+        return shared_memory.SharedMemory(name=name)
+
+def _worker_main(task_queue,result_queue):
+    attached = {}
+    states = {}
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        [task_id,function,frames,args,key] = task
+        images = []
+        try:
+            for [name,shape,dtype] in frames:
+                if name not in attached:
+                    if len(attached) >= 4*OFFLOAD.NUM_SLOTS:
+                        # slots have been reallocated - drop the oldest attachments
+                        for stale_name in list(attached.keys())[:OFFLOAD.NUM_SLOTS]:
+                            attached.pop(stale_name).close()
+                    attached[name] = _attach(name)
+                images.append(np.ndarray(shape,dtype=np.dtype(dtype),buffer=attached[name].buf))
+            state = states.setdefault(key,{})
+            result = function(state,*images,*args)
+            result_queue.put([task_id,True,result])
+        except Exception as e:
+            result_queue.put([task_id,False,type(e).__name__ + ': ' + str(e)])
+        del images
+    for shm in attached.values():
+        try:
+            shm.close()
+        except Exception:
+            pass
+
+# functions that can be offloaded
+
+def focus_measure(state,image):
+    import control.utils as utils
+    return float(utils.calculate_focus_measure(image))
+
+def phase_correlation_shift(state,image1,image2,upsample_factor=5):
+    import skimage.registration
+    shifts,error,phasediff = skimage.registration.phase_cross_correlation(image1,image2,upsample_factor=upsample_factor,space='real')
+    return [float(x) for x in shifts]
+
+def track_object(state,image,is_first_frame,tracker_type,init_method,roi_bbox,search_area):
+    # keeps its own Tracker_Image per key; the settings of the GUI-side tracker are passed with every frame
+    if 'tracker' not in state:
+        import control.tracking as tracking
+        state['tracker'] = tracking.Tracker_Image()
+    tracker = state['tracker']
+    tracker.tracker_type = tracker_type
+    tracker.init_method = init_method
+    tracker.roi_bbox = roi_bbox
+    tracker.searchArea = search_area
+    objectFound,centroid,rect_pts = tracker.track(image,None,is_first_frame=is_first_frame)
+    return objectFound,centroid,rect_pts
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+
+from control._def import *
+import control.frame_pool as frame_pool
+import control.metrics as metrics
+
+# A small dataflow engine for per-frame processing.
+#
+# Every stage (transform, display, save, track, focus measure, custom analysis) is a
+# node with its own worker thread, target rate and bounded input queue. A node calls
+# function(image,frame_ID,timestamp); if the function returns an image, it is passed
+# on to the node's children. Submitting a frame only enqueues it, so the camera
+# callback no longer pays for the work done by the consumers.
+
+class ProcessingNode(object):
+
+    def __init__(self,name,function,fps=None,queue_policy=QueuePolicy.DROP_OLDEST,queue_size=1):
+        self.name = name
+        self.function = function
+        self.fps = fps # None: process every frame
+        self.queue_policy = queue_policy
+        self.queue_size = queue_size
+        self.enabled = True
+        self.children = []
+
+        self.timestamp_last_accepted = 0
+        self.num_frames_received = 0
+        self.num_frames_processed = 0
+        self.num_frames_dropped = 0
+        self.metric_frames_dropped = metrics.counter('frames_dropped',reason='node_queue_full',node=name)
+        self.metric_queue_depth = metrics.gauge('processing_queue_depth',node=name)
+        self.metric_processing_time = metrics.histogram('processing_time_s',node=name)
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._stop_requested = False
+        self.thread = threading.Thread(target=self._process_queue,daemon=True)
+        self.thread.start()
+
+    def set_fps(self,fps):
+        self.fps = fps
+
+    def submit(self,image,frame_ID,timestamp):
+        if not self.enabled:
+            return False
+        time_now = time.monotonic()
+        if self.fps is not None and time_now-self.timestamp_last_accepted < 1/self.fps:
+            return False
+        with self._condition:
+            self.num_frames_received = self.num_frames_received + 1
+            if len(self._queue) >= self.queue_size:
+                if self.queue_policy == QueuePolicy.DROP_NEWEST:
+                    self.num_frames_dropped = self.num_frames_dropped + 1
+                    self.metric_frames_dropped.inc()
+                    return False
+                elif self.queue_policy == QueuePolicy.DROP_OLDEST:
+                    [image_dropped,frame_ID_dropped,timestamp_dropped] = self._queue.popleft()
+                    frame_pool.release_frame(image_dropped)
+                    self.num_frames_dropped = self.num_frames_dropped + 1
+                    self.metric_frames_dropped.inc()
+                else:
+                    while len(self._queue) >= self.queue_size and not self._stop_requested:
+                        self._condition.wait()
+            frame_pool.retain_frame(image)
+            self._queue.append([image,frame_ID,timestamp])
+            self.metric_queue_depth.set(len(self._queue))
+            self._condition.notify_all()
+        self.timestamp_last_accepted = time_now
+        return True
+
+    def _process_queue(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stop_requested:
+                    self._condition.wait()
+                if self._stop_requested:
+                    return
+                [image,frame_ID,timestamp] = self._queue.popleft()
+                self._condition.notify_all() # wake up a producer blocked on a full queue
+            try:
+                t0 = time.perf_counter()
+                image_out = self.function(image,frame_ID,timestamp)
+                self.metric_processing_time.observe(time.perf_counter()-t0)
+                if image_out is not None:
+                    for child in self.children:
+                        child.submit(image_out,frame_ID,timestamp)
+                self.num_frames_processed = self.num_frames_processed + 1
+            except Exception as e:
+                print('processing node ' + self.name + ' failed: ' + str(e))
+            frame_pool.release_frame(image)
+
+    def get_queue_depth(self):
+        return len(self._queue)
+
+    def get_stats(self):
+        return {'queue_depth':len(self._queue),
+                'frames_received':self.num_frames_received,
+                'frames_processed':self.num_frames_processed,
+                'frames_dropped':self.num_frames_dropped}
+
+    def close(self):
+        with self._condition:
+            self._stop_requested = True
+            while self._queue:
+                [image,frame_ID,timestamp] = self._queue.popleft()
+                frame_pool.release_frame(image)
+            self._condition.notify_all()
+        self.thread.join()
+
+class FrameProcessingGraph(object):
+
+    def __init__(self):
+        self.nodes = {}
+        self.root_nodes = []
+
+    def add_node(self,name,function,fps=None,queue_policy=QueuePolicy.DROP_OLDEST,queue_size=1,parent=None):
+        if name in self.nodes:
+            raise ValueError('processing node ' + name + ' already exists')
+        node = ProcessingNode(name,function,fps,queue_policy,queue_size)
+        if parent is None:
+            self.root_nodes.append(node)
+        else:
+            self.nodes[parent].children.append(node)
+        self.nodes[name] = node
+        return node
+
+    def remove_node(self,name):
+        node = self.nodes.pop(name)
+        if node in self.root_nodes:
+            self.root_nodes.remove(node)
+        for other in self.nodes.values():
+            if node in other.children:
+                other.children.remove(node)
+        node.close()
+
+    def get_node(self,name):
+        return self.nodes[name]
+
+    def submit(self,image,frame_ID,timestamp):
+        for node in self.root_nodes:
+            node.submit(image,frame_ID,timestamp)
+
+    def get_stats(self):
+        return {name:node.get_stats() for name,node in self.nodes.items()}
+
+    def close(self):
+        for node in self.nodes.values():
+            node.close()
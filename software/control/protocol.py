@@ -0,0 +1,56 @@
+import struct
+import numpy as np
+
+from control._def import *
+
+# Byte layouts of the mcu protocol (octopi_firmware_v1_030), compiled once.
+#
+# Commands are 8 bytes: command id, command (CMD_SET), parameters, big endian. A command is
+# encoded in place into a bytearray - the Microcontroller reuses one tx buffer under its send lock.
+# The status message is 24 bytes; a large backlog of queued status messages is decoded in one
+# numpy.frombuffer call, a few messages with struct.
+#
+#   encode(COMMAND_MOVE,buffer,cmd_id,CMD_SET.MOVE_X,usteps)
+#   [cmd_id,status,x,y,z,theta,buttons,crc] = decode_status(buffer,offset)
+#   packets = decode_status_packets(buffer,count)  # packets['x'], packets['status'], ...
+#   [cmd_ids,statuses,xs,ys,zs,thetas,buttons,crcs] = decode_status_backlog(buffer)
+
+COMMAND = struct.Struct('>BB6x') # command without parameters
+COMMAND_MOVE = struct.Struct('>BBi2x') # MOVE_*, MOVETO_*: usteps
+COMMAND_HOME_OR_ZERO = struct.Struct('>BBBBB3x') # axis, HOME_OR_ZERO code, HOME_OR_ZERO code of y (AXIS.XY)
+COMMAND_SET_ILLUMINATION = struct.Struct('>BBBH3x') # source, intensity (0-65535)
+COMMAND_SET_ILLUMINATION_LED_MATRIX = struct.Struct('>BBBBBB2x') # source, r, g, b (0-255)
+
+STATUS = struct.Struct(MicrocontrollerDef.MSG_FORMAT)
+STATUS_DTYPE = np.dtype([('cmd_id','u1'),
+                         ('status','u1'),
+                         ('x','>i4'),
+                         ('y','>i4'),
+                         ('z','>i4'),
+                         ('theta','>i4'),
+                         ('buttons','u1'),
+                         ('reserved','V4'),
+                         ('crc','u1')])
+
+def encode(layout,buffer,cmd_id,*parameters):
+    layout.pack_into(buffer,0,cmd_id,*parameters)
+    return buffer
+
+def new_command(layout,*parameters):
+    # a command of its own, e.g. to be kept and sent repeatedly. the command id is filled in when it is sent
+    return encode(layout,bytearray(MicrocontrollerDef.CMD_LENGTH),0,*parameters)
+
+def decode_status(buffer,offset=0):
+    # [cmd_id, status, x, y, z, theta, buttons, crc]
+    return STATUS.unpack_from(buffer,offset)
+
+def decode_status_packets(buffer,count=-1,offset=0):
+    # structured array with one record per status message. a copy - buffer can be changed afterwards
+    return np.frombuffer(buffer,dtype=STATUS_DTYPE,count=count,offset=offset).copy()
+
+def decode_status_backlog(buffer):
+    # the status messages in buffer by field: [cmd_ids, statuses, xs, ys, zs, thetas, buttons, crcs]
+    if len(buffer) < MicrocontrollerDef.BATCH_DECODE_MIN_PACKETS*MicrocontrollerDef.MSG_LENGTH:
+        return list(zip(*STATUS.iter_unpack(buffer)))
+    packets = decode_status_packets(buffer)
+    return [packets[name] for name in ('cmd_id','status','x','y','z','theta','buttons','crc')]
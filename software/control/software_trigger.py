@@ -0,0 +1,157 @@
+import threading
+import time
+
+from control._def import *
+import control.metrics as metrics
+
+# Software trigger generator running on its own thread, independent of the GUI event loop.
+#
+# Deadlines are kept on the monotonic clock as t0 + n*period, so they do not drift with the
+# time spent in the callback. The thread sleeps until shortly before the deadline and
+# spins for the rest (SOFTWARE_TRIGGER.SPIN_S). A deadline that is more than one period late
+# is counted as missed and skipped, instead of firing a burst of triggers to catch up.
+# The rate can be changed and triggering paused and resumed without restarting the thread.
+# call_soon() runs a function on the same thread between two triggers, so that commands sent
+# from it stay in order with the commands sent by the trigger callback.
+#
+#   generator = SoftwareTriggerGenerator(callback,fps)
+#   generator.resume()  # starts the thread on first use
+#   generator.call_soon(function)
+#   generator.pause()   # returns once a trigger in progress has finished
+#   generator.close()
+
+class SoftwareTriggerGenerator(object):
+
+    def __init__(self,callback,fps=1):
+        self.callback = callback
+        self.period = 1/fps
+        self.paused = True
+        self.stop_signal_received = False
+        self.last_deadline = None # None: trigger right away
+        self.tasks = [] # functions to run on the thread, see call_soon()
+        self.condition = threading.Condition()
+        self.callback_lock = threading.Lock()
+        self.thread = None
+
+        self.num_triggers = 0
+        self.num_missed_deadlines = 0
+        self.jitter_s_max = 0
+        self.jitter_s_sum = 0
+        self.metric_jitter = metrics.histogram('software_trigger_jitter_s')
+        self.metric_missed_deadlines = metrics.counter('software_trigger_missed_deadlines')
+
+    def set_fps(self,fps):
+        # the next trigger is due one new period after the last one
+        with self.condition:
+            self.period = 1/fps
+            self.condition.notify()
+
+    def resume(self):
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run,daemon=True)
+                self.thread.start()
+            if self.paused:
+                self.paused = False
+                self.last_deadline = None
+                self.condition.notify()
+
+    def call_soon(self,function):
+        # runs function on the generator's thread before the next trigger, or right away if the thread has not been started
+        with self.condition:
+            if self.thread is not None:
+                self.tasks.append(function)
+                self.condition.notify()
+                return
+        function()
+
+    def pause(self):
+        with self.condition:
+            self.paused = True
+            self.condition.notify()
+        # wait for a trigger that is being sent
+        with self.callback_lock:
+            pass
+
+    def is_paused(self):
+        return self.paused
+
+    def get_stats(self):
+        return {'triggers':self.num_triggers,
+                'missed_deadlines':self.num_missed_deadlines,
+                'jitter_s_mean':self.jitter_s_sum/self.num_triggers if self.num_triggers > 0 else 0,
+                'jitter_s_max':self.jitter_s_max}
+
+    def _wait_for_deadline(self):
+        # returns the deadline once it is due, or None if paused or closed in the meantime
+        with self.condition:
+            while True:
+                if self.stop_signal_received:
+                    return None
+                if len(self.tasks) > 0:
+                    return None
+                if self.paused:
+                    self.condition.wait()
+                    continue
+                if self.last_deadline is None:
+                    deadline = time.perf_counter()
+                else:
+                    deadline = self.last_deadline + self.period
+                remaining = deadline - time.perf_counter()
+                if remaining <= SOFTWARE_TRIGGER.SPIN_S:
+                    break
+                # woken up early by set_fps(), call_soon(), pause() or close()
+                self.condition.wait(remaining - SOFTWARE_TRIGGER.SPIN_S)
+        while time.perf_counter() < deadline:
+            pass
+        return deadline
+
+    def _run_tasks(self):
+        with self.condition:
+            [tasks,self.tasks] = [self.tasks,[]]
+        for task in tasks:
+            with self.callback_lock:
+                try:
+                    task()
+                except Exception as e:
+                    print('software trigger task failed: ' + str(e))
+
+    def _run(self):
+        while True:
+            deadline = self._wait_for_deadline()
+            self._run_tasks()
+            if deadline is None:
+                if self.stop_signal_received:
+                    return
+                continue
+            with self.callback_lock:
+                if self.paused:
+                    continue
+                t_now = time.perf_counter()
+                try:
+                    self.callback()
+                except Exception as e:
+                    print('software trigger failed: ' + str(e))
+            jitter = t_now - deadline
+            self.num_triggers = self.num_triggers + 1
+            self.jitter_s_sum = self.jitter_s_sum + jitter
+            self.jitter_s_max = max(self.jitter_s_max,jitter)
+            self.metric_jitter.observe(jitter)
+            with self.condition:
+                if self.paused:
+                    continue
+                self.last_deadline = deadline
+                # more than a period behind the next deadline - skip the deadlines that have passed
+                late = time.perf_counter() - (deadline + self.period)
+                if late > self.period:
+                    num_missed = int(late/self.period)
+                    self.num_missed_deadlines = self.num_missed_deadlines + num_missed
+                    self.metric_missed_deadlines.inc(num_missed)
+                    self.last_deadline = deadline + num_missed*self.period
+
+    def close(self):
+        with self.condition:
+            self.stop_signal_received = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,154 @@
+import math
+import threading
+import time
+import numpy as np
+
+from control._def import *
+
+# Stage telemetry: every status packet of the mcu (sent every 10 ms) is recorded in a ring
+# buffer with the time it was received, so that the stage position can be looked up for any
+# recent point in time - e.g. when a frame was exposed - instead of using the latest position.
+#
+# One thread (the serial reader) appends, any thread can query. The buffer is lock-free:
+# the writer fills the next slot and then increments num_entries, a reader copies the slots
+# it needs and drops those that the writer has overwritten in the meantime.
+#
+#   telemetry.append(time.monotonic(),x,y,z,theta,status)    # positions in usteps
+#   telemetry.position_at(t)                                   # [x,y,z,theta], interpolated between packets
+#   telemetry.position_at(np.array([t0,t1,...]))               # one row per time
+#
+# The telemetry bus passes every packet on to any number of subscribers. Positions are
+# converted to mm (and rad) once per packet with precomputed factors, and each subscriber
+# declares the maximum rate at which it wants updates: GUI position labels do not need
+# 100 Hz, and the packets in between are coalesced - a subscriber always gets the latest state.
+#
+#   subscription = bus.subscribe(callback,max_rate_hz=STAGE_TELEMETRY.GUI_UPDATE_RATE_HZ)  # callback(state)
+#   bus.publish(t,x,y,z,theta,status)                                                      # from the serial reader thread
+#   bus.unsubscribe(subscription)
+
+class StageTelemetryBuffer(object):
+
+    def __init__(self,capacity=STAGE_TELEMETRY.BUFFER_LENGTH):
+        self.capacity = capacity
+        self.t = np.zeros(capacity) # monotonic receive time (s)
+        self.pos = np.zeros((capacity,4)) # x, y, z, theta in usteps
+        self.status = np.zeros(capacity,dtype=np.uint8)
+        self.num_entries = 0 # total number of entries appended, only changed by the writer
+
+    def append(self,t,x_pos,y_pos,z_pos,theta_pos,status):
+        i = self.num_entries % self.capacity
+        self.t[i] = t
+        self.pos[i] = (x_pos,y_pos,z_pos,theta_pos)
+        self.status[i] = status
+        # publish the entry
+        self.num_entries = self.num_entries + 1
+
+    def get_entries(self,max_entries=None):
+        # the most recent entries, oldest first: [t, pos, status]
+        num_entries = self.num_entries
+        n = min(num_entries,self.capacity)
+        if max_entries is not None:
+            n = min(n,max_entries)
+        indices = np.arange(num_entries-n,num_entries) % self.capacity
+        t = self.t[indices]
+        pos = self.pos[indices]
+        status = self.status[indices]
+        # slots that the writer has reused while they were copied, plus the one it may be writing right now
+        num_overwritten = self.num_entries - num_entries + 1
+        if num_overwritten > self.capacity - n:
+            k = min(num_overwritten-(self.capacity-n),n)
+            [t,pos,status] = [t[k:],pos[k:],status[k:]]
+        return [t,pos,status]
+
+    def get_latest(self):
+        [t,pos,status] = self.get_entries(1)
+        if len(t) == 0:
+            return None
+        return [t[0],pos[0],status[0]]
+
+    def position_at(self,t,max_entries=None):
+        # positions at monotonic time(s) t, linearly interpolated between the packets received before and after.
+        # before the oldest and after the latest entry, the position of that entry is returned. None if there are no entries
+        [t_entries,pos,status] = self.get_entries(max_entries)
+        if len(t_entries) == 0:
+            return None
+        t = np.asarray(t,dtype=float)
+        result = np.empty(t.shape + (4,))
+        for axis in range(4):
+            result[...,axis] = np.interp(t,t_entries,pos[:,axis])
+        return result
+
+def monotonic_from_wall_time(t_wall):
+    # frames are timestamped with time.time(), the telemetry with time.monotonic()
+    return t_wall - (time.time() - time.monotonic())
+
+def get_mm_per_ustep(x_microstepping=MICROSTEPPING_DEFAULT_X,y_microstepping=MICROSTEPPING_DEFAULT_Y,z_microstepping=MICROSTEPPING_DEFAULT_Z,theta_microstepping=MICROSTEPPING_DEFAULT_THETA):
+    # [x (mm), y (mm), z (mm), theta (rad)] per ustep or encoder count reported by the mcu
+    if USE_ENCODER_X:
+        mm_per_ustep_X = STAGE_POS_SIGN_X*ENCODER_STEP_SIZE_X_MM
+    else:
+        mm_per_ustep_X = STAGE_POS_SIGN_X*(SCREW_PITCH_X_MM/(x_microstepping*FULLSTEPS_PER_REV_X))
+    if USE_ENCODER_Y:
+        mm_per_ustep_Y = STAGE_POS_SIGN_Y*ENCODER_STEP_SIZE_Y_MM
+    else:
+        mm_per_ustep_Y = STAGE_POS_SIGN_Y*(SCREW_PITCH_Y_MM/(y_microstepping*FULLSTEPS_PER_REV_Y))
+    if USE_ENCODER_Z:
+        mm_per_ustep_Z = STAGE_POS_SIGN_Z*ENCODER_STEP_SIZE_Z_MM
+    else:
+        mm_per_ustep_Z = STAGE_POS_SIGN_Z*(SCREW_PITCH_Z_MM/(z_microstepping*FULLSTEPS_PER_REV_Z))
+    if USE_ENCODER_THETA:
+        rad_per_ustep_theta = STAGE_POS_SIGN_THETA*ENCODER_STEP_SIZE_THETA
+    else:
+        rad_per_ustep_theta = STAGE_POS_SIGN_THETA*(2*math.pi/(theta_microstepping*FULLSTEPS_PER_REV_THETA))
+    return [mm_per_ustep_X,mm_per_ustep_Y,mm_per_ustep_Z,rad_per_ustep_theta]
+
+class StageState(object):
+    # one status packet, with the positions converted
+    def __init__(self,t,x_pos,y_pos,z_pos,theta_pos,x_mm,y_mm,z_mm,theta_rad,status):
+        self.t = t # monotonic receive time
+        self.x_pos = x_pos # usteps or encoder counts
+        self.y_pos = y_pos
+        self.z_pos = z_pos
+        self.theta_pos = theta_pos
+        self.x_mm = x_mm
+        self.y_mm = y_mm
+        self.z_mm = z_mm
+        self.theta_rad = theta_rad
+        self.status = status
+
+class TelemetryBus(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = [] # [callback, minimum interval between updates (s), time of the last update]
+        self.latest = None
+        self.set_conversion_factors(get_mm_per_ustep())
+
+    def set_conversion_factors(self,mm_per_ustep):
+        # [x (mm), y (mm), z (mm), theta (rad)] per ustep
+        [self.mm_per_ustep_X,self.mm_per_ustep_Y,self.mm_per_ustep_Z,self.rad_per_ustep_theta] = mm_per_ustep
+
+    def subscribe(self,callback,max_rate_hz=None):
+        subscription = [callback,1/max_rate_hz if max_rate_hz else 0,-float('inf')]
+        with self.lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self,subscription):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+
+    def publish(self,t,x_pos,y_pos,z_pos,theta_pos,status):
+        state = StageState(t,x_pos,y_pos,z_pos,theta_pos,
+                           x_pos*self.mm_per_ustep_X,y_pos*self.mm_per_ustep_Y,z_pos*self.mm_per_ustep_Z,theta_pos*self.rad_per_ustep_theta,status)
+        self.latest = state
+        # the list is replaced, not modified, on (un)subscribe - it can be iterated without the lock
+        for subscription in self.subscriptions:
+            if t - subscription[2] < subscription[1]:
+                continue
+            subscription[2] = t
+            try:
+                subscription[0](state)
+            except Exception as e:
+                print('telemetry subscriber failed: ' + str(e))
+        return state
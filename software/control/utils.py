@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 from numpy import std, square, mean
 
 def crop_image(image,crop_width,crop_height):
@@ -49,4 +50,136 @@ def rotate_and_flip_image(image,rotate_image_angle,flip_image):
         elif(flip_image == 'Both'):
             image = cv2.flip(image, -1)
 
-    return image
\ No newline at end of file
+    return image
+
+class FrameTransform(object):
+    # crop + squeeze + rotate + flip as a single plan, computed once for the given settings and frame size.
+    # apply() returns a view of the input (rotations become a transpose, flips become negative strides), 
+    # so no pixel is copied; apply_contiguous() copies the result into a reusable buffer for consumers that need contiguous memory.
+    # the result matches crop_image() followed by np.squeeze() and rotate_and_flip_image()
+
+    def __init__(self,crop_width,crop_height,rotate_image_angle=0,flip_image=None):
+        self.crop_width = crop_width
+        self.crop_height = crop_height
+        self.rotate_image_angle = rotate_image_angle
+        self.flip_image = flip_image
+        # rotation -> transpose followed by a flip, combined with the requested flip
+        flip_rows = flip_image in ('Vertical','Both')
+        flip_cols = flip_image in ('Horizontal','Both')
+        self.transpose = rotate_image_angle in (90,-90)
+        if rotate_image_angle == 90:
+            flip_cols = not flip_cols
+        elif rotate_image_angle == -90:
+            flip_rows = not flip_rows
+        self.flip = (slice(None,None,-1 if flip_rows else None),slice(None,None,-1 if flip_cols else None))
+        self.shape_in = None
+        self.roi = None
+        self.buffer = None
+
+    def _plan(self,shape):
+        image_height = shape[0]
+        image_width = shape[1]
+        roi_left = int(max(image_width/2 - self.crop_width/2,0))
+        roi_right = int(min(image_width/2 + self.crop_width/2,image_width))
+        roi_top = int(max(image_height/2 - self.crop_height/2,0))
+        roi_bottom = int(min(image_height/2 + self.crop_height/2,image_height))
+        self.roi = (slice(roi_top,roi_bottom),slice(roi_left,roi_right))
+        self.shape_in = shape
+
+    def apply(self,image):
+        if image.shape != self.shape_in:
+            self._plan(image.shape)
+        image = np.squeeze(image[self.roi])
+        if image.ndim < 2:
+            return image
+        if self.transpose:
+            image = image.swapaxes(0,1)
+        return image[self.flip]
+
+    def apply_contiguous(self,image):
+        # the returned array is overwritten by the next call - consumers that keep the frame should copy it
+        image_transformed = self.apply(image)
+        if image_transformed.flags['C_CONTIGUOUS']:
+            return image_transformed
+        if self.buffer is None or self.buffer.shape != image_transformed.shape or self.buffer.dtype != image_transformed.dtype:
+            self.buffer = np.empty(image_transformed.shape,dtype=image_transformed.dtype)
+        if self.transpose and image_transformed.ndim in (2,3):
+            # a strided copy of a transposed view is cache-unfriendly, let cv2 do the transpose (and flip) in tiles
+            cv2.transpose(np.squeeze(image[self.roi]),self.buffer)
+            flip_rows = self.flip[0].step is not None
+            flip_cols = self.flip[1].step is not None
+            if flip_rows or flip_cols:
+                cv2.flip(self.buffer,-1 if (flip_rows and flip_cols) else (0 if flip_rows else 1),self.buffer)
+        else:
+            np.copyto(self.buffer,image_transformed)
+        return self.buffer
+
+class DisplayLUT(object):
+    # converts high bit depth frames to 8 bit for display: a linear window between the black and white levels
+    # (saturating cv2 arithmetic) followed by a precomputed 256 entry gamma table (cv2.LUT), into a reused buffer.
+    # with auto contrast, the levels follow percentiles of a histogram that is built from a subsample of every frame
+    # and decays over time, instead of computing percentiles of the full frame for each frame
+
+    def __init__(self,black_level=0,white_level=65535,gamma=1,auto_contrast=False,percentiles=(0.1,99.9),num_samples=65536,decay=0.8):
+        self.black_level = black_level
+        self.white_level = white_level
+        self.gamma = gamma
+        self.auto_contrast = auto_contrast
+        self.percentiles = percentiles
+        self.num_samples = num_samples
+        self.decay = decay # weight of the histogram of the previous frames
+        self.histogram = None
+        self.phase = 0
+        self.table = None
+        self.buffer = None
+        self._build_table()
+
+    def set_levels(self,black_level,white_level):
+        self.black_level = black_level
+        self.white_level = max(white_level,black_level+1)
+
+    def set_gamma(self,gamma):
+        self.gamma = gamma
+        self._build_table()
+
+    def set_auto_contrast(self,enabled):
+        self.auto_contrast = enabled
+        self.histogram = None
+
+    def _build_table(self):
+        if self.gamma == 1:
+            self.table = None
+        else:
+            self.table = ((np.arange(256)/255.0)**(1/self.gamma)*255 + 0.5).astype(np.uint8)
+
+    def update_histogram(self,image):
+        # 4096 bins over the 16 bit range; a different subsampling phase every frame, so that all pixels contribute over time
+        step = max(int(np.sqrt(image.size/self.num_samples)),1)
+        offset = self.phase % step
+        self.phase = self.phase + 1
+        samples = image[offset::step,offset::step]
+        histogram = np.bincount((samples >> 4).ravel(),minlength=4096).astype(np.float64)
+        if self.histogram is None:
+            self.histogram = histogram
+        else:
+            self.histogram = self.decay*self.histogram + (1-self.decay)*histogram
+        cumulative = np.cumsum(self.histogram)
+        cumulative = cumulative/cumulative[-1]
+        black_level = int(np.searchsorted(cumulative,self.percentiles[0]/100))*16
+        white_level = (int(np.searchsorted(cumulative,self.percentiles[1]/100))+1)*16 - 1
+        self.set_levels(black_level,white_level)
+
+    def apply(self,image,out=None):
+        # 16 bit image -> 8 bit image, written into out if it is given (and of the right shape)
+        if self.auto_contrast:
+            self.update_histogram(image)
+        if out is None or out.shape != image.shape:
+            out = np.empty(image.shape,dtype=np.uint8)
+        if self.buffer is None or self.buffer.shape != image.shape:
+            self.buffer = np.empty(image.shape,dtype=np.uint16)
+        # saturating subtraction first - convertScaleAbs would mirror values below the black level
+        cv2.subtract(image,(float(self.black_level),)*4,dst=self.buffer)
+        cv2.convertScaleAbs(self.buffer,out,alpha=255.0/(self.white_level - self.black_level))
+        if self.table is not None:
+            cv2.LUT(out,self.table,dst=out)
+        return out
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import deque
+from queue import Full, Empty
+
+class ByteBoundedQueue(object):
+    # FIFO queue bounded by the total size of its items in bytes instead of the number of items,
+    # with the same get/put_nowait/task_done/join interface as queue.Queue.
+    # an item larger than max_bytes is still accepted when the queue is empty, so that it can never block forever
+
+    def __init__(self,max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = deque()
+        self._unfinished_tasks = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._all_tasks_done = threading.Condition(self._lock)
+
+    def put(self,item,nbytes,block=True,timeout=None):
+        with self._not_full:
+            if self._items and self.nbytes + nbytes > self.max_bytes:
+                if not block:
+                    raise Full
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._items and self.nbytes + nbytes > self.max_bytes:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise Full
+                    self._not_full.wait(remaining)
+            self._items.append((item,nbytes))
+            self.nbytes = self.nbytes + nbytes
+            self._unfinished_tasks = self._unfinished_tasks + 1
+            self._not_empty.notify()
+
+    def put_nowait(self,item,nbytes):
+        self.put(item,nbytes,block=False)
+
+    def get(self,block=True,timeout=None):
+        with self._not_empty:
+            if not self._items:
+                if not block:
+                    raise Empty
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while not self._items:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise Empty
+                    self._not_empty.wait(remaining)
+            item,nbytes = self._items.popleft()
+            self.nbytes = self.nbytes - nbytes
+            self._not_full.notify_all()
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        with self._all_tasks_done:
+            self._unfinished_tasks = self._unfinished_tasks - 1
+            if self._unfinished_tasks <= 0:
+                self._unfinished_tasks = 0
+                self._all_tasks_done.notify_all()
+
+    def join(self):
+        with self._all_tasks_done:
+            while self._unfinished_tasks:
+                self._all_tasks_done.wait()
+
+    def qsize(self):
+        with self._lock:
+            return len(self._items)
+
+    def get_nbytes(self):
+        return self.nbytes
+
+    def empty(self):
+        return self.qsize() == 0
+
+class Mailbox(object):
+    # single-slot, latest-wins hand-over between threads: put() replaces an item that has not been taken yet,
+    # so the consumer always gets the newest item and never works through a backlog
+
+    def __init__(self):
+        self._item = None
+        self._has_item = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+    def put(self,item):
+        # returns True if an item that had not been taken yet was replaced
+        with self._lock:
+            replaced = self._has_item
+            self._item = item
+            self._has_item = True
+            self._not_empty.notify()
+            return replaced
+
+    def get(self,block=True,timeout=None):
+        with self._not_empty:
+            if not self._has_item:
+                if not block:
+                    raise Empty
+                self._not_empty.wait(timeout)
+                if not self._has_item:
+                    raise Empty
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def empty(self):
+        with self._lock:
+            return not self._has_item
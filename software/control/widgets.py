@@ -353,6 +353,9 @@ class RecordingWidget(QFrame):
         grid_line3.addWidget(self.entry_timeLimit, 0,3)
         grid_line3.addWidget(self.btn_record, 0,4)
 
+        self.label_buffer = QLabel('Buffer 0%')
+        grid_line3.addWidget(self.label_buffer, 0,5)
+
         self.grid = QGridLayout()
         self.grid.addLayout(grid_line1,0,0)
         self.grid.addLayout(grid_line2,1,0)
@@ -368,6 +371,8 @@ class RecordingWidget(QFrame):
         self.entry_saveFPS.valueChanged.connect(self.streamHandler.set_save_fps)
         self.entry_timeLimit.valueChanged.connect(self.imageSaver.set_recording_time_limit)
         self.imageSaver.stop_recording.connect(self.stop_recording)
+        self.imageSaver.save_fps_changed.connect(self.entry_saveFPS.setValue)
+        self.imageSaver.buffer_status.connect(self.display_buffer_status)
 
     def set_saving_dir(self):
         dialog = QFileDialog()
@@ -393,6 +398,12 @@ class RecordingWidget(QFrame):
             self.lineEdit_experimentID.setEnabled(True)
             self.btn_setSavingDir.setEnabled(True)
 
+    def display_buffer_status(self,fill,time_to_overflow):
+        if time_to_overflow < 3600:
+            self.label_buffer.setText('Buffer ' + '{:.0f}'.format(100*fill) + '%, full in ' + '{:.0f}'.format(time_to_overflow) + ' s')
+        else:
+            self.label_buffer.setText('Buffer ' + '{:.0f}'.format(100*fill) + '%')
+
     # stop_recording can be called by imageSaver
     def stop_recording(self):
         self.lineEdit_experimentID.setEnabled(True)
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from control._def import *
+
+# Write-rate governor for recordings.
+#
+# The saver's queue is a RAM spill buffer bounded in bytes (IMAGE_SAVER.SPILL_BUFFER_BYTES):
+# short disk stalls (fsync, another process writing) fill it up and it drains afterwards.
+# The governor measures how many bytes arrive and how many are written per update interval,
+# keeps a smoothed estimate of the sustained write bandwidth, and predicts when the buffer
+# would overflow at the current rates. When an overflow is expected, the saver adapts -
+# first a faster codec, then a lower save fps - instead of dropping random frames.
+#
+#   governor.on_enqueued(nbytes)       # for every frame put into the buffer
+#   governor.on_written(nbytes)        # for every frame written by a writer thread
+#   if governor.update(buffered_bytes) # once per update interval
+#       governor.is_overflow_expected()
+#       governor.get_sustainable_fps()
+
+class WriteRateGovernor(object):
+
+    def __init__(self,max_bytes,update_interval_s=IMAGE_SAVER.GOVERNOR_UPDATE_INTERVAL_S,smoothing=IMAGE_SAVER.GOVERNOR_SMOOTHING):
+        self.max_bytes = max_bytes
+        self.update_interval_s = update_interval_s
+        self.smoothing = smoothing
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.frames_in = 0
+            self.t_last_update = time.monotonic()
+            self.t_last_adaptation = self.t_last_update
+            self.rate_in = 0 # bytes/s, last interval
+            self.rate_out = 0 # bytes/s, last interval
+            self.frame_rate_in = 0 # frames/s, last interval
+            self.write_bandwidth = None # bytes/s, smoothed over the intervals in which frames were written
+            self.buffered_bytes = 0
+            self.time_to_overflow = float('inf')
+
+    def on_enqueued(self,nbytes):
+        with self.lock:
+            self.bytes_in = self.bytes_in + nbytes
+            self.frames_in = self.frames_in + 1
+
+    def on_written(self,nbytes):
+        with self.lock:
+            self.bytes_out = self.bytes_out + nbytes
+
+    def update(self,buffered_bytes):
+        # returns True if a new interval has been evaluated
+        with self.lock:
+            t_now = time.monotonic()
+            dt = t_now - self.t_last_update
+            if dt < self.update_interval_s:
+                return False
+            self.rate_in = self.bytes_in/dt
+            self.rate_out = self.bytes_out/dt
+            self.frame_rate_in = self.frames_in/dt
+            # with a backlog the writers were busy all the time, so rate_out is the bandwidth; without one it is only a lower bound.
+            # an interval without any write is a stall, which says nothing about the bandwidth - that is what the buffer is for
+            if self.bytes_out > 0 and (buffered_bytes > 0 or self.write_bandwidth is None or self.rate_out > self.write_bandwidth):
+                if self.write_bandwidth is None:
+                    self.write_bandwidth = self.rate_out
+                else:
+                    self.write_bandwidth = self.smoothing*self.rate_out + (1-self.smoothing)*self.write_bandwidth
+            self.buffered_bytes = buffered_bytes
+            net_rate = self.rate_in - self.rate_out
+            if net_rate > 0:
+                self.time_to_overflow = max(self.max_bytes-buffered_bytes,0)/net_rate
+            else:
+                self.time_to_overflow = float('inf')
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.frames_in = 0
+            self.t_last_update = t_now
+            return True
+
+    def get_fill(self):
+        return self.buffered_bytes/self.max_bytes
+
+    def is_overflow_expected(self):
+        with self.lock:
+            if time.monotonic() - self.t_last_adaptation < IMAGE_SAVER.GOVERNOR_SETTLE_TIME_S:
+                return False
+            return self.buffered_bytes > IMAGE_SAVER.GOVERNOR_HIGH_WATERMARK*self.max_bytes or self.time_to_overflow < IMAGE_SAVER.GOVERNOR_HORIZON_S
+
+    def on_adapted(self):
+        with self.lock:
+            self.t_last_adaptation = time.monotonic()
+
+    def get_sustainable_fps(self):
+        # save fps at which the frames arrive at the target fraction of the write bandwidth, None if unknown
+        with self.lock:
+            if self.write_bandwidth is None or self.frame_rate_in <= 0:
+                return None
+            bytes_per_frame = self.rate_in/self.frame_rate_in
+            return IMAGE_SAVER.GOVERNOR_TARGET_UTILIZATION*self.write_bandwidth/bytes_per_frame
@@ -0,0 +1,37 @@
+# compare crop_image() + rotate_and_flip_image() with the FrameTransform plan
+# run from the software folder: python3 -m tools.benchmark_frame_transform
+import time
+import numpy as np
+
+import control.utils as utils
+
+N_ITERATIONS = 50
+CROP_WIDTH = 3000
+CROP_HEIGHT = 3000
+
+def time_it(function,image):
+    function(image) # warm up
+    t0 = time.perf_counter()
+    for i in range(N_ITERATIONS):
+        function(image)
+    return (time.perf_counter()-t0)/N_ITERATIONS*1000
+
+def main():
+    frames = {'mono 3000x3000':np.random.randint(0,255,(3000,3000),dtype=np.uint8),
+              'RGB 3000x3000':np.random.randint(0,255,(3000,3000,3),dtype=np.uint8)}
+    settings = [(0,None),(0,'Vertical'),(90,None),(-90,'Horizontal'),(90,'Both')]
+    print('time per frame in ms, ' + str(N_ITERATIONS) + ' iterations')
+    print('frame, rotation, flip, current, plan (view), plan (contiguous)')
+    for name,image in frames.items():
+        for rotate_image_angle,flip_image in settings:
+            frame_transform = utils.FrameTransform(CROP_WIDTH,CROP_HEIGHT,rotate_image_angle,flip_image)
+            def current(image):
+                image = np.squeeze(utils.crop_image(image,CROP_WIDTH,CROP_HEIGHT))
+                return utils.rotate_and_flip_image(image,rotate_image_angle=rotate_image_angle,flip_image=flip_image)
+            t_current = time_it(current,image)
+            t_view = time_it(frame_transform.apply,image)
+            t_contiguous = time_it(frame_transform.apply_contiguous,image)
+            print(name + ', ' + str(rotate_image_angle) + ', ' + str(flip_image) + ', ' + '{:.3f}'.format(t_current) + ', ' + '{:.3f}'.format(t_view) + ', ' + '{:.3f}'.format(t_contiguous))
+
+if __name__ == '__main__':
+    main()
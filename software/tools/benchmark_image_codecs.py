@@ -0,0 +1,76 @@
+# compare the throughput and compression ratio of the lossless codecs for saving frames
+# run from the software folder: python3 -m tools.benchmark_image_codecs [image files]
+# without arguments, a synthetic brightfield (8 bit) and fluorescence (12 bit in 16 bit) frame are used
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import cv2
+
+import control.image_codecs as image_codecs
+
+N_ITERATIONS = 10
+
+def synthetic_brightfield(shape=(3000,3000)):
+    y,x = np.mgrid[0:shape[0],0:shape[1]]
+    image = 128 + 40*np.sin(x/200.0)*np.cos(y/150.0) + np.random.normal(0,4,shape)
+    return np.clip(image,0,255).astype(np.uint8)
+
+def synthetic_fluorescence(shape=(3000,3000)):
+    image = np.full(shape,100.0)
+    for i in range(300):
+        cy,cx = np.random.randint(0,shape[0]),np.random.randint(0,shape[1])
+        y0,y1,x0,x1 = max(cy-15,0),min(cy+15,shape[0]),max(cx-15,0),min(cx+15,shape[1])
+        y,x = np.mgrid[y0:y1,x0:x1]
+        image[y0:y1,x0:x1] += 2000*np.exp(-((y-cy)**2+(x-cx)**2)/50.0)
+    return np.clip(np.random.poisson(image),0,4095).astype(np.uint16)
+
+def time_it(function):
+    function() # warm up
+    t0 = time.perf_counter()
+    for i in range(N_ITERATIONS):
+        result = function()
+    return (time.perf_counter()-t0)/N_ITERATIONS,result
+
+def report(name,image,seconds,nbytes):
+    print(name + ', ' + '{:.1f}'.format(image.nbytes/seconds/1e6) + ', ' + '{:.2f}'.format(image.nbytes/nbytes))
+
+def main():
+    if len(sys.argv) > 1:
+        frames = {os.path.basename(path):cv2.imread(path,cv2.IMREAD_UNCHANGED) for path in sys.argv[1:]}
+    else:
+        frames = {'brightfield uint8':synthetic_brightfield(),'fluorescence uint16 (12 bit)':synthetic_fluorescence()}
+    directory = tempfile.mkdtemp()
+    print(str(N_ITERATIONS) + ' iterations')
+    for frame_name,image in frames.items():
+        print(frame_name + ' ' + str(image.shape))
+        print('codec, MB/s, compression ratio')
+        # one file per image
+        for extension,params in [('.bmp',[]),('.tiff',None),('.png',[cv2.IMWRITE_PNG_COMPRESSION,0]),('.png',None),('.png',[cv2.IMWRITE_PNG_COMPRESSION,3])]:
+            if extension == '.bmp' and image.dtype != np.uint8:
+                continue
+            path = os.path.join(directory,'image' + extension)
+            if params is None:
+                name = extension[1:] + ' (default settings)'
+                seconds,_ = time_it(lambda: image_codecs.imwrite(path,image))
+            else:
+                name = extension[1:] + ' ' + str(params)
+                seconds,_ = time_it(lambda: cv2.imwrite(path,image,params))
+            report(name,image,seconds,os.path.getsize(path))
+            os.remove(path)
+        # chunked recording container payloads
+        for codec in image_codecs.CODECS[1:]:
+            if not image_codecs.is_available(codec):
+                print(codec + ', not installed')
+                continue
+            for byte_shuffle in [False,True]:
+                if byte_shuffle and image.dtype.itemsize == 1:
+                    continue
+                seconds,data = time_it(lambda: image_codecs.encode(image,codec,1,byte_shuffle))
+                report(codec + (' + byte shuffle' if byte_shuffle else ''),image,seconds,len(data))
+                assert np.array_equal(image_codecs.decode(data,codec,image.shape,image.dtype,byte_shuffle),image)
+    os.rmdir(directory)
+
+if __name__ == '__main__':
+    main()
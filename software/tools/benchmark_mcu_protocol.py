@@ -0,0 +1,89 @@
+# compare the per-byte encoding and decoding of mcu messages with the struct / numpy codec in control.protocol
+# run from the software folder: python3 -m tools.benchmark_mcu_protocol
+import time
+import numpy as np
+
+from control._def import *
+import control.protocol as protocol
+
+N_ITERATIONS = 20000
+BACKLOG_SIZES = [1,2,4,8,16,64]
+
+# the previous code of Microcontroller
+def int_to_payload(signed_int,number_of_bytes):
+    if signed_int >= 0:
+        payload = signed_int
+    else:
+        payload = 2**(8*number_of_bytes) + signed_int # find two's completement
+    return payload
+
+def payload_to_int(payload,number_of_bytes):
+    signed = 0
+    for i in range(number_of_bytes):
+        signed = signed + int(payload[i])*(256**(number_of_bytes-1-i))
+    if signed >= 256**number_of_bytes/2:
+        signed = signed - 256**number_of_bytes
+    return signed
+
+def encode_move_per_byte(cmd_id,usteps):
+    payload = int_to_payload(usteps,4)
+    cmd = bytearray(MicrocontrollerDef.CMD_LENGTH)
+    cmd[1] = CMD_SET.MOVE_X
+    cmd[2] = payload >> 24
+    cmd[3] = (payload >> 16) & 0xff
+    cmd[4] = (payload >> 8) & 0xff
+    cmd[5] = payload & 0xff
+    cmd[0] = cmd_id
+    return cmd
+
+def decode_status_per_byte(msg):
+    return [msg[0],msg[1],payload_to_int(msg[2:6],4),payload_to_int(msg[6:10],4),payload_to_int(msg[10:14],4),payload_to_int(msg[14:18],4),msg[18],msg[23]]
+
+def time_per_call_us(function,n=N_ITERATIONS):
+    function() # warm up
+    t0 = time.perf_counter()
+    for i in range(n):
+        function()
+    return (time.perf_counter()-t0)/n*1e6
+
+def main():
+    packets = bytearray(np.random.randint(0,256,MicrocontrollerDef.MSG_LENGTH*max(BACKLOG_SIZES),dtype=np.uint8).tobytes())
+    # the codecs agree
+    batch = protocol.decode_status_packets(packets)
+    for i in range(len(batch)):
+        offset = i*MicrocontrollerDef.MSG_LENGTH
+        assert decode_status_per_byte(packets[offset:offset+MicrocontrollerDef.MSG_LENGTH]) == list(protocol.decode_status(packets,offset))
+        assert [batch['x'][i],batch['y'][i],batch['z'][i],batch['theta'][i]] == list(protocol.decode_status(packets,offset)[2:6])
+    for n in BACKLOG_SIZES:
+        # the struct and the numpy path of decode_status_backlog
+        backlog = protocol.decode_status_backlog(packets[:n*MicrocontrollerDef.MSG_LENGTH])
+        assert [list(column) for column in backlog] == [list(column) for column in zip(*protocol.STATUS.iter_unpack(packets[:n*MicrocontrollerDef.MSG_LENGTH]))]
+    tx_buffer = bytearray(MicrocontrollerDef.CMD_LENGTH)
+    assert encode_move_per_byte(7,-123456) == protocol.encode(protocol.COMMAND_MOVE,tx_buffer,7,CMD_SET.MOVE_X,-123456)
+
+    print('time per message in us, ' + str(N_ITERATIONS) + ' iterations')
+    print('encode move command, per byte: ' + '{:.3f}'.format(time_per_call_us(lambda: encode_move_per_byte(7,-123456))))
+    print('encode move command, struct into reused buffer: ' + '{:.3f}'.format(time_per_call_us(lambda: protocol.encode(protocol.COMMAND_MOVE,tx_buffer,7,CMD_SET.MOVE_X,-123456))))
+    print('decode status, per byte: ' + '{:.3f}'.format(time_per_call_us(lambda: decode_status_per_byte(packets[0:MicrocontrollerDef.MSG_LENGTH]))))
+    print('decode status, struct: ' + '{:.3f}'.format(time_per_call_us(lambda: protocol.decode_status(packets,0))))
+    for n in BACKLOG_SIZES:
+        nbytes = n*MicrocontrollerDef.MSG_LENGTH
+        def per_byte():
+            for i in range(0,nbytes,MicrocontrollerDef.MSG_LENGTH):
+                decode_status_per_byte(packets[i:i+MicrocontrollerDef.MSG_LENGTH])
+        def per_struct():
+            for i in range(0,nbytes,MicrocontrollerDef.MSG_LENGTH):
+                protocol.decode_status(packets,i)
+        def batch():
+            protocol.decode_status_packets(packets,n)
+        def backlog():
+            protocol.decode_status_backlog(packets[:nbytes])
+        n_iterations = max(N_ITERATIONS//n,100)
+        print('backlog of ' + str(n) + ' packets, per byte / struct / numpy batch / decode_status_backlog: ' +
+              '{:.3f}'.format(time_per_call_us(per_byte,n_iterations)/n) + ' / ' +
+              '{:.3f}'.format(time_per_call_us(per_struct,n_iterations)/n) + ' / ' +
+              '{:.3f}'.format(time_per_call_us(batch,n_iterations)/n) + ' / ' +
+              '{:.3f}'.format(time_per_call_us(backlog,n_iterations)/n))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# serial path to the microcontroller: the unmodified Microcontroller class against the pty emulator
+# run from the software folder: python3 -m tools.benchmark_mcu_serial
+import contextlib
+import io
+import time
+import numpy as np
+
+import control.microcontroller as microcontroller
+from control.mcu_emulator import MicrocontrollerEmulator
+
+N_ROUND_TRIPS = 200
+N_BURST = 1000
+T_IDLE_S = 2
+
+def main():
+    emulator = MicrocontrollerEmulator()
+    mcu = microcontroller.Microcontroller(port=emulator.port)
+    log = io.StringIO() # the per-command prints
+    with contextlib.redirect_stdout(log):
+        # round trip: command sent until its completion is reported (an atomic command, completed with the next status packet)
+        round_trips = []
+        for i in range(N_ROUND_TRIPS):
+            t0 = time.perf_counter()
+            future = mcu.zero_theta()
+            mcu.wait_till_operation_is_completed(future)
+            round_trips.append(time.perf_counter()-t0)
+        round_trips = np.array(round_trips)*1000
+
+        # burst: commands sent back to back, then wait for the last one
+        num_commands_received = emulator.num_commands_received
+        t0 = time.perf_counter()
+        for i in range(N_BURST):
+            future = mcu.zero_theta()
+        t_sent = time.perf_counter() - t0
+        mcu.wait_till_operation_is_completed(future)
+        t_completed = time.perf_counter() - t0
+        time.sleep(0.1)
+        num_lost = N_BURST - (emulator.num_commands_received - num_commands_received)
+
+        # idle: status packets only
+        num_entries = mcu.telemetry.num_entries
+        cpu0 = time.process_time()
+        time.sleep(T_IDLE_S)
+        cpu = time.process_time() - cpu0
+        packet_rate = (mcu.telemetry.num_entries - num_entries)/T_IDLE_S
+
+        # a 10 mm move in x
+        t0 = time.perf_counter()
+        future = mcu.move_x_usteps(16000)
+        mcu.wait_till_operation_is_completed(future)
+        t_move = time.perf_counter() - t0
+
+    mcu.close()
+    stats = emulator.get_stats()
+    emulator.close()
+    print('round trip (ms), ' + str(N_ROUND_TRIPS) + ' commands: mean ' + '{:.3f}'.format(np.mean(round_trips)) + ', p50 ' + '{:.3f}'.format(np.percentile(round_trips,50)) + ', p99 ' + '{:.3f}'.format(np.percentile(round_trips,99)) + ', max ' + '{:.3f}'.format(np.max(round_trips)))
+    print('burst of ' + str(N_BURST) + ' commands: sent in ' + '{:.1f}'.format(t_sent*1000) + ' ms (' + '{:.0f}'.format(N_BURST/t_sent) + ' commands/s), completed after ' + '{:.1f}'.format(t_completed*1000) + ' ms, lost ' + str(num_lost))
+    print('status packets: ' + '{:.1f}'.format(packet_rate) + ' /s, cpu while idle (host and emulator) ' + '{:.1f}'.format(cpu/T_IDLE_S*1000) + ' ms/s')
+    print('10 mm move in x: ' + '{:.1f}'.format(t_move*1000) + ' ms')
+    print('emulator: ' + str(stats))
+
+if __name__ == '__main__':
+    main()